@@ -1,17 +1,20 @@
 import math
 from copy import copy
 from enum import Enum
-from typing import Dict, List
+from typing import Dict, List, Optional, Tuple
 
 import loguru
+import numpy as np
 import pandas as pd
-from tqdm import tqdm
+
+import profiling
+from datastructures import IndexTable, ListConnections
 
 _logger = loguru.logger
 
 
 class PukelsheimUpperApportionment:
-    ROUND = round
+    ROUND = np.rint
 
     def _get_columns(self) -> List:
         columns = copy(self.parties)
@@ -34,28 +37,29 @@ class PukelsheimUpperApportionment:
         self.result = None
 
     def _calc_party_votes_district_level(self):
-        for district in self.districts:
-            self.df.loc[district] = self.ROUND(
-                self.df.loc[district]
-                / self.seats_district.loc["seats", district]
-            )
+        # labels are resolved once, the division works on positions
+        seats = self.seats_district.loc["seats", self.districts].to_numpy(
+            dtype=float
+        )
+        votes = self.df.to_numpy(dtype=float)
+        self.df = pd.DataFrame(
+            data=self.ROUND(votes / seats[:, np.newaxis]),
+            index=self._get_index(),
+            columns=self._get_columns(),
+        )
 
     def _calc_party_seats(self):
         # 1) sum up votes for party over all districts
         # 2) calculate single divisor all_votes/total_seats
         # 3) calculate upper apportionment for each party
-        votes_per_party = pd.DataFrame(index=["total"], columns=self.parties)
-        for party in self.parties:
-            votes_per_party.loc["total", party] = self.df.loc[:, party].sum()
-
-        divisor = votes_per_party.loc["total"].sum() / self.total_seats
+        votes_per_party = self.df.to_numpy(dtype=float).sum(axis=0)
+        divisor = votes_per_party.sum() / self.total_seats
 
-        seats_per_party = pd.DataFrame(index=["seats"], columns=self.parties)
-        for party in self.parties:
-            seats_per_party.loc["seats", party] = self.ROUND(
-                votes_per_party.loc["total", party] / divisor
-            )
-        self.result = seats_per_party
+        self.result = pd.DataFrame(
+            data=[self.ROUND(votes_per_party / divisor).astype(int)],
+            index=["seats"],
+            columns=self._get_columns(),
+        )
 
     def run(self) -> pd.DataFrame:
         self._calc_party_votes_district_level()
@@ -66,9 +70,16 @@ class PukelsheimUpperApportionment:
 
 
 class PukelsheimLowerApportionment:
+    """
+    Votes, divisors and seats are kept in arrays which are addressed by the
+    integer position of a district (row) and a party (column). The district
+    and party labels are only resolved at the public interface and attached
+    again when the results are exported as data frames.
+    """
+
     DISTRICT_DIV = "district_div"
     PARTY_DIV = "party_div"
-    ROUNDING = round
+    ROUNDING = np.rint
 
     def _get_columns(self, without_district=False) -> List:
         columns = copy(self.parties)
@@ -82,44 +93,52 @@ class PukelsheimLowerApportionment:
             index.append(self.PARTY_DIV)
         return index
 
-    def _get_voters_in_district(self, district: str) -> int:
-        if not self.df.empty:
-            return self.df.loc[district, self.parties].sum()
-        else:
-            _logger.error("Dataframe not setup yet. Aborting")
-            raise ValueError
-
-    def _setup_seat_allocation(self) -> pd.DataFrame:
-        seat_allocation = {}
-
-        for party in self.parties:
-            district_seat_map = {}
-            for district in self.districts:
-                district_seat_map.update({district: 0})
-            seat_allocation.update({party: district_seat_map})
+    @property
+    def df(self) -> pd.DataFrame:
+        """
+        :return: votes with the district divisors as last column and the party
+        divisors as last row
+        """
+        data = np.full((len(self.districts) + 1, len(self.parties) + 1), np.nan)
+        data[:-1, :-1] = self.votes
+        data[:-1, -1] = self.district_divs
+        data[-1, :-1] = self.party_divs
+        return pd.DataFrame(
+            data=data, index=self._get_index(), columns=self._get_columns()
+        )
 
+    @property
+    def seats_allocation(self) -> pd.DataFrame:
         return pd.DataFrame(
-            data=seat_allocation,
+            data=self.seats,
             index=self._get_index(without_party=True),
             columns=self._get_columns(without_district=True),
         )
 
+    def _get_voters_in_district(self, district: str) -> int:
+        if self.votes.size:
+            return self.votes[self.district_pos[district]].sum()
+        else:
+            _logger.error("Votes not setup yet. Aborting")
+            raise ValueError
+
     def _sum_of_district_seats(self, district) -> int:
-        return self.seats_allocation.loc[district].sum()
+        return self.seats[self.district_pos[district]].sum()
 
     def _sum_of_party_seats(self, party) -> int:
-        return self.seats_allocation.loc[self.districts, party].sum()
+        return self.seats[:, self.party_pos[party]].sum()
 
     def _district_div_binary_search(self, district, left, right):
-        old_divisor = self.df.loc[district, self.DISTRICT_DIV]
+        i = self.district_pos[district]
+        old_divisor = self.district_divs[i]
+        required_district_seats = self.district_seats_array[i]
         m = 0
         while left <= right:
             m = math.floor((left + right) / 2)
-            self.df.loc[district, self.DISTRICT_DIV] = m
+            self.district_divs[i] = m
             self._calc_single_district_seats(district)
 
-            sum_of_seats = self._sum_of_district_seats(district)
-            required_district_seats = self.district_seats.get(district)
+            sum_of_seats = self.seats[i].sum()
 
             if sum_of_seats == required_district_seats:
                 return m, True
@@ -132,22 +151,23 @@ class PukelsheimLowerApportionment:
                 # bound
                 left = m + 1
 
-        self.df.loc[district, self.DISTRICT_DIV] = old_divisor
+        self.district_divs[i] = old_divisor
         self._calc_single_district_seats(district)
         return m, False
         raise ValueError
 
     def _party_div_simple_search(self, party, left, right, stepsize):
-        old_divisor = self.df.loc[self.PARTY_DIV, party]
+        j = self.party_pos[party]
+        old_divisor = self.party_divs[j]
+        required_party_seats = self.parties_seats_array[j]
         m = 0
         while left <= right:
             m = left
             _logger.trace(m)
-            self.df.loc[self.PARTY_DIV, party] = m
+            self.party_divs[j] = m
             self._calc_single_party_seats(party)
 
-            sum_of_seats = self._sum_of_party_seats(party)
-            required_party_seats = self.parties_seats.get(party)
+            sum_of_seats = self.seats[:, j].sum()
 
             if sum_of_seats == required_party_seats:
                 return m, True
@@ -158,22 +178,23 @@ class PukelsheimLowerApportionment:
                 # we have too many seats -> increase divisor
                 left = m + stepsize
 
-        self.df.loc[self.PARTY_DIV, party] = old_divisor
+        self.party_divs[j] = old_divisor
         self._calc_single_party_seats(party)
         return m, False
         raise ValueError
 
     def _party_div_binary_search(self, party, left, right):
-        old_divisor = self.df.loc[self.PARTY_DIV, party]
+        j = self.party_pos[party]
+        old_divisor = self.party_divs[j]
+        required_party_seats = self.parties_seats_array[j]
         m = 0
         while left <= right:
             previous_m = m
             m = (right - left) / 2
-            self.df.loc[self.PARTY_DIV, party] = m
+            self.party_divs[j] = m
             self._calc_single_party_seats(party)
 
-            sum_of_seats = self._sum_of_party_seats(party)
-            required_party_seats = self.parties_seats.get(party)
+            sum_of_seats = self.seats[:, j].sum()
 
             if sum_of_seats == required_party_seats:
                 return m, True
@@ -192,7 +213,7 @@ class PukelsheimLowerApportionment:
                 else:
                     left = m
 
-        self.df.loc[self.PARTY_DIV, party] = old_divisor
+        self.party_divs[j] = old_divisor
         self._calc_single_party_seats(party)
         return m, False
         raise ValueError
@@ -232,20 +253,28 @@ class PukelsheimLowerApportionment:
         self.district_seats = districts_seats
         self.parties_seats = parties_seats
 
-        self.seats_allocation = self._setup_seat_allocation()
-
-        self.df = pd.DataFrame(
-            data=party_votes,
-            index=self._get_index(),
-            columns=self._get_columns(),
+        # dense lookup tables, labels are resolved exactly once
+        self.district_pos = {d: i for i, d in enumerate(self.districts)}
+        self.party_pos = {p: j for j, p in enumerate(self.parties)}
+        self.district_seats_array = np.array(
+            [districts_seats.get(d) for d in self.districts]
+        )
+        self.parties_seats_array = np.array(
+            [parties_seats.get(p) for p in self.parties]
         )
-        party_divs = self.df.loc[
-            self.PARTY_DIV, self.parties
-        ]  # type: pd.Series
-        for index, _value in party_divs.iteritems():
-            party_divs.loc[index] = 1
 
-        self.df.loc[self.PARTY_DIV, self.parties] = party_divs
+        self.votes = (
+            pd.DataFrame(
+                data=party_votes,
+                index=self._get_index(without_party=True),
+                columns=self._get_columns(without_district=True),
+            )
+            .fillna(0)
+            .to_numpy(dtype=float)
+        )
+        self.seats = np.zeros(self.votes.shape, dtype=int)
+        self.district_divs = np.full(len(self.districts), np.nan)
+        self.party_divs = np.ones(len(self.parties))
 
     def init_district_div(self):
         """
@@ -255,14 +284,9 @@ class PukelsheimLowerApportionment:
 
         District divisor = Votes in district / Seats in district
         """
-        for district in self.districts:
-            self.df.loc[
-                district, self.DISTRICT_DIV
-            ] = self._get_voters_in_district(
-                district
-            ) / self.district_seats.get(
-                district
-            )
+        self.district_divs = (
+            self.votes.sum(axis=1) / self.district_seats_array
+        )
 
     def calc_all_district_seats(self):
         """
@@ -277,11 +301,8 @@ class PukelsheimLowerApportionment:
         Calculates the seat allocation for district and all parties based on
         the district divisors.
         """
-        for party in self.parties:
-            self.seats_allocation.loc[district, party] = self.ROUNDING(
-                self.df.loc[district, party]
-                / self.df.loc[district, self.DISTRICT_DIV]
-            )
+        i = self.district_pos[district]
+        self.seats[i] = self.ROUNDING(self.votes[i] / self.district_divs[i])
 
     def calc_all_party_seats(self):
         """
@@ -296,16 +317,13 @@ class PukelsheimLowerApportionment:
         Calculates the seat allocation for a party in all districts based on
         the current district and party divisor.
         """
-        for district in self.districts:
-            # round(votes/(district_div*party_div))
-            self.seats_allocation.loc[district, party] = self.ROUNDING(
-                self.df.loc[district, party]
-                / (
-                    self.df.loc[district, self.DISTRICT_DIV]
-                    * self.df.loc[self.PARTY_DIV, party]
-                )
-            )
+        j = self.party_pos[party]
+        # round(votes/(district_div*party_div))
+        self.seats[:, j] = self.ROUNDING(
+            self.votes[:, j] / (self.district_divs * self.party_divs[j])
+        )
 
+    @profiling.profiled()
     def allocate_district_seats(self):
         """
         Compares the number of currently allocated seats in a district to the
@@ -320,17 +338,17 @@ class PukelsheimLowerApportionment:
         all_district_divisors_found = False
         while not all_district_divisors_found:
             all_district_divisors_found = True
-            for district in self.districts:
-                sum_of_seats = self._sum_of_district_seats(district)
-                required_district_seats = self.district_seats.get(district)
-                current_divisor = self.df.loc[district, self.DISTRICT_DIV]
+            for i, district in enumerate(self.districts):
+                sum_of_seats = self.seats[i].sum()
+                required_district_seats = self.district_seats_array[i]
+                current_divisor = self.district_divs[i]
                 if sum_of_seats == required_district_seats:
                     # allocated seats satisfy number of seats for this district
                     continue
                 elif sum_of_seats < required_district_seats:
                     # we currently allocated too little seats -> decrease divisor
                     all_district_divisors_found = False
-                    if self.df.loc[district, self.DISTRICT_DIV] > 0:
+                    if self.district_divs[i] > 0:
                         found_divisor = False
                         counter = 2
                         while not found_divisor:
@@ -340,9 +358,10 @@ class PukelsheimLowerApportionment:
                                 right=current_divisor,
                             )
                             counter += 1
-                        _logger.debug(
-                            f"Decreased district divisor for {district} to "
-                            f"{self.df.loc[district, self.DISTRICT_DIV]}"
+                        profiling.debug(
+                            "Decreased district divisor for {} to {}",
+                            district,
+                            self.district_divs[i],
                         )
                     else:
                         _logger.error(f"District divisor for {district} 0!")
@@ -359,9 +378,10 @@ class PukelsheimLowerApportionment:
                         )
                         counter += 1
 
-                    _logger.debug(
-                        f"Increased district divisor for {district} to "
-                        f"{self.df.loc[district, self.DISTRICT_DIV]}"
+                    profiling.debug(
+                        "Increased district divisor for {} to {}",
+                        district,
+                        self.district_divs[i],
                     )
 
             if not all_district_divisors_found:
@@ -369,16 +389,17 @@ class PukelsheimLowerApportionment:
 
         print()
 
+    @profiling.profiled()
     def allocate_party_seats(self):
         all_party_divisors_found = False
         stepsize = 5 * (10 ** -4)
         self.calc_all_party_seats()
         while not all_party_divisors_found:
             all_party_divisors_found = True
-            for party in self.parties:
-                sum_of_seats = self._sum_of_party_seats(party)
-                required_party_seats = self.parties_seats.get(party)
-                current_divisor = self.df.loc[self.PARTY_DIV, party]
+            for j, party in enumerate(self.parties):
+                sum_of_seats = self.seats[:, j].sum()
+                required_party_seats = self.parties_seats_array[j]
+                current_divisor = self.party_divs[j]
 
                 if sum_of_seats == required_party_seats:
                     continue
@@ -387,11 +408,16 @@ class PukelsheimLowerApportionment:
                     counter = 2
                     m = 0
                     while not found_divisor:
-                        _logger.debug(
-                            f"Searching divisor for {party}. Required S: "
-                            f"{required_party_seats} Current S: {sum_of_seats} "
-                            f"Tries: {counter} Last: {m} "
-                            f"Current Div: {current_divisor}"
+                        profiling.debug(
+                            "Searching divisor for {}. Required S: {} "
+                            "Current S: {} Tries: {} Last: {} "
+                            "Current Div: {}",
+                            party,
+                            required_party_seats,
+                            sum_of_seats,
+                            counter,
+                            m,
+                            current_divisor,
                         )
                         m, found_divisor = self._party_div_simple_search(
                             party,
@@ -399,7 +425,7 @@ class PukelsheimLowerApportionment:
                             right=current_divisor,
                             stepsize=stepsize,
                         )
-                        current_divisor = self.df.loc[self.PARTY_DIV, party]
+                        current_divisor = self.party_divs[j]
 
                         counter += 1
                 elif sum_of_seats > required_party_seats:
@@ -409,11 +435,16 @@ class PukelsheimLowerApportionment:
                     counter = 2
                     m = 0
                     while not found_divisor:
-                        _logger.debug(
-                            f"Searching divisor for {party}. Required S: "
-                            f"{required_party_seats} Current S: {sum_of_seats} "
-                            f"Tries: {counter} Last: {m} "
-                            f"Current Div: {current_divisor}"
+                        profiling.debug(
+                            "Searching divisor for {}. Required S: {} "
+                            "Current S: {} Tries: {} Last: {} "
+                            "Current Div: {}",
+                            party,
+                            required_party_seats,
+                            sum_of_seats,
+                            counter,
+                            m,
+                            current_divisor,
                         )
                         m, found_divisor = self._party_div_simple_search(
                             party,
@@ -421,7 +452,7 @@ class PukelsheimLowerApportionment:
                             right=current_divisor * counter,
                             stepsize=stepsize,
                         )
-                        current_divisor = self.df.loc[self.PARTY_DIV, party]
+                        current_divisor = self.party_divs[j]
 
                         counter += 1
 
@@ -437,10 +468,11 @@ class PukelsheimLowerApportionment:
         for party in self.parties:
             if self._sum_of_party_seats(party) != self.parties_seats.get(party):
                 apportionment_correct = False
-                _logger.debug(f"Check failed for {party} seats!")
-                _logger.debug(
-                    f"Required: {self.parties_seats.get(party)} "
-                    f"Current: {self._sum_of_party_seats(party)}"
+                profiling.debug(
+                    "Check failed for {} seats! Required: {} Current: {}",
+                    party,
+                    self.parties_seats.get(party),
+                    self._sum_of_party_seats(party),
                 )
                 break
 
@@ -449,10 +481,11 @@ class PukelsheimLowerApportionment:
                 district
             ):
                 apportionment_correct = False
-                _logger.debug(f"Check failed for {district} seats!")
-                _logger.debug(
-                    f"Required: {self.district_seats.get(district)} "
-                    f"Current: {self._sum_of_district_seats(district)}"
+                profiling.debug(
+                    "Check failed for {} seats! Required: {} Current: {}",
+                    district,
+                    self.district_seats.get(district),
+                    self._sum_of_district_seats(district),
                 )
                 break
         return apportionment_correct
@@ -470,7 +503,7 @@ class PukelsheimLowerApportionment:
         while not self.check_allocated_seats():
             self.allocate_district_seats()
             self.allocate_party_seats()
-            _logger.debug(f"Starting next iteration {i}")
+            profiling.debug("Starting next iteration {}", i)
             # with open(f"data2/seats{i}.csv", "w") as f:
             #     self.seats_allocation.to_csv(f)
             # with open(f"data2/df{i}.csv", "w") as f:
@@ -482,6 +515,437 @@ class PukelsheimLowerApportionment:
         print(self.df)
 
 
+class DivisorMethod:
+    """
+    Divisor method with the signposts d(k) = k + offset, i.e. a seat is
+    gained whenever votes / divisor passes the next signpost. The offset 0.5
+    is standard rounding (Sainte-Laguë, DivStd in BAZI) and 1.0 rounding
+    down (D'Hondt, DivAbr in BAZI).
+
+    All apportionments work row wise on arrays, such that many independent
+    problems (e.g. all districts) are solved at once.
+    """
+
+    STANDARD = 0.5
+    DOWNWARD = 1.0
+
+    def __init__(self, offset: float = STANDARD):
+        self.offset = offset
+
+    def round(self, quotients: np.ndarray) -> np.ndarray:
+        return np.maximum(np.floor(quotients + 1 - self.offset), 0).astype(int)
+
+    @profiling.profiled()
+    def apportion(
+        self, weights: np.ndarray, seats: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        :param weights: votes of shape (problems, parties)
+        :param seats: number of seats per problem
+        :return: seats of shape (problems, parties) and a divisor per problem
+        which reproduces these seats by rounding weights / divisor
+        """
+        weights = np.asarray(weights, dtype=float)
+        seats = np.asarray(seats, dtype=int)
+        rows = np.arange(len(weights))
+
+        totals = weights.sum(axis=1)
+        # shifting the seats by half a seat per party and signpost offset
+        # above 0.5 approximates the final divisor, e.g. the quota of
+        # Hagenbach-Bischoff for rounding down
+        shifted = seats + weights.shape[1] * (self.offset - 0.5)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            initial = np.where(seats > 0, totals / shifted, np.inf)
+            allocation = self.round(weights / initial[:, np.newaxis])
+
+            # move single seats along the signposts until the sums match
+            missing = seats - allocation.sum(axis=1)
+            while missing.any():
+                gains = weights / (allocation + self.offset)
+                losses = np.where(
+                    allocation > 0,
+                    weights / (allocation - 1 + self.offset),
+                    np.inf,
+                )
+                too_few = missing > 0
+                too_many = missing < 0
+                allocation[rows[too_few], gains[too_few].argmax(axis=1)] += 1
+                allocation[
+                    rows[too_many], losses[too_many].argmin(axis=1)
+                ] -= 1
+                missing = seats - allocation.sum(axis=1)
+
+            # any divisor between the next gain and the last loss is valid
+            gain = (weights / (allocation + self.offset)).max(axis=1)
+            loss = np.where(
+                allocation > 0,
+                weights / (allocation - 1 + self.offset),
+                np.inf,
+            ).min(axis=1)
+            divisors = np.where(
+                np.isinf(loss),
+                np.where(gain > 0, 2 * gain, 1.0),
+                (gain + loss) / 2,
+            )
+        return allocation, divisors
+
+
+class SeparateApportionment:
+    """
+    Allocates the seats of every district on its own with a divisor method,
+    like the separate district option of BAZI.
+    """
+
+    def __init__(
+        self,
+        votes: pd.DataFrame,
+        district_seats: Dict[str, int],
+        method: DivisorMethod = None,
+    ):
+        """
+        :param votes: districts as rows and parties as columns
+        :param district_seats: mapping between district and its seats
+        """
+        self.districts = votes.index.to_list()
+        self.parties = votes.columns.to_list()
+        self.votes = votes.fillna(0).to_numpy(dtype=float)
+        self.district_seats_array = np.array(
+            [district_seats[d] for d in self.districts], dtype=int
+        )
+        self.method = method if method is not None else DivisorMethod()
+
+        # districts x parties
+        self.seats = np.zeros(self.votes.shape, dtype=int)
+        self.district_divs = np.ones(len(self.districts))
+        self.party_divs = np.ones(len(self.parties))
+
+    def allocate(self) -> None:
+        self.seats, self.district_divs = self.method.apportion(
+            self.votes, self.district_seats_array
+        )
+
+    @property
+    def seats_allocation(self) -> pd.DataFrame:
+        """
+        :return: parties as rows and districts as columns, the layout of
+        data/nzz-results.csv
+        """
+        return pd.DataFrame(
+            data=self.seats.T, index=self.parties, columns=self.districts
+        )
+
+    @property
+    def district_divisors(self) -> pd.Series:
+        return pd.Series(data=self.district_divs, index=self.districts)
+
+    @property
+    def party_divisors(self) -> pd.Series:
+        return pd.Series(data=self.party_divs, index=self.parties)
+
+    def run(self) -> pd.DataFrame:
+        self.allocate()
+        return self.seats_allocation
+
+    def to_csv(self, file_path) -> None:
+        self.seats_allocation.to_csv(file_path)
+
+
+class BiproportionalApportionment(SeparateApportionment):
+    """
+    Doubly proportional apportionment.
+
+    Upper apportionment: the seats per party follow from the votes summed
+    over all districts.
+
+    Lower apportionment: district and party divisors are fitted by
+    alternating scaling, i.e. the district divisors are fitted to the
+    district seats with the party divisors fixed and vice versa, until both
+    constraints hold.
+    """
+
+    MAX_ITERATIONS = 1000
+
+    def __init__(
+        self,
+        votes: pd.DataFrame,
+        district_seats: Dict[str, int],
+        method: DivisorMethod = None,
+    ):
+        super().__init__(votes, district_seats, method)
+        self.parties_seats_array = None  # type: Optional[np.ndarray]
+        self.iterations = 0
+
+    def _upper_votes(self) -> np.ndarray:
+        return self.votes
+
+    @profiling.profiled()
+    def upper_apportionment(self) -> np.ndarray:
+        seats, _divisor = self.method.apportion(
+            self._upper_votes().sum(axis=0)[np.newaxis, :],
+            [self.district_seats_array.sum()],
+        )
+        self.parties_seats_array = seats[0]
+        return self.parties_seats_array
+
+    @property
+    def parties_seats(self) -> pd.Series:
+        return pd.Series(data=self.parties_seats_array, index=self.parties)
+
+    @profiling.profiled()
+    def lower_apportionment(self) -> None:
+        self.party_divs = np.ones(len(self.parties))
+        for self.iterations in range(1, self.MAX_ITERATIONS + 1):
+            self.seats, self.district_divs = self.method.apportion(
+                self.votes / self.party_divs[np.newaxis, :],
+                self.district_seats_array,
+            )
+            if (self.seats.sum(axis=0) == self.parties_seats_array).all():
+                return
+
+            seats, self.party_divs = self.method.apportion(
+                (self.votes / self.district_divs[:, np.newaxis]).T,
+                self.parties_seats_array,
+            )
+            self.seats = seats.T
+            if (self.seats.sum(axis=1) == self.district_seats_array).all():
+                return
+
+        _logger.error(
+            f"Alternating scaling did not converge within "
+            f"{self.MAX_ITERATIONS} iterations."
+        )
+        raise ValueError
+
+    def allocate(self) -> None:
+        if self.parties_seats_array is None:
+            self.upper_apportionment()
+        self.lower_apportionment()
+
+
+class NewZurichApportionment(BiproportionalApportionment):
+    """
+    Neue Zürcher Zuteilung. In the upper apportionment the votes of a party
+    in a district are first divided by the seats of the district and rounded
+    to voter numbers, such that every voter weighs the same regardless of
+    the size of the district.
+    """
+
+    def _upper_votes(self) -> np.ndarray:
+        return np.rint(self.votes / self.district_seats_array[:, np.newaxis])
+
+
+class HagenbachBischoffApportionment(SeparateApportionment):
+    """
+    The seats of every canton are allocated on their own by
+    Hagenbach-Bischoff, which yields the same seats as D'Hondt. The list
+    connections of the current system are left out, see
+    ListConnectionApportionment for the published result.
+    """
+
+    def __init__(self, votes: pd.DataFrame, district_seats: Dict[str, int]):
+        super().__init__(
+            votes, district_seats, DivisorMethod(DivisorMethod.DOWNWARD)
+        )
+
+    @staticmethod
+    @profiling.profiled("HagenbachBischoffApportionment.apportion_batch")
+    def apportion_batch(votes: np.ndarray, seats: np.ndarray) -> np.ndarray:
+        """
+        Allocates many scenarios in a single pass over all their cantons.
+        :param votes: array of shape (scenarios, cantons, parties), e.g.
+        MultiElectionData.votes_array
+        :param seats: seats per canton of shape (cantons,) or per scenario
+        and canton of shape (scenarios, cantons)
+        :return: seats of shape (scenarios, cantons, parties)
+        """
+        votes = np.asarray(votes, dtype=float)
+        seats = np.broadcast_to(seats, votes.shape[:-1])
+        allocation, _divisors = DivisorMethod(DivisorMethod.DOWNWARD).apportion(
+            votes.reshape(-1, votes.shape[-1]), seats.reshape(-1)
+        )
+        return allocation.reshape(votes.shape)
+
+
+class ListConnectionApportionment(SeparateApportionment):
+    """
+    The current system for the national council: Hagenbach-Bischoff within
+    every canton respecting list connections. The seats of a canton are
+    first allocated to the connections, where every unconnected party forms a
+    connection of its own, then within every connection to its
+    sub-connections and finally to the lists.
+
+    Votes are only known per party, they are split evenly among the connected
+    lists of a party in a canton. An unconnected party counts as one list.
+    The lists are the columns of the arrays of shape (cantons, lists), where
+    list_parties holds the party of every column and the connections are
+    encoded as the column of the first list of the (sub-)connection. Each
+    level is a single divisor apportionment over all cantons and connections
+    at once.
+    """
+
+    def __init__(
+        self,
+        votes: pd.DataFrame,
+        district_seats: Dict[str, int],
+        connections: ListConnections,
+        canton_table: IndexTable,
+        party_table: IndexTable,
+    ):
+        """
+        :param canton_table: resolves the canton labels of votes to ids
+        :param party_table: resolves the party labels of votes to ids
+        """
+        super().__init__(
+            votes, district_seats, DivisorMethod(DivisorMethod.DOWNWARD)
+        )
+        (
+            self.list_parties,
+            self.list_shares,
+            self.groups,
+            self.sub_groups,
+        ) = self._list_positions(
+            connections,
+            dict(zip(canton_table.labels, canton_table.ids)),
+            dict(zip(party_table.labels, party_table.ids)),
+        )
+
+    def _list_positions(
+        self,
+        connections: ListConnections,
+        canton_ids: Dict[str, int],
+        party_ids: Dict[str, int],
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        :return: party of every list column, the share of the party votes of
+        every list, the positions of the connections and of the
+        sub-connections
+        """
+        party_connections = [
+            [
+                connections.party_connections(
+                    canton_ids.get(district), party_ids.get(party)
+                )
+                for party in self.parties
+            ]
+            for district in self.districts
+        ]
+        # every party gets as many columns as it has lists in any canton
+        n_lists = np.array(
+            [
+                max(1, max(len(row[j]) for row in party_connections))
+                for j in range(len(self.parties))
+            ]
+        )
+        first_list = np.concatenate(([0], np.cumsum(n_lists)[:-1]))
+
+        shape = (len(self.districts), n_lists.sum())
+        shares = np.zeros(shape)
+        groups = np.broadcast_to(np.arange(shape[1]), shape).copy()
+        sub_groups = groups.copy()
+        for i, row in enumerate(party_connections):
+            first = {}  # type: Dict[Tuple, int]
+            for j, entries in enumerate(row):
+                if not entries:
+                    shares[i, first_list[j]] = 1.0
+                    continue
+                for k, entry in enumerate(entries):
+                    column = first_list[j] + k
+                    shares[i, column] = 1.0 / len(entries)
+                    connection, sub_connection = entry
+                    groups[i, column] = first.setdefault((connection,), column)
+                    if sub_connection is not None:
+                        sub_groups[i, column] = first.setdefault(entry, column)
+        list_parties = np.repeat(np.arange(len(self.parties)), n_lists)
+        return list_parties, shares, groups, sub_groups
+
+    def _allocate_level(
+        self,
+        votes: np.ndarray,
+        parents: np.ndarray,
+        children: np.ndarray,
+        parent_seats: np.ndarray,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Distributes the seats of every parent among its children.
+        :param votes: votes of shape (rows, lists)
+        :param parents: position of the parent of every list
+        :param children: position of the child of every list
+        :param parent_seats: seats of the parents at their positions
+        :return: seats of the children at their positions and the divisors
+        """
+        n_rows, n_lists = votes.shape
+        rows = np.arange(n_rows)[:, np.newaxis] * n_lists + parents
+        weights = np.zeros((n_rows * n_lists, n_lists))
+        np.add.at(weights, (rows.ravel(), children.ravel()), votes.ravel())
+        allocation, divisors = self.method.apportion(
+            weights, parent_seats.ravel()
+        )
+        return (
+            allocation.reshape(n_rows, n_lists, n_lists).sum(axis=1),
+            divisors.reshape(n_rows, n_lists),
+        )
+
+    def _allocate_nested(
+        self,
+        votes: np.ndarray,
+        seats: np.ndarray,
+        shares: np.ndarray,
+        groups: np.ndarray,
+        sub_groups: np.ndarray,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        :param votes: votes of shape (rows, parties)
+        :return: seats of shape (rows, parties) and the divisor of every row
+        """
+        list_votes = votes[:, self.list_parties] * shares
+        top = np.zeros(list_votes.shape, dtype=int)
+        top_seats = np.zeros(list_votes.shape, dtype=int)
+        top_seats[:, 0] = seats
+        group_seats, divisors = self._allocate_level(
+            list_votes, top, groups, top_seats
+        )
+        sub_group_seats, _divisors = self._allocate_level(
+            list_votes, groups, sub_groups, group_seats
+        )
+        lists = np.broadcast_to(
+            np.arange(list_votes.shape[1]), list_votes.shape
+        )
+        list_seats, _divisors = self._allocate_level(
+            list_votes, sub_groups, lists, sub_group_seats
+        )
+        party_seats = np.zeros(votes.shape, dtype=int)
+        np.add.at(party_seats.T, self.list_parties, list_seats.T)
+        return party_seats, divisors[:, 0]
+
+    def allocate(self) -> None:
+        self.seats, self.district_divs = self._allocate_nested(
+            self.votes,
+            self.district_seats_array,
+            self.list_shares,
+            self.groups,
+            self.sub_groups,
+        )
+
+    @profiling.profiled()
+    def apportion_batch(self, votes: np.ndarray) -> np.ndarray:
+        """
+        Allocates many vote scenarios with the connections and canton seats
+        of this instance.
+        :param votes: array of shape (scenarios, cantons, parties)
+        :return: seats of shape (scenarios, cantons, parties)
+        """
+        votes = np.asarray(votes, dtype=float)
+        n_scenarios = votes.shape[0]
+        seats, _divisors = self._allocate_nested(
+            votes.reshape(-1, votes.shape[-1]),
+            np.tile(self.district_seats_array, n_scenarios),
+            np.tile(self.list_shares, (n_scenarios, 1)),
+            np.tile(self.groups, (n_scenarios, 1)),
+            np.tile(self.sub_groups, (n_scenarios, 1)),
+        )
+        return seats.reshape(votes.shape)
+
+
 class Dhondt:
     MAX_SEATS = 200
 
@@ -532,6 +996,8 @@ class Dhondt:
         votes
         :return:
         """
+        from tqdm import tqdm
+
         preallocate_seats = df["seats"].sum()
         for _ in tqdm(range(self.MAX_SEATS - preallocate_seats)):
             for index, row in df.iterrows():
@@ -0,0 +1,238 @@
+"""
+Pure Python stand-in for the BAZI calculation driver, used where no JVM is
+available (e.g. in tests).
+
+    python bazi_standin.py -f <input file>   # like Calculation -f <file>
+    python bazi_standin.py --worker          # BaziWorker protocol
+    python bazi_standin.py --native ...      # with the engines of allocator
+
+The stand-in understands the input written by BiProportional.to_bazi_format
+and answers with a vertical seats table per problem. Only the separate
+allocation per district is supported, which the stand-in calculates on its
+own. With --native, the separate, biprop and NZZ district options are
+calculated with the native engines of allocator instead. Comparing the
+native stand-in with those engines only checks the stand-in itself.
+"""
+import sys
+from typing import Dict, List
+
+import numpy as np
+
+DONE = "=BAZI-WORKER-DONE="
+ERROR = "=BAZI-WORKER-ERROR="
+NATIVE = "--native"
+
+# divisor method -> offset of the signpost sequence d(k) = k + offset
+SIGNPOSTS = {
+    "DivStd": 0.5,
+    "DivAbr": 1.0,
+}
+
+# district option -> native engine of allocator
+ENGINES = {
+    "separate": "SeparateApportionment",
+    "biprop": "BiproportionalApportionment",
+    "NZZ": "NewZurichApportionment",
+}
+
+
+class Problem:
+    def __init__(self):
+        self.title = ""
+        self.method = ""
+        self.district_option = ""
+        self.districts = []  # type: List[str]
+        self.seats = {}  # type: Dict[str, int]
+        self.votes = {}  # type: Dict[str, Dict[str, int]]
+
+
+def parse_input(input_string: str) -> List[Problem]:
+    problems = []
+    problem = None
+    district = None
+    for line in input_string.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith("=TITEL="):
+            problem = Problem()
+            problem.title = line[len("=TITEL=") :].strip()
+            problems.append(problem)
+        elif line.startswith("=METHOD="):
+            problem.method = line[len("=METHOD=") :].strip()
+        elif line.startswith("=DISTRICTOPTION="):
+            problem.district_option = line[len("=DISTRICTOPTION=") :].strip()
+        elif line.startswith("=DISTRIKT="):
+            district = line[len("=DISTRIKT=") :].strip()
+            problem.districts.append(district)
+            problem.votes[district] = {}
+        elif line.startswith("=MANDATE="):
+            problem.seats[district] = int(line[len("=MANDATE=") :])
+        elif line.startswith("="):
+            continue
+        else:
+            party, votes = line.rsplit(" ", 1)
+            problem.votes[district][party] = int(float(votes))
+    return problems
+
+
+def separate_apportionment(votes: np.ndarray, seats: int, offset: float):
+    """
+    Highest averages method within a single district.
+    :return: seats per party and the district divisor
+    """
+    if seats == 0:
+        return np.zeros(len(votes), dtype=int), 0.0
+    signposts = np.arange(seats) + offset
+    quotients = votes[:, np.newaxis] / signposts[np.newaxis, :]
+    flat = quotients.ravel()
+    winners = np.argsort(-flat, kind="stable")[:seats]
+    party_seats = np.bincount(
+        winners // seats, minlength=len(votes)
+    ).astype(int)
+    return party_seats, float(flat[winners[-1]])
+
+
+def calculate_problem(problem: Problem, native: bool = False) -> str:
+    supported = ENGINES if native else ["separate"]
+    if problem.district_option not in supported:
+        raise ValueError(
+            f"District option {problem.district_option} not supported"
+        )
+    if problem.method not in SIGNPOSTS:
+        raise ValueError(f"Method {problem.method} not supported")
+    offset = SIGNPOSTS[problem.method]
+    parties = []  # type: List[str]
+    for district in problem.districts:
+        for party in problem.votes[district]:
+            if party not in parties:
+                parties.append(party)
+
+    votes = np.zeros((len(parties), len(problem.districts)))
+    for i, party in enumerate(parties):
+        for j, district in enumerate(problem.districts):
+            votes[i, j] = problem.votes[district].get(party, 0)
+    if native:
+        seats, divisors, party_divisors = calculate_native(
+            problem, parties, votes, offset
+        )
+    else:
+        seats = np.zeros(votes.shape, dtype=int)
+        divisors = []
+        for j, district in enumerate(problem.districts):
+            seats[:, j], divisor = separate_apportionment(
+                votes[:, j], problem.seats[district], offset
+            )
+            divisors.append(divisor)
+        party_divisors = [1.0] * len(parties)
+
+    return render_vertical(
+        problem.title,
+        problem.method,
+        problem.districts,
+        parties,
+        votes,
+        seats,
+        divisors,
+        party_divisors,
+    )
+
+
+def calculate_native(problem: Problem, parties, votes, offset: float):
+    """
+    :return: seats (parties x districts), district and party divisors of
+    the native engine of the district option
+    """
+    import pandas as pd
+
+    import allocator
+
+    engine_class = getattr(allocator, ENGINES[problem.district_option])
+    engine = engine_class(
+        pd.DataFrame(votes.T, index=problem.districts, columns=parties),
+        problem.seats,
+        allocator.DivisorMethod(offset),
+    )
+    engine.allocate()
+    return engine.seats.T, engine.district_divs, engine.party_divs
+
+
+def _quote(value) -> str:
+    return f'"{value}"'
+
+
+def render_vertical(
+    title, method, districts, parties, votes, seats, district_divs, party_divs
+) -> str:
+    """
+    Vertical output: parties as rows, pairs of (votes, seats) per district as
+    columns, framed by the district seats and district divisor rows.
+    """
+    lines = [title, ""]
+    header = [_quote(title), _quote(method)]
+    for district in districts:
+        header.extend([_quote(district), _quote("")])
+    header.append(_quote("Divisor"))
+    lines.append(" ".join(header))
+
+    district_seats = [_quote("Seats"), _quote(int(seats.sum()))]
+    for j in range(len(districts)):
+        district_seats.extend([_quote(int(seats[:, j].sum())), _quote("")])
+    lines.append(" ".join(district_seats))
+
+    for i, party in enumerate(parties):
+        row = [_quote(party), _quote(int(seats[i].sum()))]
+        for j in range(len(districts)):
+            row.extend([_quote(int(votes[i, j])), _quote(int(seats[i, j]))])
+        row.append(_quote(f"{party_divs[i]:g}"))
+        lines.append(" ".join(row))
+
+    divisor_row = [_quote("Divisor"), _quote("")]
+    for divisor in district_divs:
+        divisor_row.extend([_quote(f"{divisor:g}"), _quote("")])
+    lines.append(" ".join(divisor_row))
+    lines.append("")
+    return "\n".join(lines)
+
+
+def calculate(input_string: str, native: bool = False) -> str:
+    return "\n".join(
+        calculate_problem(problem, native)
+        for problem in parse_input(input_string)
+    )
+
+
+def calculate_file(input_file_path: str, native: bool = False) -> str:
+    with open(input_file_path, "r") as f:
+        return calculate(f.read(), native)
+
+
+def run_worker(native: bool = False):
+    for input_file_path in sys.stdin:
+        try:
+            output = calculate_file(input_file_path.strip(), native)
+            error = None
+        except Exception as e:  # report and keep the worker alive
+            output = ""
+            error = str(e).replace("\n", " ")
+        sys.stdout.write(output + "\n")
+        if error is not None:
+            sys.stdout.write(f"{ERROR} {error}\n")
+        sys.stdout.write(DONE + "\n")
+        sys.stdout.flush()
+
+
+def main():
+    native = NATIVE in sys.argv
+    if "--worker" in sys.argv:
+        run_worker(native)
+    elif "-f" in sys.argv:
+        input_file_path = sys.argv[sys.argv.index("-f") + 1]
+        sys.stdout.write(calculate_file(input_file_path, native))
+    else:
+        sys.stderr.write(__doc__)
+        sys.exit(2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,441 @@
+"""
+Runs the apportionment engines on the same inputs, records their latencies
+and checks that engines solving the same problem agree on every seat.
+
+    python benchmark.py --repeats 5 --output benchmark-report.json
+    python benchmark.py --bazi-jar <path>/bazi.jar
+
+BAZI is only benchmarked if a jar is given. The stand-in calculates with the
+native engines, thus its engines only check the stand-in itself and are
+labelled stand-in-self-check.
+
+The Pukelsheim engine is only run on real problems, its divisor search does
+not terminate on many generated ones.
+"""
+import argparse
+import io
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+from typing import Callable, Dict, List, Optional
+
+import loguru
+import numpy as np
+import pandas as pd
+
+from allocator import (
+    BiproportionalApportionment,
+    NewZurichApportionment,
+    PukelsheimLowerApportionment,
+    SeparateApportionment,
+)
+from biproportional import BaziWorker, BiProportional, District
+
+_logger = loguru.logger
+
+
+class Problem:
+    def __init__(
+        self,
+        name: str,
+        votes: pd.DataFrame,
+        district_seats: Dict[str, int],
+        generated: bool = False,
+    ):
+        """
+        :param votes: districts as rows and parties as columns
+        :param district_seats: mapping between district and its seats
+        :param generated: random votes instead of those of an election
+        """
+        self.name = name
+        self.votes = votes.fillna(0)
+        self.district_seats = district_seats
+        self.generated = generated
+
+    def describe(self) -> Dict:
+        return {
+            "name": self.name,
+            "districts": len(self.votes.index),
+            "parties": len(self.votes.columns),
+            "seats": int(sum(self.district_seats.values())),
+        }
+
+
+def generated_problem(
+    n_districts: int, n_parties: int, seed: int = 0
+) -> Problem:
+    """
+    Random votes where every party has a nationwide strength, which varies
+    from district to district.
+    """
+    rng = np.random.default_rng(seed)
+    strength = rng.dirichlet(np.ones(n_parties))
+    district_seats = rng.integers(1, 36, n_districts)
+    voters = district_seats * rng.integers(8000, 15000, n_districts)
+    shares = rng.dirichlet(strength * 50 + 0.1, n_districts)
+    votes = np.rint(shares * (voters * district_seats)[:, np.newaxis])
+
+    districts = [f"D{i + 1:02d}" for i in range(n_districts)]
+    parties = [f"P{j + 1:02d}" for j in range(n_parties)]
+    return Problem(
+        f"generated-{n_districts}x{n_parties}-{seed}",
+        pd.DataFrame(data=votes, index=districts, columns=parties),
+        dict(zip(districts, district_seats.tolist())),
+        generated=True,
+    )
+
+
+def real_problem() -> Problem:
+    """
+    Canton votes of the 2019 election without the 2nd round pseudo party.
+    """
+    from prepocessor import CantonSeatsParser, MetadataParser, VotesParser
+
+    meta = MetadataParser()
+    meta.read()
+    canton_seats = CantonSeatsParser(meta.cantons_name_dict, meta.cantons)
+    seats = canton_seats.read().drop("Total", axis=1).loc["seats"]
+    vote = VotesParser(meta.cantons_dict, meta.parties_dict)
+    votes = vote.read_canton_totals(meta.get_empty_canton_party_data_frame())
+    return Problem(
+        f"real-{meta.year}",
+        votes.drop("2nd round", axis=1).astype(float),
+        {canton: int(value) for canton, value in seats.items()},
+    )
+
+
+def run_native(problem: Problem, engine_class) -> pd.DataFrame:
+    return engine_class(problem.votes, problem.district_seats).run()
+
+
+def run_pukelsheim(problem: Problem) -> pd.DataFrame:
+    upper = BiproportionalApportionment(problem.votes, problem.district_seats)
+    parties_seats = upper.upper_apportionment()
+    lower = PukelsheimLowerApportionment(
+        problem.district_seats,
+        dict(zip(upper.parties, parties_seats.tolist())),
+        problem.votes.to_dict(),
+    )
+    # the lower apportionment prints its progress and results
+    with redirect_stdout(io.StringIO()):
+        lower.run()
+    return lower.seats_allocation.transpose()
+
+
+def run_bazi(
+    problem: Problem,
+    district_option: str,
+    bazi_binary_path: str = None,
+    worker_command: List = None,
+) -> pd.DataFrame:
+    """
+    Runs BAZI with BiProportional.run_bazi.
+    :param bazi_binary_path: path to bazi.jar, started once per run
+    :param worker_command: command of a BaziWorker to run on instead, e.g.
+    BaziWorker.stand_in_command(native=True) + ["--worker"]
+    """
+    districts = [
+        District(district, problem.district_seats[district], row.to_dict())
+        for district, row in problem.votes.astype(int).iterrows()
+    ]
+    fd, input_file_path = tempfile.mkstemp(suffix=".bazi")
+    os.close(fd)
+    try:
+        bip = BiProportional(
+            districts, input_file_path, bazi_binary_path or ""
+        )
+        bip.write_bazi_file(
+            district_option=BiProportional.DistrictOptions(district_option)
+        )
+        if worker_command is None:
+            output = bip.run_bazi(write_to_file=False)
+        else:
+            with BaziWorker(command=worker_command) as worker:
+                output = bip.run_bazi(write_to_file=False, worker=worker)
+    finally:
+        os.remove(input_file_path)
+    return bip.parse_output(output)[-1].seats
+
+
+class Engine:
+    """
+    A named way to solve the problems of a district option (mode). Engines
+    sharing a mode are expected to produce identical seats.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        mode: str,
+        function: Callable,
+        generated_problems: bool = True,
+        **kwargs,
+    ):
+        """
+        :param generated_problems: run on generated problems as well
+        :param kwargs: passed to function
+        """
+        self.name = name
+        self.mode = mode
+        self.function = function
+        self.generated_problems = generated_problems
+        self.kwargs = kwargs
+
+    def __call__(self, problem: Problem) -> pd.DataFrame:
+        return self.function(problem, **self.kwargs)
+
+
+def native_engines() -> List[Engine]:
+    return [
+        Engine(
+            "pukelsheim",
+            "biprop",
+            run_pukelsheim,
+            generated_problems=False,
+        ),
+        Engine(
+            "native-separate",
+            "separate",
+            run_native,
+            engine_class=SeparateApportionment,
+        ),
+        Engine(
+            "native-biprop",
+            "biprop",
+            run_native,
+            engine_class=BiproportionalApportionment,
+        ),
+        Engine(
+            "native-nzz",
+            "NZZ",
+            run_native,
+            engine_class=NewZurichApportionment,
+        ),
+    ]
+
+
+def bazi_engines(
+    bazi_binary_path: str = None,
+    worker_command: List = None,
+    prefix: str = "bazi",
+) -> List[Engine]:
+    """
+    :param bazi_binary_path: path to bazi.jar
+    :param worker_command: command of a BaziWorker, see run_bazi
+    """
+    return [
+        Engine(
+            f"{prefix}-{option.value.lower()}",
+            option.value,
+            run_bazi,
+            district_option=option.value,
+            bazi_binary_path=bazi_binary_path,
+            worker_command=worker_command,
+        )
+        for option in BiProportional.DistrictOptions
+    ]
+
+
+def stand_in_engines() -> List[Engine]:
+    """
+    Engines of the native stand-in. It calculates with the native engines,
+    so agreeing with them only checks the BAZI input and output handling.
+    """
+    return bazi_engines(
+        worker_command=BaziWorker.stand_in_command(native=True) + ["--worker"],
+        prefix="stand-in-self-check",
+    )
+
+
+def _measure(engine: Engine, problem: Problem, repeats: int):
+    latencies = []
+    seats = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        seats = engine(problem)
+        latencies.append(time.perf_counter() - start)
+    return latencies, seats
+
+
+def latency_summary(latencies: List[float]) -> Dict:
+    samples = np.array(latencies)
+    return {
+        "samples": latencies,
+        "min": float(samples.min()),
+        "median": float(np.median(samples)),
+        "mean": float(samples.mean()),
+        "p95": float(np.percentile(samples, 95)),
+        "max": float(samples.max()),
+    }
+
+
+def count_mismatches(left: pd.DataFrame, right: pd.DataFrame) -> int:
+    """
+    :return: number of (party, district) cells with different seats, labels
+    missing on either side count as zero seats
+    """
+    index = left.index.union(right.index)
+    columns = left.columns.union(right.columns)
+    left = left.reindex(index=index, columns=columns).fillna(0)
+    right = right.reindex(index=index, columns=columns).fillna(0)
+    return int((left.to_numpy() != right.to_numpy()).sum())
+
+
+class BenchmarkHarness:
+    """
+    Every engine runs in a separate process, such that a hanging engine is
+    killed after timeout seconds without affecting the others. Latencies are
+    measured inside the process and exclude the process startup.
+    """
+
+    def __init__(
+        self,
+        engines: List[Engine],
+        repeats: int = 5,
+        timeout: Optional[float] = 60,
+    ):
+        self.engines = engines
+        self.repeats = repeats
+        self.timeout = timeout
+
+    def _run_isolated(self, engine: Engine, problem: Problem) -> Dict:
+        result = {
+            "problem": problem.name,
+            "engine": engine.name,
+            "mode": engine.mode,
+        }
+        pool = multiprocessing.Pool(1)
+        try:
+            latencies, seats = pool.apply_async(
+                _measure, (engine, problem, self.repeats)
+            ).get(self.timeout)
+        except multiprocessing.TimeoutError:
+            _logger.warning(f"{engine.name} timed out on {problem.name}.")
+            result.update({"status": "timeout"})
+            return result
+        except Exception as e:
+            _logger.warning(f"{engine.name} failed on {problem.name}: {e}")
+            result.update({"status": "error", "error": str(e)})
+            return result
+        finally:
+            pool.terminate()
+            pool.join()
+
+        result.update(
+            {
+                "status": "ok",
+                "latency": latency_summary(latencies),
+                "seats": seats,
+            }
+        )
+        return result
+
+    def run(self, problems: List[Problem]) -> Dict:
+        results = []
+        mismatches = []
+        for problem in problems:
+            references = {}  # type: Dict[str, Dict]
+            for engine in self.engines:
+                if problem.generated and not engine.generated_problems:
+                    results.append(
+                        {
+                            "problem": problem.name,
+                            "engine": engine.name,
+                            "mode": engine.mode,
+                            "status": "skipped",
+                        }
+                    )
+                    continue
+                _logger.info(f"Running {engine.name} on {problem.name}")
+                result = self._run_isolated(engine, problem)
+                results.append(result)
+                if result["status"] != "ok":
+                    continue
+
+                # the first successful engine of a mode is the reference
+                reference = references.setdefault(engine.mode, result)
+                cells = count_mismatches(reference["seats"], result["seats"])
+                result["agrees"] = cells == 0
+                if cells:
+                    _logger.warning(
+                        f"{engine.name} and {reference['engine']} disagree "
+                        f"on {cells} seats of {problem.name}."
+                    )
+                    mismatches.append(
+                        {
+                            "problem": problem.name,
+                            "mode": engine.mode,
+                            "engines": [reference["engine"], engine.name],
+                            "cells": cells,
+                        }
+                    )
+
+        for result in results:
+            result.pop("seats", None)
+        return {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "repeats": self.repeats,
+            "timeout": self.timeout,
+            "problems": [problem.describe() for problem in problems],
+            "results": results,
+            "mismatches": mismatches,
+        }
+
+
+def write_report(report: Dict, file_path) -> None:
+    with open(file_path, "w") as f:
+        json.dump(report, f, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--output", default="benchmark-report.json")
+    parser.add_argument("--bazi-jar", help="path to bazi.jar")
+    parser.add_argument(
+        "--bazi-stand-in",
+        action="store_true",
+        help="check the BAZI handling with the native stand-in",
+    )
+    parser.add_argument(
+        "--generated",
+        type=int,
+        nargs=2,
+        action="append",
+        metavar=("DISTRICTS", "PARTIES"),
+        help="size of a generated problem, may be repeated",
+    )
+    parser.add_argument("--no-real", action="store_true")
+    args = parser.parse_args()
+
+    engines = native_engines()
+    if args.bazi_jar:
+        engines += bazi_engines(bazi_binary_path=args.bazi_jar)
+    if args.bazi_stand_in:
+        engines += stand_in_engines()
+
+    problems = [
+        generated_problem(districts, parties, seed)
+        for seed, (districts, parties) in enumerate(
+            args.generated or [(26, 18)]
+        )
+    ]
+    if not args.no_real:
+        problems.append(real_problem())
+
+    report = BenchmarkHarness(engines, args.repeats, args.timeout).run(
+        problems
+    )
+    write_report(report, args.output)
+    if report["mismatches"]:
+        _logger.error(f"{len(report['mismatches'])} seat mismatches found.")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
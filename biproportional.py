@@ -1,7 +1,42 @@
+import asyncio
+import gzip
+import hashlib
+import io
+import os
+import pickle
+import queue
+import re
 import subprocess
+import sys
+import tempfile
+from contextlib import contextmanager
 from enum import Enum
 from pathlib import Path
-from typing import Dict, List
+from typing import (
+    Dict,
+    AsyncIterator,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    TextIO,
+    Tuple,
+)
+
+import loguru
+import numpy as np
+import pandas as pd
+
+import profiling
+from allocator import (
+    BiproportionalApportionment,
+    DivisorMethod,
+    NewZurichApportionment,
+    SeparateApportionment,
+)
+
+_logger = loguru.logger
 
 
 class District:
@@ -12,17 +47,15 @@ class District:
         self.seats = seats
         self.party_votes = party_votes
 
-    def __str__(self):
-        output_string = (
-            f"=DISTRIKT= {self.short_name}\n"
-            f"=MANDATE= {self.seats}\n"
-            f"=DATEN=\n"
+    def write(self, f: TextIO) -> None:
+        BaziWriter(f).write_district(
+            self.short_name, self.seats, self.party_votes.items()
         )
 
-        for key, value in self.party_votes.items():
-            output_string += f"{key} {value}\n"
-
-        return output_string
+    def __str__(self):
+        buffer = io.StringIO()
+        self.write(buffer)
+        return buffer.getvalue()
 
 
 class BiPropEnums(Enum):
@@ -30,16 +63,81 @@ class BiPropEnums(Enum):
         return self.value
 
 
+class BaziWriter:
+    """
+    Streams BAZI input directly to a file object. The lines are generated
+    from the districts or a vote matrix without building the whole input as
+    a string first, such that memory stays flat for large inputs.
+    """
+
+    def __init__(self, f: TextIO):
+        self.f = f
+
+    @classmethod
+    @contextmanager
+    def open(cls, file_path, compress: bool = False) -> Iterator["BaziWriter"]:
+        """
+        :param compress: write gzip compressed input, also enabled for paths
+        ending in .gz
+        """
+        if compress or str(file_path).endswith(".gz"):
+            f = gzip.open(file_path, "wt", encoding="utf-8")
+        else:
+            f = open(file_path, "w", encoding="utf-8")
+        with f:
+            yield cls(f)
+
+    def write_header(
+        self, titel, method, output, input, district_option
+    ) -> None:
+        self.f.write(f"=TITEL= {titel}\n")
+        self.f.write(f"=METHOD= {method}\n")
+        self.f.write("=OUTPUT= ")
+        self.f.writelines(f"{output_option}," for output_option in output)
+        self.f.write(f"\n=INPUT= {input}\n")
+        self.f.write(f"=DISTRICTOPTION= {district_option}\n")
+
+    def write_district(
+        self, short_name: str, seats: int, party_votes: Iterable[Tuple]
+    ) -> None:
+        self.f.write(f"=DISTRIKT= {short_name}\n=MANDATE= {seats}\n=DATEN=\n")
+        self.f.writelines(f"{party} {votes}\n" for party, votes in party_votes)
+
+    def write_districts(self, districts: Iterable[District]) -> None:
+        for district in districts:
+            district.write(self.f)
+
+    def write_vote_matrix(
+        self, votes: pd.DataFrame, seats: Mapping[str, int]
+    ) -> None:
+        """
+        :param votes: districts as rows and parties as columns
+        :param seats: mapping between district and its number of seats
+        """
+        parties = votes.columns.to_list()
+        for district, row in zip(votes.index, votes.to_numpy().tolist()):
+            self.write_district(district, seats[district], zip(parties, row))
+
+    def write_end(self) -> None:
+        self.f.write("=END=")
+
+
 class BiProportional:
     def __init__(
         self,
         districts: List[District],
         output_file_path: str,
         bazi_binary_path: str,
+        cache: Optional["BaziCache"] = None,
     ):
+        """
+        :param cache: results of previous runs with identical input, BAZI is
+        only run if the input is not found in the cache
+        """
         self.districts = districts
         self.output_file_path = Path(output_file_path)
         self.bazi_binary_path = Path(bazi_binary_path)
+        self.cache = cache
 
     class Methods(BiPropEnums):
         DIV_STD = "DivStd"
@@ -66,47 +164,863 @@ class BiProportional:
         output=None,
         input: Input = Input.LIST_PARTY_GROUPS,
         district_option: DistrictOptions = DistrictOptions.BIPROP,
+        end: bool = True,
     ) -> str:
+        """
+        :param end: terminate the input with =END=. Disabled for problems
+        which are concatenated into a single batch input (see BaziBatch).
+        """
+        buffer = io.StringIO()
+        self.write_bazi(
+            BaziWriter(buffer), titel, method, output, input, district_option
+        )
+        if end:
+            buffer.write("=END=")
+        return buffer.getvalue()
+
+    def write_bazi(
+        self,
+        writer: BaziWriter,
+        titel: str = "Biproportional Allocation",
+        method: Methods = Methods.DIV_STD,
+        output=None,
+        input: Input = Input.LIST_PARTY_GROUPS,
+        district_option: DistrictOptions = DistrictOptions.BIPROP,
+    ) -> None:
+        """
+        Streams the problem without =END= to the writer.
+        """
         if output is None:
             # to make parameter immutable
             output = [self.Output.VERTICAL]
 
-        output_options_string = ""
-        for output_option in output:
-            output_options_string += f"{output_option},"
+        writer.write_header(titel, method, output, input, district_option)
+        writer.write_districts(self.districts)
+
+    def write_bazi_file(self, compress: bool = False, **kwargs) -> None:
+        """
+        Streams the input directly to output_file_path instead of building
+        it with to_bazi_format first. Accepts the arguments of
+        to_bazi_format.
+        """
+        with BaziWriter.open(self.output_file_path, compress) as writer:
+            self.write_bazi(writer, **kwargs)
+            writer.write_end()
+
+    def bazi_str_to_file(self, output_string: str) -> None:
+        with open(self.output_file_path, "w") as f:
+            f.writelines(output_string)
+
+    def run_bazi(
+        self,
+        write_to_file=True,
+        worker: "BaziWorker" = None,
+        result_file_path="result.txt",
+    ):
+        """
+        Runs BAZI on the input file at output_file_path.
+        :param worker: long-lived BAZI process to use instead of starting a
+        new JVM for this calculation
+        :param result_file_path: where the raw output is written to if
+        write_to_file is set
+        """
+        result_string = self._run_cached(worker, parse=False).output
+        if write_to_file:
+            with open(result_file_path, "w") as f:
+                f.writelines(result_string)
+
+        return result_string
+
+    def parse_output(self, result_string: str) -> List["BaziResult"]:
+        """
+        :return: seat tables found in the output of run_bazi, labelled with
+        the names of the districts and parties of this instance
+        """
+        return BaziOutputParser(self.districts).parse(result_string)
+
+    async def run_bazi_async(self, runner: "AsyncBaziRunner", **kwargs) -> str:
+        """
+        Runs BAZI on a private input file written with the arguments of
+        to_bazi_format, thus concurrent runs never share any file. Outputs
+        are cached like those of run_bazi.
+        """
+        if self.cache is None:
+            return await runner.run(self, **kwargs)
+
+        input_string = self.to_bazi_format(**kwargs)
+        key = self.cache.key(input_string.encode("utf-8"), runner.command)
+        entry = self.cache.get(key)
+        if entry is None:
+            entry = BaziCacheEntry(await runner.calculate(input_string))
+            self.cache.put(key, entry)
+        return entry.output
+
+    @profiling.profiled()
+    def calculate(self, worker: "BaziWorker" = None) -> List["BaziResult"]:
+        """
+        Runs BAZI on the input file at output_file_path and parses the output.
+        Results found in the cache are returned without parsing again.
+        """
+        return self._run_cached(worker, parse=True).results
+
+    def run_native(
+        self,
+        method: Methods = Methods.DIV_STD,
+        district_option: DistrictOptions = DistrictOptions.BIPROP,
+    ) -> "BaziResult":
+        """
+        Calculates the problem in-process with the engines of allocator
+        instead of BAZI, thus no JVM is required.
+        """
+        engines = {
+            self.DistrictOptions.SEPERATE: SeparateApportionment,
+            self.DistrictOptions.BIPROP: BiproportionalApportionment,
+            self.DistrictOptions.NEW_ZURICH: NewZurichApportionment,
+        }
+        offsets = {
+            self.Methods.DIV_STD: DivisorMethod.STANDARD,
+            self.Methods.DIV_ABR: DivisorMethod.DOWNWARD,
+        }
+        labels = [district.short_name for district in self.districts]
+        votes = pd.DataFrame(
+            data=[district.party_votes for district in self.districts],
+            index=labels,
+        )
+        seats = dict(zip(labels, [d.seats for d in self.districts]))
+        engine = engines[district_option](
+            votes, seats, DivisorMethod(offsets[method])
+        )
+        return BaziResult(
+            engine.run(), engine.district_divisors, engine.party_divisors
+        )
+
+    def _run_cached(
+        self, worker: "BaziWorker" = None, parse: bool = True
+    ) -> "BaziCacheEntry":
+        """
+        :param parse: parse the output unless the entry holds the results
+        already, otherwise only the raw output is run and cached
+        """
+        if self.cache is None:
+            output = run_bazi_file(
+                self.output_file_path, self.bazi_binary_path, worker
+            )
+            return BaziCacheEntry(
+                output, self.parse_output(output) if parse else None
+            )
+
+        input_bytes = self.output_file_path.read_bytes()
+        # the backend which calculates the output is part of the key
+        if worker is None:
+            command = bazi_command(self.bazi_binary_path)
+        else:
+            command = worker.command
+        key = self.cache.key(input_bytes, command)
+        entry = self.cache.get(key)
+        changed = entry is None
+        if entry is None:
+            output = run_bazi_file(
+                self.output_file_path, self.bazi_binary_path, worker
+            )
+            entry = BaziCacheEntry(output)
+        if parse and entry.results is None:
+            entry.results = self.parse_output(entry.output)
+            changed = True
+        if changed:
+            self.cache.put(key, entry)
+        return entry
+
+
+class BaziResult:
+    """
+    Seats per party (rows) and district (columns) together with the final
+    district and party divisors of a single BAZI problem.
+    """
+
+    def __init__(
+        self,
+        seats: pd.DataFrame,
+        district_divisors: pd.Series,
+        party_divisors: pd.Series,
+    ):
+        self.seats = seats
+        self.district_divisors = district_divisors
+        self.party_divisors = party_divisors
+
+
+class BaziOutputParser:
+    """
+    Single pass parser for the vertical and horizontal seat tables in the
+    output of BAZI.
+
+    A table starts with a header line containing the labels of all districts
+    (vertical, one row per party) or of all parties (horizontal, one row per
+    district), followed by the seats per column. Every row consists of the
+    label, its total number of seats, a (votes, seats) pair per column and
+    the divisor of the row. The table ends with the divisors of the columns.
+    """
+
+    TOKEN = re.compile(r'"([^"]*)"|(\S+)')
+    NUMBER = re.compile(r"[-+]?\d+(?:\.\d*)?(?:[eE][-+]?\d+)?")
+    DIVISOR = "Divisor"
+
+    def __init__(self, districts: List[District]):
+        self.district_labels = [d.short_name for d in districts]
+        self.party_labels = []  # type: List[str]
+        for district in districts:
+            for party in district.party_votes:
+                if party not in self.party_labels:
+                    self.party_labels.append(party)
+        self._district_set = set(self.district_labels)
+        self._party_set = set(self.party_labels)
+
+    def _tokenize(self, line: str) -> List[str]:
+        return [
+            quoted if quoted or not plain else plain
+            for quoted, plain in self.TOKEN.findall(line)
+        ]
 
-        bazi_output_string = (
-            f"=TITEL= {titel}\n"
-            f"=METHOD= {method}\n"
-            f"=OUTPUT= {output_options_string}\n"
-            f"=INPUT= {input}\n"
-            f"=DISTRICTOPTION= {district_option}\n"
+    def _number(self, token: str) -> float:
+        match = self.NUMBER.search(token.replace("'", ""))
+        if match is None:
+            return np.nan
+        return float(match.group())
+
+    def _seats(self, token: str) -> int:
+        # ties are marked with a trailing + or -, missing entries with a dash
+        number = self._number(token.rstrip("+-*"))
+        return 0 if np.isnan(number) else int(number)
+
+    def _numbers(self, tokens: List[str]) -> List[float]:
+        numbers = [self._number(token) for token in tokens]
+        return [number for number in numbers if not np.isnan(number)]
+
+    @profiling.profiled()
+    def parse(self, output: str) -> List[BaziResult]:
+        results = []
+        lines = iter(output.splitlines())
+        for line in lines:
+            tokens = self._tokenize(line)
+            token_set = set(tokens)
+            if self.DIVISOR not in token_set:
+                continue
+            if self._district_set and self._district_set <= token_set:
+                results.append(
+                    self._parse_table(
+                        lines, self.district_labels, self._party_set, True
+                    )
+                )
+            elif self._party_set and self._party_set <= token_set:
+                results.append(
+                    self._parse_table(
+                        lines, self.party_labels, self._district_set, False
+                    )
+                )
+        return results
+
+    def _parse_table(self, lines, columns, row_labels, vertical) -> BaziResult:
+        # the line after the header holds the seats per column
+        next(lines, None)
+
+        rows = []
+        seats = []
+        row_divisors = []
+        column_divisors = [np.nan] * len(columns)
+        for line in lines:
+            tokens = self._tokenize(line)
+            if not tokens:
+                break
+            if tokens[0] == self.DIVISOR:
+                numbers = self._numbers(tokens[1:])
+                if len(numbers) == len(columns):
+                    column_divisors = numbers
+                break
+            if tokens[0] not in row_labels:
+                break
+
+            # label, total seats, (votes, seats) per column, row divisor
+            if len(tokens) < 2 * len(columns) + 3:
+                _logger.error(
+                    f"Row {tokens[0]} has {len(tokens)} fields, expected "
+                    f"{2 * len(columns) + 3} for {len(columns)} columns."
+                )
+                raise ValueError
+            rows.append(tokens[0])
+            seats.append(
+                [self._seats(tokens[3 + 2 * k]) for k in range(len(columns))]
+            )
+            row_divisors.append(self._number(tokens[-1]))
+
+        seats_matrix = np.array(seats, dtype=int).reshape(
+            len(rows), len(columns)
+        )
+        if vertical:
+            return BaziResult(
+                pd.DataFrame(seats_matrix, index=rows, columns=columns),
+                pd.Series(column_divisors, index=columns),
+                pd.Series(row_divisors, index=rows),
+            )
+        return BaziResult(
+            pd.DataFrame(seats_matrix.T, index=columns, columns=rows),
+            pd.Series(row_divisors, index=rows),
+            pd.Series(column_divisors, index=columns),
         )
 
-        for district in self.districts:
-            bazi_output_string += district.__str__()
 
-        bazi_output_string += "=END="
+@profiling.profiled()
+def run_bazi_file(
+    input_file_path, bazi_binary_path, worker: "BaziWorker" = None
+) -> str:
+    """
+    Runs BAZI on a single input file, either by starting a new JVM or on the
+    given long-lived worker.
+    """
+    if worker is not None:
+        return worker.calculate_file(input_file_path)
+
+    cmd = bazi_command(bazi_binary_path) + ["-f", str(input_file_path)]
+    result_string = subprocess.check_output(cmd)
+    return result_string.decode("utf-8",)
+
+
+def bazi_command(bazi_binary_path) -> List[str]:
+    """
+    :return: command running a single BAZI calculation, without the -f
+    argument for the input file
+    """
+    return [
+        "java",
+        "-cp",
+        str(bazi_binary_path),
+        "de.uni.augsburg.bazi.driver.Calculation",
+    ]
+
+
+class BaziCacheEntry:
+    def __init__(self, output: str, results: List[BaziResult] = None):
+        """
+        :param results: parsed output, None until calculate parsed it
+        """
+        self.output = output
+        self.results = results
+
+
+class BaziCache:
+    """
+    On-disk cache of BAZI runs. Entries are addressed by the SHA-256 of the
+    input text and the command which calculated it, files of the command
+    such as the BAZI jar or the stand-in by their content. Thus a new BAZI
+    version or another backend never serves stale results. The raw output is pickled per entry, together
+    with the parsed results once calculate parsed them. If the cache grows
+    beyond max_size bytes, the least recently used entries are evicted.
+    """
+
+    SUFFIX = ".pkl"
+
+    def __init__(self, cache_dir, max_size: int = 256 * 1024 * 1024):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._file_digests = {}  # type: Dict[Path, str]
+
+    def _part_digest(self, part) -> str:
+        """
+        :return: digest of the content if part is a file, e.g. bazi.jar,
+        otherwise of part itself
+        """
+        path = Path(part)
+        if not path.is_file():
+            return hashlib.sha256(str(part).encode("utf-8")).hexdigest()
+        if path not in self._file_digests:
+            digest = hashlib.sha256()
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(chunk)
+            self._file_digests[path] = digest.hexdigest()
+        return self._file_digests[path]
+
+    def key(self, input_bytes: bytes, command: List) -> str:
+        """
+        :param command: command of the backend calculating the output, e.g.
+        bazi_command or the command of a BaziWorker or AsyncBaziRunner
+        """
+        digest = hashlib.sha256()
+        for part in command:
+            digest.update(self._part_digest(part).encode("utf-8"))
+        digest.update(input_bytes)
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / Path(key + self.SUFFIX)
 
-        return bazi_output_string
+    def get(self, key: str) -> Optional[BaziCacheEntry]:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                entry = pickle.load(f)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except (pickle.UnpicklingError, EOFError):
+            _logger.warning(f"Corrupt cache entry {path}. Ignoring.")
+            path.unlink(missing_ok=True)
+            self.misses += 1
+            return None
+
+        # the modification time marks the last use for the eviction
+        os.utime(path)
+        self.hits += 1
+        return entry
+
+    def put(self, key: str, entry: BaziCacheEntry) -> None:
+        path = self._path(key)
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+        # atomic, concurrent readers never see partial entries
+        os.replace(tmp_path, path)
+        self.evict(keep=path)
+
+    def evict(self, keep: Optional[Path] = None) -> None:
+        entries = []
+        size = 0
+        for path in self.cache_dir.glob(f"*{self.SUFFIX}"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, path, stat.st_size))
+            size += stat.st_size
+
+        for _mtime, path, entry_size in sorted(entries):
+            if size <= self.max_size:
+                break
+            if path == keep:
+                continue
+            path.unlink(missing_ok=True)
+            size -= entry_size
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+class BaziScenario:
+    def __init__(
+        self,
+        titel: str,
+        districts: List[District],
+        method: BiProportional.Methods = BiProportional.Methods.DIV_STD,
+        district_option: BiProportional.DistrictOptions = (
+            BiProportional.DistrictOptions.BIPROP
+        ),
+        output: List[BiProportional.Output] = None,
+    ):
+        self.titel = titel
+        self.districts = districts
+        self.method = method
+        self.district_option = district_option
+        self.output = output
+
+    def write_bazi(self, writer: BaziWriter) -> None:
+        bip = BiProportional(self.districts, "", "")
+        bip.write_bazi(
+            writer,
+            self.titel,
+            self.method,
+            output=self.output,
+            district_option=self.district_option,
+        )
+
+    def to_bazi_format(self) -> str:
+        buffer = io.StringIO()
+        self.write_bazi(BaziWriter(buffer))
+        return buffer.getvalue()
+
+
+class BaziBatch:
+    """
+    Writes many scenarios (methods, district options, vote variants) as
+    separate problems into one BAZI input, runs them with a single BAZI
+    invocation and splits the output back per scenario. Scenarios are
+    identified by their title, which therefore has to be unique.
+    """
+
+    def __init__(self, output_file_path: str, bazi_binary_path: str):
+        self.output_file_path = Path(output_file_path)
+        self.bazi_binary_path = Path(bazi_binary_path)
+        self.scenarios = {}  # type: Dict[str, BaziScenario]
+
+    def add(self, scenario: BaziScenario) -> None:
+        if scenario.titel in self.scenarios:
+            _logger.error(f"Scenario {scenario.titel} already in batch.")
+            raise ValueError
+        self.scenarios.update({scenario.titel: scenario})
+
+    def write_bazi(self, writer: BaziWriter) -> None:
+        for scenario in self.scenarios.values():
+            scenario.write_bazi(writer)
+        writer.write_end()
+
+    def to_bazi_format(self) -> str:
+        buffer = io.StringIO()
+        self.write_bazi(BaziWriter(buffer))
+        return buffer.getvalue()
+
+    def write_bazi_file(self) -> None:
+        with BaziWriter.open(self.output_file_path) as writer:
+            self.write_bazi(writer)
 
     def bazi_str_to_file(self, output_string: str) -> None:
         with open(self.output_file_path, "w") as f:
-            f.writelines(output_string)
+            f.write(output_string)
+
+    def split_output(self, output: str) -> Dict[str, str]:
+        """
+        Splits the output of a batch at the title lines of the scenarios.
+        The titles are searched in the order the scenarios were added, thus
+        the output is scanned only once. A title line matches only as a
+        whole, a title containing another one is not mistaken for it.
+        """
+        lines = output.splitlines(keepends=True)
+        starts = []
+        position = 0
+        for titel in self.scenarios:
+            while position < len(lines) and lines[position].strip() != titel:
+                position += 1
+            if position == len(lines):
+                _logger.error(f"No output found for scenario {titel}.")
+                raise ValueError
+            starts.append(position)
+            position += 1
+
+        ends = starts[1:] + [len(lines)]
+        return {
+            titel: "".join(lines[start:end])
+            for titel, start, end in zip(self.scenarios, starts, ends)
+        }
+
+    def run(self, worker: "BaziWorker" = None) -> Dict[str, str]:
+        """
+        :return: mapping between scenario titles and their BAZI output
+        """
+        self.write_bazi_file()
+        output = run_bazi_file(
+            self.output_file_path, self.bazi_binary_path, worker
+        )
+        return self.split_output(output)
+
+
+class BaziWorker:
+    """
+    Keeps a single BAZI process running and feeds it successive input files,
+    such that the JVM startup is only paid once. The worker process reads the
+    path of an input file per line from stdin and answers with the output of
+    the calculation followed by the DONE marker (see java/BaziWorker.java).
+
+    Use BaziWorker.stand_in() for the pure Python implementation of the same
+    protocol in environments without a JVM, see bazi_standin.py.
+    """
+
+    DONE = "=BAZI-WORKER-DONE="
+    ERROR = "=BAZI-WORKER-ERROR="
+    WORKER_SOURCE = Path(__file__).parent / Path("java/BaziWorker.java")
+    STAND_IN = Path(__file__).parent / Path("bazi_standin.py")
+
+    def __init__(self, bazi_binary_path: str = None, command: List = None):
+        """
+        :param bazi_binary_path: path to bazi.jar
+        :param command: command starting a worker process, overrides the
+        default java command
+        """
+        if command is None:
+            command = [
+                "java",
+                "-cp",
+                str(bazi_binary_path),
+                str(self.WORKER_SOURCE),
+            ]
+        self.command = [str(part) for part in command]
+        self.process = None  # type: Optional[subprocess.Popen]
+
+    @classmethod
+    def stand_in_command(cls, native: bool = False) -> List:
+        """
+        :param native: calculate with the native engines of allocator, which
+        support the biprop and NZZ district options as well
+        :return: command of the stand-in without arguments
+        """
+        command = [sys.executable, cls.STAND_IN]
+        if native:
+            command.append("--native")
+        return command
+
+    @classmethod
+    def stand_in(cls, native: bool = False) -> "BaziWorker":
+        return cls(command=cls.stand_in_command(native) + ["--worker"])
+
+    def start(self) -> "BaziWorker":
+        if self.process is None or self.process.poll() is not None:
+            self.process = subprocess.Popen(
+                self.command,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                universal_newlines=True,
+                encoding="utf-8",
+                bufsize=1,
+            )
+        return self
+
+    def calculate_file(self, input_file_path) -> str:
+        self.start()
+        self.process.stdin.write(f"{Path(input_file_path).absolute()}\n")
+        self.process.stdin.flush()
+
+        lines = []
+        error = None
+        for line in self.process.stdout:
+            if line.startswith(self.DONE):
+                break
+            if line.startswith(self.ERROR):
+                error = line[len(self.ERROR) :].strip()
+                continue
+            lines.append(line)
+        else:
+            _logger.error(f"BAZI worker {self.command} exited unexpectedly.")
+            raise ValueError
+
+        if error is not None:
+            _logger.error(f"BAZI failed for {input_file_path}: {error}")
+            raise ValueError
+        return "".join(lines)
+
+    @profiling.profiled()
+    def calculate(self, input_string: str) -> str:
+        """
+        Writes input_string to a temporary input file and runs BAZI on it.
+        """
+        fd, input_file_path = tempfile.mkstemp(suffix=".bazi")
+        try:
+            with os.fdopen(fd, "w") as f:
+                f.write(input_string)
+            return self.calculate_file(input_file_path)
+        finally:
+            os.remove(input_file_path)
 
-    def run_bazi(self, write_to_file=True):
-        cmd = [
-            "java",
-            "-cp",
-            self.bazi_binary_path,
-            "de.uni.augsburg.bazi.driver.Calculation",
-            "-f",
-            self.output_file_path,
+    def close(self):
+        if self.process is not None:
+            self.process.stdin.close()
+            self.process.wait()
+            self.process.stdout.close()
+            self.process = None
+
+    def __enter__(self) -> "BaziWorker":
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class BaziWorkerPool:
+    """
+    Fixed number of BaziWorkers shared between threads. Every calculation
+    borrows an idle worker, therefore up to size calculations run in
+    parallel.
+    """
+
+    def __init__(
+        self, size: int, bazi_binary_path: str = None, command: List = None
+    ):
+        self.workers = [
+            BaziWorker(bazi_binary_path, command) for _ in range(size)
         ]
-        result_string = subprocess.check_output(cmd)
-        result_string = result_string.decode("utf-8",)
-        if write_to_file:
-            with open("result.txt", "w") as f:
-                f.writelines(result_string)
+        self.idle = queue.Queue()  # type: queue.Queue
+        for worker in self.workers:
+            self.idle.put(worker)
 
-        return result_string
+    @property
+    def command(self) -> List[str]:
+        return self.workers[0].command
+
+    @classmethod
+    def stand_in(cls, size: int, native: bool = False) -> "BaziWorkerPool":
+        return cls(
+            size, command=BaziWorker.stand_in_command(native) + ["--worker"]
+        )
+
+    def calculate_file(self, input_file_path) -> str:
+        worker = self.idle.get()
+        try:
+            return worker.calculate_file(input_file_path)
+        finally:
+            self.idle.put(worker)
+
+    def calculate(self, input_string: str) -> str:
+        worker = self.idle.get()
+        try:
+            return worker.calculate(input_string)
+        finally:
+            self.idle.put(worker)
+
+    def close(self):
+        for worker in self.workers:
+            worker.close()
+
+    def __enter__(self) -> "BaziWorkerPool":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class AsyncBaziRunner:
+    """
+    Runs many BAZI calculations as asyncio subprocesses from a single event
+    loop. At most max_concurrency processes run at the same time and every
+    run writes its input to a unique temporary file, which is removed
+    afterwards. Runs exceeding timeout seconds are killed.
+    """
+
+    def __init__(
+        self,
+        bazi_binary_path: str = None,
+        max_concurrency: Optional[int] = None,
+        timeout: Optional[float] = None,
+        command: List = None,
+        tmp_dir: str = None,
+    ):
+        """
+        :param command: command running a single calculation without the -f
+        argument, overrides the default java command
+        :param tmp_dir: directory for the input files, defaults to the
+        system temporary directory
+        """
+        if command is None:
+            command = bazi_command(bazi_binary_path)
+        self.command = [str(part) for part in command]
+        self.bazi_binary_path = bazi_binary_path
+        self.max_concurrency = max_concurrency or os.cpu_count() or 1
+        self.timeout = timeout
+        self.tmp_dir = tmp_dir
+        self._semaphore = None  # type: Optional[asyncio.Semaphore]
+        self._loop = None  # type: Optional[asyncio.AbstractEventLoop]
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        """
+        Semaphore of the running event loop. It is created inside the loop,
+        since a runner may be used by several loops, e.g. asyncio.run calls.
+        """
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._loop = loop
+        return self._semaphore
+
+    @classmethod
+    def stand_in(cls, native: bool = False, **kwargs) -> "AsyncBaziRunner":
+        return cls(command=BaziWorker.stand_in_command(native), **kwargs)
+
+    async def calculate_file(self, input_file_path) -> str:
+        async with self.semaphore:
+            process = await asyncio.create_subprocess_exec(
+                *self.command,
+                "-f",
+                str(input_file_path),
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+            )
+            try:
+                stdout, stderr = await asyncio.wait_for(
+                    process.communicate(), self.timeout
+                )
+            except asyncio.TimeoutError:
+                process.kill()
+                await process.wait()
+                _logger.error(
+                    f"BAZI timed out after {self.timeout}s "
+                    f"for {input_file_path}."
+                )
+                raise
+
+        if process.returncode != 0:
+            _logger.error(
+                f"BAZI failed for {input_file_path}: "
+                f"{stderr.decode('utf-8').strip()}"
+            )
+            raise subprocess.CalledProcessError(
+                process.returncode, self.command, stdout, stderr
+            )
+        return stdout.decode("utf-8")
+
+    async def calculate(self, input_string: str) -> str:
+        def write(writer: BaziWriter):
+            writer.f.write(input_string)
+
+        return await self._calculate_written(write)
+
+    async def _calculate_written(self, write) -> str:
+        fd, input_file_path = tempfile.mkstemp(
+            suffix=".bazi", dir=self.tmp_dir
+        )
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                write(BaziWriter(f))
+            return await self.calculate_file(input_file_path)
+        finally:
+            os.remove(input_file_path)
+
+    async def run(self, bip: BiProportional, **kwargs) -> str:
+        """
+        :param kwargs: arguments of BiProportional.to_bazi_format
+        """
+
+        def write(writer: BaziWriter):
+            bip.write_bazi(writer, **kwargs)
+            writer.write_end()
+
+        return await self._calculate_written(write)
+
+    async def run_scenario(self, scenario: BaziScenario) -> str:
+        def write(writer: BaziWriter):
+            scenario.write_bazi(writer)
+            writer.write_end()
+
+        return await self._calculate_written(write)
+
+    async def as_completed(
+        self, scenarios: Iterable[BaziScenario]
+    ) -> AsyncIterator[Tuple[str, str]]:
+        """
+        Starts all scenarios at once and yields their title and output in
+        the order the calculations finish.
+        """
+
+        async def titled(scenario: BaziScenario):
+            return scenario.titel, await self.run_scenario(scenario)
+
+        tasks = [asyncio.ensure_future(titled(s)) for s in scenarios]
+        try:
+            for task in asyncio.as_completed(tasks):
+                yield await task
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def run_all(
+        self, scenarios: Iterable[BaziScenario]
+    ) -> Dict[str, str]:
+        """
+        :return: mapping between scenario titles and their BAZI output
+        """
+        return {
+            titel: output
+            async for titel, output in self.as_completed(scenarios)
+        }
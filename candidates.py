@@ -0,0 +1,193 @@
+import sys
+from array import array
+from typing import Dict, Iterable, List, Optional
+
+import loguru
+import numpy as np
+import pandas as pd
+
+from datastructures import Candidate, IndexTable, Languages, MultilingualText
+from prepocessor import Config, JsonSectionReader
+
+_logger = loguru.logger
+
+
+class CandidateTable:
+    """
+    Struct-of-arrays storage for the candidates of an election. Candidates
+    are ingested one record at a time, such that the candidates file can be
+    streamed. Canton and party ids are resolved to their positions in the
+    vote and seat matrices while ingesting.
+
+    Once all candidates are known, the candidates are sorted by canton,
+    party and votes. A seat matrix is then turned into the elected members
+    in time linear in the number of seats.
+    """
+
+    def __init__(self, canton_table: IndexTable, party_table: IndexTable):
+        self.canton_table = canton_table
+        self.party_table = party_table
+        self.ids = array("l")
+        self.canton_pos = array("l")
+        self.party_pos = array("l")
+        self.list_numbers = []  # type: List[str]
+        self.votes = array("q")
+        self.status_ids = array("l")
+        self.names = []  # type: List[str]
+        self.skipped = 0
+
+        # precomputed by sort(), see assign()
+        self.order = None  # type: Optional[np.ndarray]
+        self.starts = None  # type: Optional[np.ndarray]
+        self.counts = None  # type: Optional[np.ndarray]
+
+    def append(self, record: Dict) -> bool:
+        """
+        :return: False if the canton or party of the record is unknown
+        """
+        keywords = Candidate.Keywords
+        canton = self.canton_table.positions.get(
+            record.get(keywords.CANTON_ID.value)
+        )
+        party = self.party_table.positions.get(
+            record.get(keywords.PARTY_ID.value)
+        )
+        if canton is None or party is None:
+            self.skipped += 1
+            return False
+
+        self.ids.append(record.get(keywords.ID.value))
+        self.canton_pos.append(canton)
+        self.party_pos.append(party)
+        self.list_numbers.append(
+            sys.intern(str(record.get(keywords.LIST_NUMBER.value)))
+        )
+        self.votes.append(record.get(keywords.VOTES.value) or 0)
+        self.status_ids.append(record.get(keywords.STATUS_ID.value) or 0)
+        self.names.append(
+            f"{record.get(keywords.FIRST_NAME.value, '')} "
+            f"{record.get(keywords.NAME.value, '')}".strip()
+        )
+        self.order = None
+        return True
+
+    def extend(self, records: Iterable[Dict]) -> "CandidateTable":
+        for record in records:
+            self.append(record)
+        if self.skipped:
+            _logger.warning(
+                f"Skipped {self.skipped} candidates of unknown cantons or "
+                f"parties."
+            )
+        return self
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def sort(self) -> None:
+        """
+        Sorts the candidates of every (canton, party) by their votes, ties
+        are broken by the candidate id.
+        """
+        cantons = np.frombuffer(self.canton_pos, dtype=np.int_)
+        parties = np.frombuffer(self.party_pos, dtype=np.int_)
+        votes = np.frombuffer(self.votes, dtype=np.int64)
+        ids = np.frombuffer(self.ids, dtype=np.int_)
+        n_parties = len(self.party_table)
+
+        groups = cantons * n_parties + parties
+        self.order = np.lexsort((ids, -votes, groups))
+        n_groups = len(self.canton_table) * n_parties
+        self.counts = np.bincount(groups, minlength=n_groups)
+        self.starts = np.concatenate(([0], np.cumsum(self.counts)[:-1]))
+
+    def _seat_array(self, seats: pd.DataFrame) -> np.ndarray:
+        """
+        :param seats: seats with cantons as rows (e.g. the seats_allocation
+        of PukelsheimLowerApportionment) or as columns (e.g. BAZI results)
+        :return: seats of shape (cantons, parties) ordered like the tables
+        """
+        cantons = self.canton_table.labels
+        parties = self.party_table.labels
+        if set(seats.columns) <= set(cantons):
+            seats = seats.transpose()
+        unknown = set(seats.columns) - set(parties)
+        if set(seats.index) - set(cantons) or unknown:
+            _logger.error(f"Seats with unknown cantons or parties {unknown}.")
+            raise ValueError
+        return (
+            seats.reindex(index=cantons, columns=parties)
+            .fillna(0)
+            .to_numpy(dtype=int)
+        )
+
+    def assign(
+        self,
+        seats: pd.DataFrame,
+        candidate_status: Dict[int, MultilingualText] = None,
+    ) -> pd.DataFrame:
+        """
+        Assigns the seats of every party in every canton to its candidates
+        with the most votes.
+        :param candidate_status: descriptions of the status ids, see
+        MetadataParser.candidate_status
+        :return: one row per elected candidate
+        """
+        if self.order is None:
+            self.sort()
+
+        seat_array = self._seat_array(seats).ravel()
+        taken = np.minimum(seat_array, self.counts)
+        shortage = seat_array - taken
+        for group in np.flatnonzero(shortage):
+            canton, party = divmod(group, len(self.party_table))
+            _logger.warning(
+                f"{self.party_table.labels[party]} in "
+                f"{self.canton_table.labels[canton]} has "
+                f"{shortage[group]} seats more than candidates."
+            )
+
+        # positions of the first taken candidates of every group plus the
+        # rank within the group
+        groups = np.repeat(np.arange(len(taken)), taken)
+        ranks = np.arange(taken.sum()) - np.repeat(
+            np.cumsum(taken) - taken, taken
+        )
+        elected = self.order[self.starts[groups] + ranks]
+
+        status = candidate_status or {}
+        status_ids = np.frombuffer(self.status_ids, dtype=np.int_)[elected]
+        return pd.DataFrame(
+            {
+                "canton": np.array(self.canton_table.labels)[
+                    groups // len(self.party_table)
+                ],
+                "party": np.array(self.party_table.labels)[
+                    groups % len(self.party_table)
+                ],
+                "rank": ranks + 1,
+                "id": np.frombuffer(self.ids, dtype=np.int_)[elected],
+                "name": [self.names[i] for i in elected],
+                "list": [self.list_numbers[i] for i in elected],
+                "votes": np.frombuffer(self.votes, dtype=np.int64)[elected],
+                "status": [
+                    status[i].get(Languages.DEFAULT) if i in status else ""
+                    for i in status_ids
+                ],
+            }
+        )
+
+
+class CandidateParser:
+    def __init__(self, canton_table: IndexTable, party_table: IndexTable):
+        self.canton_table = canton_table
+        self.party_table = party_table
+
+    def read(self, file_path=Config.CANDIDATES) -> CandidateTable:
+        """
+        Streams the candidates section of file_path into a CandidateTable.
+        """
+        reader = JsonSectionReader(file_path)
+        return CandidateTable(self.canton_table, self.party_table).extend(
+            reader.iter_items(Candidate.Keywords.CANDIDATES.value)
+        )
@@ -1,4 +1,8 @@
+import sys
+from array import array
+from collections.abc import Mapping
 from enum import Enum
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 
 
 class Languages(Enum):
@@ -9,6 +13,54 @@ class Languages(Enum):
     DEFAULT = EN
 
 
+class MultilingualText(Mapping):
+    """
+    Read-only mapping between languages and the text in the respective
+    language. The texts are stored in a tuple ordered like TEXT_LANGUAGES and
+    are interned, instances with identical texts are shared between records
+    (see intern).
+    """
+
+    __slots__ = ("_texts",)
+
+    TEXT_LANGUAGES = (Languages.DE, Languages.FR, Languages.IT, Languages.EN)
+    _interned = {}  # type: Dict[tuple, "MultilingualText"]
+
+    def __init__(self, texts: Dict[Languages, str]):
+        self._texts = tuple(
+            sys.intern(texts[language]) if language in texts else None
+            for language in self.TEXT_LANGUAGES
+        )
+
+    @classmethod
+    def intern(cls, texts: Dict[Languages, str]) -> "MultilingualText":
+        """
+        :return: shared instance for the given texts
+        """
+        text = cls(texts)
+        return cls._interned.setdefault(text._texts, text)
+
+    def __getitem__(self, language: Languages) -> str:
+        text = self._texts[self.TEXT_LANGUAGES.index(language)]
+        if text is None:
+            raise KeyError(language)
+        return text
+
+    def __iter__(self) -> Iterator[Languages]:
+        for language, text in zip(self.TEXT_LANGUAGES, self._texts):
+            if text is not None:
+                yield language
+
+    def __len__(self) -> int:
+        return sum(1 for text in self._texts if text is not None)
+
+    def __reduce__(self):
+        return self.__class__.intern, (dict(self),)
+
+    def __repr__(self) -> str:
+        return repr(dict(self))
+
+
 class MetadataKeywords(Enum):
     TIMESTAMP = "timestamp"
     ELECTION_YEAR = "wahl_jahr"
@@ -23,8 +75,21 @@ class MetadataKeywords(Enum):
 
 
 class Canton:
+    __slots__ = (
+        "id",
+        "name",
+        "short_name",
+        "status",
+        "municipals_total",
+        "municipals_done",
+        "municipals_not_done",
+    )
+
     class Keywords(Enum):
+        ID = "kanton_nummer"
         CANTON_DONE = "kanton_abgeschlossen"
+        MUNICIPALS_DONE = "gemeinden_abgeschlossen"
+        MUNICIPALS_NOT_DONE = "gemeinden_nicht_abgeschlossen"
 
     def __init__(
         self,
@@ -37,8 +102,8 @@ class Canton:
         municipals_not_done: int,
     ):
         self.id = canton_id
-        self.name = canton_name
-        self.short_name = canton_short_name
+        self.name = sys.intern(canton_name)
+        self.short_name = sys.intern(canton_short_name)
         self.status = status
         self.municipals_total = municipals_total
         self.municipals_done = municipals_done
@@ -52,6 +117,18 @@ class Canton:
 
 
 class Party:
+    __slots__ = (
+        "id",
+        "name",
+        "short_name",
+        "group_id",
+        "group_description",
+        "group_description_short",
+        "political_camp_id",
+        "political_camp_description",
+        "political_camp_description_short",
+    )
+
     class Keywords(Enum):
         NAME = "partei_bezeichnung"
         NAME_SHORT = "partei_bezeichnung_kurz"
@@ -60,7 +137,9 @@ class Party:
         CAMP = "parteipolitische_lager_bezeichnung"
         CAMP_SHORT = "parteipolitische_lager_bezeichnung_kurz"
         PARTIES_ON_NATIONAL = "partei_auf_schweizebene"
+        PARTIES_ON_CANTONS = "partei_auf_kantonsebene"
         VOTES = "fiktive_waehlende"
+        ELECTED = "anzahl_gewaehlte"
 
     LANGUAGE = "langKey"
     TEXT = "text"
@@ -68,14 +147,14 @@ class Party:
     def __init__(
         self,
         party_id: int,
-        party_name: dict,
-        party_short_name: dict,
+        party_name: MultilingualText,
+        party_short_name: MultilingualText,
         party_group_id: int,
-        party_group_description: dict,
-        party_group_description_short: dict,
+        party_group_description: MultilingualText,
+        party_group_description_short: MultilingualText,
         party_political_camp_id: int,
-        party_political_camp_description: dict,
-        party_political_camp_description_short: dict,
+        party_political_camp_description: MultilingualText,
+        party_political_camp_description_short: MultilingualText,
     ):
         self.id = party_id
         self.name = party_name
@@ -97,6 +176,8 @@ class Party:
 
 
 class Municipal:
+    __slots__ = ("id", "name", "canton_id")
+
     class Keywords(Enum):
         PARTIES_IN_MUNICIPALS = "partei_auf_gemeindeebene"
         ID = "gemeinde_nummer"
@@ -123,7 +204,7 @@ class Municipal:
         "flag_staerkste_partei": 0
         """
         self.id = municipal_id
-        self.name = municipal_name
+        self.name = sys.intern(municipal_name)
         self.canton_id = canton_id
 
     def __str__(self):
@@ -131,3 +212,191 @@ class Municipal:
 
     def __repr__(self):
         return self.__str__()
+
+
+class MunicipalTable:
+    """
+    Struct-of-arrays storage for municipals. Ids and canton ids are kept in
+    compact integer arrays and the names are interned. Municipal records are
+    only created on access, e.g. when iterating over the table or looking up
+    a municipal by its id.
+    """
+
+    def __init__(self):
+        self.ids = array("l")
+        self.canton_ids = array("l")
+        self.names = []  # type: List[str]
+        self.positions = {}  # type: Dict[int, int]
+
+    def append(self, municipal_id: int, municipal_name: str, canton_id: int):
+        self.positions[municipal_id] = len(self.ids)
+        self.ids.append(municipal_id)
+        self.canton_ids.append(canton_id)
+        self.names.append(sys.intern(municipal_name))
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __contains__(self, municipal_id: int) -> bool:
+        return municipal_id in self.positions
+
+    def __getitem__(self, position: int) -> Municipal:
+        return Municipal(
+            self.ids[position], self.names[position], self.canton_ids[position]
+        )
+
+    def __iter__(self) -> Iterator[Municipal]:
+        for position in range(len(self.ids)):
+            yield self[position]
+
+    def get(self, municipal_id: int) -> Optional[Municipal]:
+        position = self.positions.get(municipal_id)
+        if position is None:
+            return None
+        return self[position]
+
+    def by_id(self) -> "MunicipalsById":
+        return MunicipalsById(self)
+
+
+class MunicipalsById(Mapping):
+    """
+    Read-only mapping between municipal ids and the municipals of a table,
+    the records are created on access like those of the table.
+    """
+
+    def __init__(self, table: MunicipalTable):
+        self.table = table
+
+    def __getitem__(self, municipal_id: int) -> Municipal:
+        return self.table[self.table.positions[municipal_id]]
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.table.ids)
+
+    def __len__(self) -> int:
+        return len(self.table)
+
+    def __contains__(self, municipal_id) -> bool:
+        return municipal_id in self.table.positions
+
+
+class IndexTable:
+    """
+    Dense lookup table between the ids of cantons or parties and their integer
+    position (row or column) in vote and seat matrices. The labels are only
+    required when the matrices are converted at the output boundary.
+    """
+
+    def __init__(self, ids: List[int], labels: List[str]):
+        self.ids = ids
+        self.labels = labels
+        self.positions = {key: pos for pos, key in enumerate(ids)}
+
+    @classmethod
+    def from_cantons(cls, cantons: Iterable[Canton]) -> "IndexTable":
+        cantons = list(cantons)
+        return cls([c.id for c in cantons], [c.short_name for c in cantons])
+
+    @classmethod
+    def from_parties(cls, parties: Iterable[Party]) -> "IndexTable":
+        parties = list(parties)
+        return cls(
+            [p.id for p in parties],
+            [p.short_name.get(Languages.DEFAULT) for p in parties],
+        )
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+
+class ListConnections:
+    """
+    List connections (Listenverbindungen) and their sub-connections
+    (Unterlistenverbindungen) per canton. Every connected list is kept with
+    its party, the lists of a party may be spread over several connections of
+    a canton. A list connected directly, i.e. not within a sub-connection,
+    has no sub-connection.
+    """
+
+    class Keywords(Enum):
+        CANTONS = "kantone"
+        CANTON_ID = "kanton_nummer"
+        CONNECTIONS = "listenverbindung"
+        CONNECTION = "liste_verbindung"
+        SUB_CONNECTIONS = "unterlistenverbindung"
+        SUB_CONNECTION = "liste_unterlistenverbindung"
+        LISTS = "listen"
+        LIST_NUMBER = "liste_nummer_kanton"
+        PARTY_ID = "partei_id"
+
+    def __init__(self):
+        # (canton id, list number) -> (party id, connection, sub-connection)
+        self._lists = {}  # type: Dict[Tuple[int, str], Tuple]
+        # (canton id, party id) -> (connection, sub-connection) of every list
+        self._parties = {}  # type: Dict[Tuple[int, int], List[Tuple]]
+
+    def add(
+        self,
+        canton_id: int,
+        list_number: str,
+        party_id: int,
+        connection: str,
+        sub_connection: Optional[str] = None,
+    ) -> bool:
+        """
+        :return: False if the list is already known, it is not added again
+        """
+        if (canton_id, list_number) in self._lists:
+            return False
+        self._lists[(canton_id, list_number)] = (
+            party_id,
+            connection,
+            sub_connection,
+        )
+        self._parties.setdefault((canton_id, party_id), []).append(
+            (connection, sub_connection)
+        )
+        return True
+
+    def get(
+        self, canton_id: int, list_number: str
+    ) -> Optional[Tuple[int, str, Optional[str]]]:
+        """
+        :return: party id, connection and sub-connection of the list
+        """
+        return self._lists.get((canton_id, list_number))
+
+    def party_connections(
+        self, canton_id: int, party_id: int
+    ) -> List[Tuple[str, Optional[str]]]:
+        """
+        :return: connection and sub-connection of every connected list of the
+        party in the canton, in the order of the metadata
+        """
+        return list(self._parties.get((canton_id, party_id), []))
+
+    def __contains__(self, key: Tuple[int, str]) -> bool:
+        return key in self._lists
+
+    def __len__(self) -> int:
+        return len(self._lists)
+
+
+class Candidate:
+    """
+    Keywords of the candidate results. Candidates are not kept as single
+    records but in the column arrays of candidates.CandidateTable.
+    """
+
+    class Keywords(Enum):
+        CANDIDATES = "kandidierende"
+        ID = "kandidat_nummer"
+        CANTON_ID = "kanton_nummer"
+        LIST_NUMBER = "liste_nummer_kanton"
+        PARTY_ID = "partei_id"
+        FIRST_NAME = "vorname"
+        NAME = "name"
+        VOTES = "stimmen_kandidat"
+        STATUS_ID = "kandidat_status_id"
+        STATUS = "kandidat_status"
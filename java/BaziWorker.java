@@ -0,0 +1,52 @@
+import java.io.BufferedReader;
+import java.io.ByteArrayOutputStream;
+import java.io.InputStreamReader;
+import java.io.PrintStream;
+import java.nio.charset.StandardCharsets;
+
+import de.uni.augsburg.bazi.driver.Calculation;
+
+/**
+ * Long-lived BAZI process. Reads the path of a BAZI input file per line from
+ * stdin, runs the calculation and writes its output followed by the DONE
+ * marker to stdout. Failed calculations are reported with the ERROR marker.
+ *
+ * Started by biproportional.BaziWorker through the single-file source
+ * launcher (Java 11 or newer):
+ *     java -cp bazi.jar java/BaziWorker.java
+ */
+public class BaziWorker {
+    private static final String DONE = "=BAZI-WORKER-DONE=";
+    private static final String ERROR = "=BAZI-WORKER-ERROR=";
+
+    public static void main(String[] args) throws Exception {
+        PrintStream out = new PrintStream(System.out, true, "UTF-8");
+        BufferedReader in = new BufferedReader(
+            new InputStreamReader(System.in, StandardCharsets.UTF_8)
+        );
+
+        String inputFilePath;
+        while ((inputFilePath = in.readLine()) != null) {
+            ByteArrayOutputStream buffer = new ByteArrayOutputStream();
+            PrintStream capture = new PrintStream(buffer, true, "UTF-8");
+            System.setOut(capture);
+            String error = null;
+            try {
+                Calculation.main(new String[] {"-f", inputFilePath});
+            } catch (Throwable t) {
+                error = t.toString().replace('\n', ' ');
+            } finally {
+                capture.flush();
+                System.setOut(out);
+            }
+
+            out.print(buffer.toString("UTF-8"));
+            out.println();
+            if (error != null) {
+                out.println(ERROR + " " + error);
+            }
+            out.println(DONE);
+            out.flush();
+        }
+    }
+}
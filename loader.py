@@ -0,0 +1,231 @@
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import loguru
+import numpy as np
+import pandas as pd
+
+from datastructures import Canton, IndexTable, Party
+from prepocessor import MetadataParser, VotesParser
+
+_logger = loguru.logger
+
+
+class ElectionFiles:
+    """
+    Locates the files of a single national council election inside a data
+    directory, e.g. NRW2019-metadaten.json, NRW2019-partei-gemeinden.json and
+    NRW2019-partei-schweiz-kantone.json.
+    """
+
+    METADATA_SUFFIX = "-metadaten.json"
+    PARTIES_MUNICIPAL_SUFFIX = "-partei-gemeinden.json"
+    PARTIES_NATIONAL_SUFFIX = "-partei-schweiz-kantone.json"
+
+    def __init__(self, data_dir):
+        self.data_dir = Path(data_dir)
+        metadata_files = sorted(
+            self.data_dir.glob(f"*{self.METADATA_SUFFIX}")
+        )
+        if len(metadata_files) != 1:
+            _logger.error(
+                f"Expected exactly one metadata file in {self.data_dir}, "
+                f"found {len(metadata_files)}."
+            )
+            raise ValueError
+
+        prefix = metadata_files[0].name[: -len(self.METADATA_SUFFIX)]
+        self.metadata = metadata_files[0]
+        self.parties_municipal = self.data_dir / Path(
+            prefix + self.PARTIES_MUNICIPAL_SUFFIX
+        )
+        self.parties_national = self.data_dir / Path(
+            prefix + self.PARTIES_NATIONAL_SUFFIX
+        )
+
+
+def _load_metadata(files: ElectionFiles):
+    meta = MetadataParser(files.metadata)
+    meta.read()
+    return meta.year, meta.cantons_dict, meta.parties_dict
+
+
+def _load_canton_votes(
+    files: ElectionFiles,
+    cantons_dict: Dict[int, Canton],
+    parties_dict: Dict[int, Party],
+) -> Optional[pd.DataFrame]:
+    """
+    :return: votes with canton ids as rows and party ids as columns
+    """
+    if not files.parties_municipal.exists():
+        _logger.warning(f"{files.parties_municipal} missing. Skipping.")
+        return None
+    vote = VotesParser(cantons_dict, parties_dict)
+    return pd.DataFrame(
+        data=vote.read_canton_level_array(files.parties_municipal),
+        index=vote.canton_table.ids,
+        columns=vote.party_table.ids,
+    )
+
+
+def _load_national_votes(
+    files: ElectionFiles,
+    cantons_dict: Dict[int, Canton],
+    parties_dict: Dict[int, Party],
+) -> Optional[pd.Series]:
+    """
+    :return: votes indexed by party id
+    """
+    if not files.parties_national.exists():
+        _logger.warning(f"{files.parties_national} missing. Skipping.")
+        return None
+    vote = VotesParser(cantons_dict, parties_dict)
+    return pd.Series(
+        data=vote.read_national_level_array(files.parties_national),
+        index=vote.party_table.ids,
+    )
+
+
+class MultiElectionData:
+    """
+    Votes of several elections aligned on a common canton and party index.
+    The elections are aligned by the ids of cantons and parties, such that a
+    party keeps its votes if its short name changed between elections. The
+    labels of the latest election are only used for the output. Cantons and
+    parties missing in a single election are filled with zero votes.
+    """
+
+    def __init__(
+        self,
+        years: List[int],
+        cantons: List[Canton],
+        parties: List[Party],
+        canton_votes: Dict[int, pd.DataFrame],
+        national_votes: Dict[int, pd.Series],
+    ):
+        """
+        :param canton_votes: per year votes with canton ids as rows and party
+        ids as columns
+        :param national_votes: per year votes indexed by party id
+        """
+        self.years = years
+        self.cantons = cantons
+        self.parties = parties
+        self.canton_table = IndexTable.from_cantons(cantons)
+        self.party_table = IndexTable.from_parties(parties)
+        self.canton_labels = self.canton_table.labels
+        self.party_labels = self.party_table.labels
+
+        # years with canton votes, the first axis of votes_array
+        self.canton_years = [year for year in years if year in canton_votes]
+
+        # (year, canton) x party
+        self._votes = None  # type: Optional[np.ndarray]
+        self.canton_votes = None  # type: Optional[pd.DataFrame]
+        if self.canton_years:
+            self._votes = np.stack(
+                [
+                    canton_votes[year]
+                    .reindex(
+                        index=self.canton_table.ids,
+                        columns=self.party_table.ids,
+                    )
+                    .fillna(0)
+                    .to_numpy(dtype=np.int64)
+                    for year in self.canton_years
+                ]
+            )
+            self.canton_votes = pd.DataFrame(
+                data=self._votes.reshape(-1, len(self.party_table)),
+                index=pd.MultiIndex.from_product(
+                    [self.canton_years, self.canton_labels],
+                    names=["year", "canton"],
+                ),
+                columns=self.party_labels,
+            )
+
+        # year x party
+        national_years = [year for year in years if year in national_votes]
+        self.national_votes = pd.DataFrame(
+            data=[
+                national_votes[year]
+                .reindex(self.party_table.ids)
+                .fillna(0)
+                .to_numpy(dtype=np.int64)
+                for year in national_years
+            ],
+            index=national_years,
+            columns=self.party_labels,
+        )
+
+    def votes_array(self) -> np.ndarray:
+        """
+        :return: canton votes as array of shape (canton_years, cantons,
+        parties)
+        """
+        if self._votes is None:
+            _logger.error(
+                f"No canton votes for any of the elections {self.years}."
+            )
+            raise ValueError
+        return self._votes
+
+
+class MultiElectionLoader:
+    """
+    Loads the metadata, municipal and national files of several elections
+    concurrently in a process pool. The metadata is parsed once per election
+    and passed to the vote parsers.
+    """
+
+    def __init__(self, data_dirs: List, max_workers: Optional[int] = None):
+        self.elections = [ElectionFiles(data_dir) for data_dir in data_dirs]
+        self.max_workers = max_workers
+
+    def load(self) -> MultiElectionData:
+        with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+            metadata = list(executor.map(_load_metadata, self.elections))
+            years = [year for year, _cantons, _parties in metadata]
+            if len(set(years)) != len(years):
+                _logger.error(f"Duplicate election years in {years}.")
+                raise ValueError
+
+            canton_futures = [
+                executor.submit(_load_canton_votes, files, cantons, parties)
+                for files, (_year, cantons, parties) in zip(
+                    self.elections, metadata
+                )
+            ]
+            national_futures = [
+                executor.submit(_load_national_votes, files, cantons, parties)
+                for files, (_year, cantons, parties) in zip(
+                    self.elections, metadata
+                )
+            ]
+            canton_votes = [future.result() for future in canton_futures]
+            national_votes = [future.result() for future in national_futures]
+
+        # later elections take precedence for the labels of a canton or party
+        cantons_dict = {}  # type: Dict[int, Canton]
+        parties_dict = {}  # type: Dict[int, Party]
+        for _year, cantons, parties in sorted(metadata, key=lambda m: m[0]):
+            cantons_dict.update(cantons)
+            parties_dict.update(parties)
+
+        return MultiElectionData(
+            years,
+            [cantons_dict[key] for key in sorted(cantons_dict)],
+            [parties_dict[key] for key in sorted(parties_dict)],
+            {
+                year: df
+                for year, df in zip(years, canton_votes)
+                if df is not None
+            },
+            {
+                year: votes
+                for year, votes in zip(years, national_votes)
+                if votes is not None
+            },
+        )
@@ -0,0 +1,279 @@
+"""
+Choropleth maps of the seat changes per canton between the original results
+and the results of an apportionment method.
+
+The canton boundaries are read once from Config.CANTON_BOUNDARIES (e.g. the
+cantons of swissBOUNDARIES3D), projected, simplified and cached as WKB in
+Config.CANTON_GEOMETRIES. Later maps only load the cached geometries.
+geopandas is only imported once geometries are needed.
+"""
+
+import os
+import pickle
+import tempfile
+from typing import Dict, List, Optional
+
+import loguru
+import numpy as np
+import pandas as pd
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+import profiling
+from datastructures import IndexTable
+from plotter import RenderCache, read_results
+from prepocessor import Config, MetadataParser, VotesParser
+
+_logger = loguru.logger
+
+
+class CantonGeometries:
+    """
+    Simplified and projected canton geometries indexed by the canton labels
+    of canton_table.
+    """
+
+    # canton number of the boundary file, equals the canton id
+    ID_COLUMN = "KANTONSNUM"
+    # Swiss LV95 coordinates in meters
+    CRS = "EPSG:2056"
+    # simplification tolerance in meters of CRS
+    TOLERANCE = 250.0
+
+    def __init__(
+        self,
+        canton_table: IndexTable,
+        file_path=Config.CANTON_BOUNDARIES,
+        cache_path=Config.CANTON_GEOMETRIES,
+        tolerance: float = TOLERANCE,
+        crs: str = CRS,
+        id_column: str = ID_COLUMN,
+    ):
+        self.canton_table = canton_table
+        self.file_path = file_path
+        self.cache_path = cache_path
+        self.tolerance = tolerance
+        self.crs = crs
+        self.id_column = id_column
+        self._frame = None
+
+    def key(self) -> Dict:
+        """
+        :return: everything the cached geometries depend on
+        """
+        stat = os.stat(self.file_path)
+        return {
+            "file_size": stat.st_size,
+            "file_mtime": stat.st_mtime_ns,
+            "tolerance": self.tolerance,
+            "crs": self.crs,
+            "id_column": self.id_column,
+        }
+
+    def _read_cache(self, key: Dict) -> Optional[Dict[int, bytes]]:
+        if not os.path.exists(self.cache_path):
+            return None
+        try:
+            with open(self.cache_path, "rb") as f:
+                cache = pickle.load(f)
+        except (pickle.UnpicklingError, EOFError) as e:
+            _logger.warning(f"Ignoring corrupt {self.cache_path}: {e}")
+            return None
+        if cache.get("key") != key:
+            return None
+        return cache["geometries"]
+
+    def _write_cache(self, key: Dict, geometries: Dict[int, bytes]) -> None:
+        directory = os.path.dirname(os.path.abspath(self.cache_path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump({"key": key, "geometries": geometries}, f)
+        os.replace(tmp_path, self.cache_path)
+
+    @profiling.profiled()
+    def build(self) -> Dict[int, bytes]:
+        """
+        Reads, projects and simplifies the boundaries. Cantons consisting of
+        several polygons are merged.
+        :return: mapping between canton id and the WKB of its geometry
+        """
+        import geopandas
+
+        _logger.info(f"Building canton geometries of {self.file_path}")
+        frame = geopandas.read_file(str(self.file_path)).to_crs(self.crs)
+        frame = frame[[self.id_column, "geometry"]].dissolve(by=self.id_column)
+        simplified = frame.geometry.simplify(
+            self.tolerance, preserve_topology=True
+        )
+        return {
+            int(canton_id): geometry.wkb
+            for canton_id, geometry in simplified.items()
+        }
+
+    def load(self) -> Dict[int, bytes]:
+        key = self.key()
+        geometries = self._read_cache(key)
+        if geometries is None:
+            geometries = self.build()
+            self._write_cache(key, geometries)
+        return geometries
+
+    @property
+    def frame(self):
+        """
+        :return: GeoDataFrame with the canton labels as index
+        """
+        if self._frame is None:
+            import geopandas
+            from shapely import wkb
+
+            geometries = self.load()
+            missing = set(self.canton_table.ids) - set(geometries)
+            if missing:
+                _logger.warning(f"No geometries of the cantons {missing}.")
+            ids = [i for i in self.canton_table.ids if i in geometries]
+            self._frame = geopandas.GeoDataFrame(
+                {"geometry": [wkb.loads(geometries[i]) for i in ids]},
+                index=[
+                    self.canton_table.labels[self.canton_table.positions[i]]
+                    for i in ids
+                ],
+                crs=self.crs,
+            )
+        return self._frame
+
+
+def seat_changes(original, scenario, party: str = None) -> pd.Series:
+    """
+    :param original: seats with parties as rows and cantons as columns, as
+    csv path or data frame
+    :param scenario: seats like original
+    :param party: seats won (positive) or lost (negative) by this party,
+    otherwise the number of seats changing the party
+    :return: change per canton
+    """
+    original = read_results(original)
+    scenario = read_results(scenario)
+    index = original.index.union(scenario.index)
+    columns = original.columns.union(scenario.columns)
+    difference = scenario.reindex(index=index, columns=columns).fillna(
+        0
+    ) - original.reindex(index=index, columns=columns).fillna(0)
+    if party is None:
+        return difference.abs().sum() / 2
+    if party not in difference.index:
+        _logger.error(f"Unknown party {party}.")
+        raise ValueError
+    return difference.loc[party]
+
+
+def draw_seat_changes(
+    fig: Figure,
+    geometries: CantonGeometries,
+    changes: pd.Series,
+    title: str = "",
+    diverging: bool = False,
+) -> None:
+    """
+    :param changes: change per canton, see seat_changes
+    :param diverging: color gains and losses symmetrically, e.g. for the
+    changes of a single party
+    """
+    frame = geometries.frame
+    frame = frame.assign(change=changes.reindex(frame.index).fillna(0))
+    limit = max(float(np.abs(frame["change"]).max()), 1.0)
+
+    ax = fig.subplots()
+    ax.set_axis_off()
+    ax.set_title(title)
+    frame.plot(
+        column="change",
+        ax=ax,
+        cmap="RdBu" if diverging else "Reds",
+        vmin=-limit if diverging else 0,
+        vmax=limit,
+        edgecolor="white",
+        linewidth=0.5,
+        legend=True,
+    )
+    for canton, point in frame.geometry.representative_point().items():
+        change = frame.at[canton, "change"]
+        ax.annotate(
+            f"{canton}\n{change:g}" if change else canton,
+            xy=(point.x, point.y),
+            horizontalalignment="center",
+            verticalalignment="center",
+            fontsize="x-small",
+        )
+
+
+@profiling.profiled()
+def render_seat_change_maps(
+    original,
+    scenarios: Dict[str, object],
+    geometries: CantonGeometries,
+    output_dir="visdata",
+    party: str = None,
+) -> List[str]:
+    """
+    Renders a map of the seat changes of every scenario compared to original.
+    The geometries are loaded once and a single figure is reused, maps which
+    are up to date according to the render cache are skipped.
+    :param scenarios: mapping between scenario name and its seats, see
+    seat_changes
+    :return: paths of the maps in the order of scenarios
+    """
+    cache = RenderCache.in_dir(output_dir)
+    geometry_key = geometries.key()
+    fig = None
+    file_paths = []
+    rendered = {}  # type: Dict[str, str]
+    for name, scenario in scenarios.items():
+        changes = seat_changes(original, scenario, party)
+        suffix = f"_{party}" if party else ""
+        title = f"Seat changes{' of ' + party if party else ''} ({name})"
+        file_path = os.path.join(
+            output_dir, f"seat_changes_{name}{suffix}.png".replace("/", "-")
+        )
+        file_paths.append(file_path)
+        key = RenderCache.key(changes, title=title, geometries=geometry_key)
+        if cache.is_fresh(file_path, key):
+            continue
+
+        if fig is None:
+            fig = Figure(figsize=(8, 5))
+            FigureCanvasAgg(fig)
+        fig.clear()
+        draw_seat_changes(
+            fig, geometries, changes, title, diverging=party is not None
+        )
+        fig.savefig(file_path)
+        rendered[file_path] = key
+    if rendered:
+        cache.update(rendered)
+    return file_paths
+
+
+def original_seats(meta: MetadataParser) -> pd.DataFrame:
+    """
+    :return: elected members with parties as rows and cantons as columns
+    """
+    vote = VotesParser(meta.cantons_dict, meta.parties_dict)
+    elected = vote.read_canton_elected(
+        meta.get_empty_canton_party_data_frame()
+    )
+    return elected.transpose().drop("2nd round")
+
+
+def main():
+    meta = MetadataParser()
+    geometries = CantonGeometries(meta.canton_table)
+    scenarios = {
+        "biprop": "data/biprop-results.csv",
+        "nzz": "data/nzz-results.csv",
+    }
+    render_seat_change_maps(original_seats(meta), scenarios, geometries)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,574 @@
+"""
+Runs the whole report as a pipeline of stages:
+
+    metadata -> votes, seats -> upper apportionments -> lower apportionments
+    -> BAZI cross-check -> render
+
+    python pipeline.py                      # everything
+    python pipeline.py biprop               # a stage and what it requires
+    python pipeline.py --bazi-stand-in      # cross-check with the stand-in
+
+Every stage is keyed by the hash of its input files, its parameters, its
+source code and the outputs of the stages it requires. Outputs are pickled
+to the state directory, such that a stage whose key did not change is
+skipped. A stage which runs again but produces the same output does not
+invalidate the stages after it. Stages whose requirements are done run
+concurrently.
+"""
+import argparse
+import hashlib
+import importlib.util
+import inspect
+import json
+import os
+import pickle
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, Iterable, List, Optional, Union
+
+import loguru
+import pandas as pd
+
+import profiling
+from allocator import (
+    BiproportionalApportionment,
+    ListConnectionApportionment,
+    NewZurichApportionment,
+)
+from prepocessor import Config
+
+_logger = loguru.logger
+
+
+class Stage:
+    def __init__(
+        self,
+        name: str,
+        function: Callable,
+        requires: Union[Iterable[str], Dict[str, str]] = (),
+        files: Iterable = (),
+        products: Iterable = (),
+        params: Dict = None,
+        modules: Iterable[str] = (),
+    ):
+        """
+        :param function: called with the outputs of the required stages as
+        keyword arguments plus params, returns a picklable output
+        :param requires: names of the required stages, which are also the
+        keyword arguments of function, or a mapping between the name of a
+        required stage and its keyword argument
+        :param files: input files read by function
+        :param products: files written by function, the stage runs again if
+        any of them is missing
+        :param params: json serializable parameters of function
+        :param modules: names of further modules whose source is part of the
+        key, e.g. the modules function imports when called. The modules of
+        function and of classes or functions in params are always part of it
+        """
+        self.name = name
+        self.function = function
+        if not isinstance(requires, dict):
+            requires = {name: name for name in requires}
+        self.arguments = requires
+        self.requires = list(requires)
+        self.files = [str(file_path) for file_path in files]
+        self.products = [str(file_path) for file_path in products]
+        self.params = params or {}
+        self.modules = list(modules)
+
+
+class Pipeline:
+    STATE_FILE = "state.json"
+
+    def __init__(
+        self,
+        stages: List[Stage],
+        state_dir=".pipeline",
+        max_workers: Optional[int] = None,
+    ):
+        self.stages = {stage.name: stage for stage in stages}
+        for stage in stages:
+            unknown = set(stage.requires) - set(self.stages)
+            if unknown:
+                _logger.error(f"{stage.name} requires unknown {unknown}.")
+                raise ValueError
+        self.state_dir = state_dir
+        self.max_workers = max_workers or os.cpu_count() or 1
+        os.makedirs(state_dir, exist_ok=True)
+
+        self.state = {"stages": {}, "files": {}}
+        state_path = os.path.join(state_dir, self.STATE_FILE)
+        if os.path.exists(state_path):
+            with open(state_path, "r") as f:
+                self.state = json.load(f)
+        self._lock = threading.Lock()
+        self._outputs = {}  # type: Dict[str, object]
+
+    def _output_path(self, name: str) -> str:
+        return os.path.join(self.state_dir, f"{name}.pickle")
+
+    def file_digest(self, file_path: str) -> str:
+        """
+        Files are only hashed again if their size or modification time
+        changed.
+        """
+        stat = os.stat(file_path)
+        stamp = [stat.st_size, stat.st_mtime_ns]
+        with self._lock:
+            known = self.state["files"].get(file_path)
+        if known is not None and known["stamp"] == stamp:
+            return known["digest"]
+
+        digest = hashlib.sha256()
+        with open(file_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+        with self._lock:
+            self.state["files"][file_path] = {
+                "stamp": stamp,
+                "digest": digest.hexdigest(),
+            }
+        return digest.hexdigest()
+
+    @staticmethod
+    def source_files(stage: Stage) -> List[str]:
+        """
+        :return: source files of the code run by stage
+        """
+        objects = [stage.function]
+        objects += [
+            value for value in stage.params.values() if callable(value)
+        ]
+        files = set()
+        for obj in objects:
+            try:
+                files.add(inspect.getsourcefile(obj))
+            except TypeError:
+                # built-in, no source to hash
+                continue
+        for module in stage.modules:
+            spec = importlib.util.find_spec(module)
+            if spec is None or spec.origin is None:
+                _logger.error(
+                    f"{stage.name} requires unknown module {module}."
+                )
+                raise ValueError
+            files.add(spec.origin)
+        files.discard(None)
+        return sorted(files)
+
+    def stage_key(self, stage: Stage) -> str:
+        with self._lock:
+            required = {
+                name: self.state["stages"][name]["output"]
+                for name in stage.requires
+            }
+        key = {
+            "name": stage.name,
+            "params": stage.params,
+            "files": {f: self.file_digest(f) for f in stage.files},
+            # by content only, the path of a module depends on how it was run
+            "code": sorted(map(self.file_digest, self.source_files(stage))),
+            "requires": required,
+        }
+        return hashlib.sha256(
+            json.dumps(key, sort_keys=True, default=str).encode("utf-8")
+        ).hexdigest()
+
+    def output(self, name: str):
+        """
+        :return: output of the stage name, loaded from the state directory if
+        the stage was skipped
+        """
+        with self._lock:
+            if name in self._outputs:
+                return self._outputs[name]
+        with open(self._output_path(name), "rb") as f:
+            output = pickle.load(f)
+        with self._lock:
+            self._outputs[name] = output
+        return output
+
+    def _is_fresh(self, stage: Stage, key: str) -> bool:
+        with self._lock:
+            known = self.state["stages"].get(stage.name)
+        return (
+            known is not None
+            and known["key"] == key
+            and os.path.exists(self._output_path(stage.name))
+            and all(os.path.exists(p) for p in stage.products)
+        )
+
+    def _run_stage(self, stage: Stage, force: bool) -> str:
+        """
+        :return: "cached" if the stage was skipped, "ran" otherwise
+        """
+        key = self.stage_key(stage)
+        if not force and self._is_fresh(stage, key):
+            return "cached"
+
+        start = time.perf_counter()
+        kwargs = {
+            argument: self.output(name)
+            for name, argument in stage.arguments.items()
+        }
+        with profiling.span(f"stage {stage.name}"):
+            output = stage.function(**kwargs, **stage.params)
+        data = pickle.dumps(output, protocol=pickle.HIGHEST_PROTOCOL)
+
+        fd, tmp_path = tempfile.mkstemp(dir=self.state_dir, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, self._output_path(stage.name))
+        with self._lock:
+            self._outputs[stage.name] = output
+            self.state["stages"][stage.name] = {
+                "key": key,
+                "output": hashlib.sha256(data).hexdigest(),
+                "seconds": time.perf_counter() - start,
+            }
+        return "ran"
+
+    def _save_state(self) -> None:
+        fd, tmp_path = tempfile.mkstemp(dir=self.state_dir, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(self.state, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, os.path.join(self.state_dir, self.STATE_FILE))
+
+    def required_stages(self, targets: Iterable[str] = None) -> List[str]:
+        """
+        :return: targets and all stages they require, defaults to all stages
+        """
+        if targets is None:
+            return list(self.stages)
+        needed = []
+        pending = list(targets)
+        while pending:
+            name = pending.pop()
+            if name not in self.stages:
+                _logger.error(f"Unknown stage {name}.")
+                raise ValueError
+            if name not in needed:
+                needed.append(name)
+                pending.extend(self.stages[name].requires)
+        return [name for name in self.stages if name in needed]
+
+    def run(
+        self, targets: Iterable[str] = None, force: bool = False
+    ) -> Dict[str, str]:
+        """
+        :param force: run the stages even if their inputs did not change
+        :return: mapping between stage name and "ran" or "cached"
+        """
+        waiting = self.required_stages(targets)
+        statuses = {}  # type: Dict[str, str]
+        running = {}
+        error = None
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while waiting or running:
+                ready = [
+                    name
+                    for name in waiting
+                    if all(r in statuses for r in self.stages[name].requires)
+                ]
+                for name in ready if error is None else []:
+                    waiting.remove(name)
+                    future = executor.submit(
+                        self._run_stage, self.stages[name], force
+                    )
+                    running[future] = name
+                if not running:
+                    break
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        statuses[name] = future.result()
+                    except Exception as e:
+                        _logger.error(f"Stage {name} failed: {e}")
+                        error = error or e
+                        continue
+                    _logger.info(f"{name}: {statuses[name]}")
+        self._save_state()
+        if error is not None:
+            raise error
+        return statuses
+
+
+def load_metadata() -> Dict:
+    from prepocessor import MetadataParser
+
+    meta = MetadataParser()
+    meta.read()
+    return {
+        "cantons": meta.cantons,
+        "cantons_dict": meta.cantons_dict,
+        "cantons_name_dict": meta.cantons_name_dict,
+        "parties_dict": meta.parties_dict,
+        "canton_table": meta.canton_table,
+        "party_table": meta.party_table,
+        "list_connections": meta.list_connections,
+    }
+
+
+def aggregate_votes(metadata: Dict, include_others: bool) -> pd.DataFrame:
+    """
+    :return: votes with cantons as rows and parties as columns
+    """
+    from prepocessor import VotesParser
+
+    vote = VotesParser(metadata["cantons_dict"], metadata["parties_dict"])
+    votes = pd.DataFrame(
+        0, index=vote.canton_table.labels, columns=vote.party_table.labels
+    )
+    votes = vote.read_canton_totals(votes).drop("2nd round", axis=1)
+    if not include_others:
+        votes = votes.drop("Others", axis=1)
+    return votes
+
+
+def read_seat_table(metadata: Dict) -> Dict[str, int]:
+    from prepocessor import CantonSeatsParser
+
+    seats = CantonSeatsParser(
+        metadata["cantons_name_dict"], metadata["cantons"]
+    ).read()
+    return {
+        canton: int(value)
+        for canton, value in seats.drop("Total", axis=1).loc["seats"].items()
+    }
+
+
+def upper_apportionment(votes, seats, engine_class) -> pd.Series:
+    engine = engine_class(votes, seats)
+    engine.upper_apportionment()
+    return engine.parties_seats
+
+
+def lower_apportionment(votes, seats, parties_seats, engine_class):
+    """
+    :return: seats with parties as rows and cantons as columns
+    """
+    engine = engine_class(votes, seats)
+    engine.parties_seats_array = parties_seats[engine.parties].to_numpy()
+    return engine.run()
+
+
+def status_quo(metadata: Dict, seats) -> pd.DataFrame:
+    """
+    The published result: Hagenbach-Bischoff within every canton with the
+    list connections. The other parties are part of many connections, thus
+    their votes are always included.
+    :return: seats with parties as rows and cantons as columns
+    """
+    votes = aggregate_votes(metadata, include_others=True)
+    return ListConnectionApportionment(
+        votes,
+        seats,
+        metadata["list_connections"],
+        metadata["canton_table"],
+        metadata["party_table"],
+    ).run()
+
+
+def bazi_cross_check(
+    votes,
+    seats,
+    bazi_binary_path: str = None,
+    worker_command: List = None,
+    **results,
+) -> Dict:
+    """
+    :param bazi_binary_path: path to bazi.jar
+    :param worker_command: command of a BaziWorker to use instead
+    :param results: seats of the native engines per BAZI district option
+    :return: number of different seats per district option
+    """
+    from benchmark import Problem, count_mismatches, run_bazi
+
+    problem = Problem("pipeline", votes, seats)
+    mismatches = {}
+    for option, native in results.items():
+        bazi = run_bazi(problem, option, bazi_binary_path, worker_command)
+        mismatches[option] = count_mismatches(native, bazi)
+        if mismatches[option]:
+            _logger.error(
+                f"BAZI disagrees on {mismatches[option]} seats of {option}."
+            )
+    return mismatches
+
+
+def render(output_dir: str, chart: str, **results) -> List[str]:
+    """
+    Writes the results as csv and as a single results file, see results.py,
+    and renders their charts.
+    """
+    from plotter import render_parliaments
+    from results import ResultsWriter
+
+    jobs = []
+    with ResultsWriter(os.path.join(output_dir, RESULTS_FILE)) as writer:
+        for name, result in results.items():
+            result.to_csv(os.path.join(output_dir, f"{name}-results.csv"))
+            writer.add(name, result)
+            jobs.append((result, f"national_council_{name}.png"))
+    return render_parliaments(jobs, output_dir, chart=chart)
+
+
+RESULTS = ("biprop", "nzz", "hagenbach_bischoff")
+RESULTS_FILE = "results.seats"
+PARSER_MODULES = ("prepocessor", "datastructures")
+
+
+def build_stages(
+    output_dir="visdata",
+    chart="pie",
+    include_others=False,
+    bazi_jar: str = None,
+    bazi_worker_command: List = None,
+) -> List[Stage]:
+    """
+    :param bazi_jar: path to bazi.jar for the cross-check with BAZI
+    :param bazi_worker_command: command of a BaziWorker for the cross-check,
+    e.g. the stand-in. The cross-check is left out if neither is given
+    """
+    stages = [
+        Stage(
+            "metadata",
+            load_metadata,
+            files=[Config.METADATA],
+            modules=PARSER_MODULES,
+        ),
+        Stage(
+            "votes",
+            aggregate_votes,
+            requires=["metadata"],
+            files=[Config.PARTIES_NATIONAL],
+            params={"include_others": include_others},
+            modules=PARSER_MODULES,
+        ),
+        Stage(
+            "seats",
+            read_seat_table,
+            requires=["metadata"],
+            files=[Config.CANTON_SEATS],
+            modules=PARSER_MODULES,
+        ),
+        Stage(
+            "hagenbach_bischoff",
+            status_quo,
+            requires=["metadata", "seats"],
+            files=[Config.PARTIES_NATIONAL],
+            modules=["allocator", *PARSER_MODULES],
+        ),
+    ]
+    for name, engine_class in (
+        ("biprop", BiproportionalApportionment),
+        ("nzz", NewZurichApportionment),
+    ):
+        stages.append(
+            Stage(
+                f"upper_{name}",
+                upper_apportionment,
+                requires=["votes", "seats"],
+                params={"engine_class": engine_class},
+            )
+        )
+        stages.append(
+            Stage(
+                name,
+                lower_apportionment,
+                requires={
+                    "votes": "votes",
+                    "seats": "seats",
+                    f"upper_{name}": "parties_seats",
+                },
+                params={"engine_class": engine_class},
+            )
+        )
+    if bazi_jar or bazi_worker_command:
+        # the native results are keyed by their BAZI district option
+        stages.append(
+            Stage(
+                "bazi",
+                bazi_cross_check,
+                requires={
+                    "votes": "votes",
+                    "seats": "seats",
+                    "biprop": "biprop",
+                    "nzz": "NZZ",
+                },
+                params={
+                    "bazi_binary_path": bazi_jar,
+                    "worker_command": bazi_worker_command,
+                },
+                modules=["benchmark", "biproportional", "bazi_standin"],
+            )
+        )
+    stages.append(
+        Stage(
+            "render",
+            render,
+            requires=list(RESULTS),
+            products=[
+                os.path.join(output_dir, f"{name}-results.csv")
+                for name in RESULTS
+            ]
+            + [os.path.join(output_dir, RESULTS_FILE)],
+            params={"output_dir": output_dir, "chart": chart},
+            modules=["plotter", "results"],
+        )
+    )
+    return stages
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__.strip(),
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("targets", nargs="*", help="stages to run")
+    parser.add_argument("--state-dir", default=".pipeline")
+    parser.add_argument("--output-dir", default="visdata")
+    parser.add_argument("--jobs", type=int, help="concurrent stages")
+    parser.add_argument(
+        "--force", action="store_true", help="run unchanged stages as well"
+    )
+    parser.add_argument("--chart", choices=["pie", "hemicycle"], default="pie")
+    parser.add_argument("--include-others", action="store_true")
+    parser.add_argument("--bazi-jar", help="path to bazi.jar")
+    parser.add_argument(
+        "--bazi-stand-in",
+        action="store_true",
+        help="cross-check with the native BAZI stand-in, a self-check of "
+        "the BAZI input and output handling",
+    )
+    args = parser.parse_args()
+
+    worker_command = None
+    if args.bazi_stand_in and not args.bazi_jar:
+        from biproportional import BaziWorker
+
+        worker_command = BaziWorker.stand_in_command(native=True)
+        worker_command.append("--worker")
+
+    stages = build_stages(
+        args.output_dir,
+        args.chart,
+        args.include_others,
+        args.bazi_jar,
+        worker_command,
+    )
+    pipeline = Pipeline(stages, args.state_dir, args.jobs)
+    statuses = pipeline.run(args.targets or None, args.force)
+    # the cross-check is only resolved if the targets require it
+    if "bazi" in statuses and any(pipeline.output("bazi").values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,23 @@
-import matplotlib.pyplot as plt
+import hashlib
+import json
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import loguru
 import numpy as np
 import pandas as pd
+from matplotlib import cm, rcParams
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.colors import to_rgba_array
+from matplotlib.figure import Figure
+from matplotlib.patches import Patch
+
+import profiling
+
+_logger = loguru.logger
 
 party_colors = {
     "PdA/Sol.": "#792a8f",
@@ -19,8 +36,85 @@ party_colors = {
     "Others": "#00ff00",
 }
 
+# parties with at most this many seats are annotated outside of the pie
+LABEL_THRESHOLD = 5
+
+# color of parties missing in party_colors
+DEFAULT_COLOR = "#999999"
+
+# radius of the innermost row of a hemicycle, the outermost row has radius 1
+HEMICYCLE_INNER_RADIUS = 0.4
+
+
+class RenderCache:
+    """
+    Remembers the key of the inputs every output file was rendered from, such
+    that an output is only rendered again if its seat data or plot
+    parameters changed. The keys are stored as json next to the outputs.
+    """
+
+    FILE_NAME = ".render-cache.json"
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.entries = {}  # type: Dict[str, str]
+        if os.path.exists(file_path):
+            with open(file_path, "r") as f:
+                self.entries = json.load(f)
+
+    @classmethod
+    def in_dir(cls, output_dir) -> "RenderCache":
+        return cls(os.path.join(output_dir, cls.FILE_NAME))
+
+    @staticmethod
+    def key(data, **params) -> str:
+        """
+        :param data: seats as data frame or any array like
+        :param params: json serializable plot parameters
+        """
+        digest = hashlib.sha256()
+        if isinstance(data, pd.DataFrame):
+            digest.update(data.to_csv().encode("utf-8"))
+        else:
+            digest.update(np.asarray(data).tobytes())
+        digest.update(
+            json.dumps(params, sort_keys=True, default=str).encode("utf-8")
+        )
+        return digest.hexdigest()
+
+    def is_fresh(self, output_path, key: str) -> bool:
+        return self.entries.get(
+            os.path.abspath(output_path)
+        ) == key and os.path.exists(output_path)
+
+    def update(self, outputs: Dict[str, str]) -> None:
+        """
+        :param outputs: mapping between rendered output path and its key
+        """
+        for output_path, key in outputs.items():
+            self.entries[os.path.abspath(output_path)] = key
+        directory = os.path.dirname(os.path.abspath(self.file_path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(self.entries, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.file_path)
+
+
+def party_pie_plot(percentages, labels, legend, output_file=None):
+    """
+    :param output_file: save the plot to this file instead of showing it,
+    nothing is rendered if the file is up to date
+    """
+    if output_file is not None:
+        cache = RenderCache.in_dir(os.path.dirname(output_file) or ".")
+        key = RenderCache.key(
+            percentages, labels=list(labels), legend=list(legend)
+        )
+        if cache.is_fresh(output_file, key):
+            return
+
+    import matplotlib.pyplot as plt
 
-def party_pie_plot(percentages, labels, legend):
     fig1, ax1 = plt.subplots()
     wedges = ax1.pie(
         percentages,
@@ -39,22 +133,55 @@ def party_pie_plot(percentages, labels, legend):
         loc="center left",
         bbox_to_anchor=(1, 0, 0.5, 1),
     )
-    plt.show()
+    if output_file is None:
+        plt.show()
+        return
+    fig1.savefig(output_file)
+    plt.close(fig1)
+    cache.update({output_file: key})
+
+
+def read_results(results) -> pd.DataFrame:
+    """
+    :param results: path to a results csv or a data frame with parties as
+    rows and cantons as columns
+    """
+    if isinstance(results, pd.DataFrame):
+        return results
+    if isinstance(getattr(results, "seats", None), pd.DataFrame):
+        # e.g. a scenario of results.ResultsFile
+        return results.seats
+    return pd.read_csv(results, index_col=0)
+
+
+def _parliament_key(
+    df: pd.DataFrame, title, chart="pie", color_by="party"
+) -> str:
+    return RenderCache.key(
+        df,
+        title=title,
+        party_colors=party_colors,
+        label_threshold=LABEL_THRESHOLD,
+        chart=chart,
+        color_by=color_by,
+    )
 
 
-def plot_parliament(results_file, title):
-    df = pd.read_csv(results_file, index_col=0)
+def draw_parliament(fig: Figure, results) -> None:
+    """
+    Draws the seats per party of results as a pie onto fig.
+    """
+    df = read_results(results).sort_index()
 
     seats_wedges = []
     party_labels = []
     all_labels = []
     colors = []
     legend = []
-    df.sort_index(inplace=True)
     for party in df.index:
         seats = df.loc[party].sum()
         seats_wedges.append(seats)
-        if seats > 5:
+        if seats > LABEL_THRESHOLD:
             party_labels.append(party)
         else:
             party_labels.append("")
@@ -62,8 +189,8 @@ def plot_parliament(results_file, title):
         colors.append(party_colors.get(party))
         legend.append(f"{party} - {seats}")
 
-    fig1, ax1 = plt.subplots()
-    fig1.set_figwidth(8)
+    ax1 = fig.subplots()
+    fig.set_figwidth(8)
 
     wedges, texts = ax1.pie(
         seats_wedges,
@@ -80,8 +207,11 @@ def plot_parliament(results_file, title):
         text.set_fontweight("bold")
         text.set_horizontalalignment("center")
 
-    fig1.legend(
-        legend, title="Parties", loc="center left", bbox_to_anchor=(0, 0.5),
+    fig.legend(
+        legend,
+        title="Parties",
+        loc="center left",
+        bbox_to_anchor=(0, 0.5),
     )
 
     bbox_props = dict(boxstyle="square,pad=0.3", fc="w", ec="k", lw=0.72)
@@ -121,9 +251,223 @@ def plot_parliament(results_file, title):
                 **kw,
             )
 
-    plt.tight_layout()
-    plt.savefig(f"visdata/{title}")
-    plt.show()
+    fig.tight_layout()
+
+
+@lru_cache(maxsize=None)
+def hemicycle_layout(n_seats: int) -> Tuple[np.ndarray, float]:
+    """
+    Places n_seats on concentric half circles, where every row gets seats in
+    proportion to its length. The layout only depends on the number of seats
+    and is computed once.
+    :return: read only seat positions of shape (n_seats, 2) ordered from left
+    to right and the diameter of a seat dot
+    """
+    rows = max(1, int(np.ceil(np.sqrt(n_seats / 4))))
+    radii = np.linspace(HEMICYCLE_INNER_RADIUS, 1, rows)
+
+    # largest remainder distribution of the seats to the rows
+    shares = radii / radii.sum() * n_seats
+    row_seats = np.floor(shares).astype(int)
+    remainder = n_seats - row_seats.sum()
+    row_seats[np.argsort(row_seats - shares)[:remainder]] += 1
+
+    row = np.repeat(np.arange(rows), row_seats)
+    index = np.arange(n_seats) - np.repeat(
+        np.cumsum(row_seats) - row_seats, row_seats
+    )
+    gaps = np.maximum(row_seats - 1, 1)[row]
+    angle = np.where(row_seats[row] > 1, np.pi * (1 - index / gaps), np.pi / 2)
+    radius = radii[row]
+
+    order = np.lexsort((radius, -angle))
+    positions = np.column_stack(
+        (radius * np.cos(angle), radius * np.sin(angle))
+    )[order]
+    positions.flags.writeable = False
+
+    row_gap = (1 - HEMICYCLE_INNER_RADIUS) / max(rows - 1, 1)
+    seat_gap = np.pi * radii[0] / max(row_seats[0] - 1, 1)
+    return positions, 0.8 * min(row_gap, seat_gap)
+
+
+def _canton_colors(n_cantons: int) -> np.ndarray:
+    colors = np.concatenate(
+        (cm.tab20(np.arange(20)), cm.tab20b(np.arange(20)))
+    )
+    return colors[np.arange(n_cantons) % len(colors)]
+
+
+def draw_hemicycle(fig: Figure, results, color_by="party") -> None:
+    """
+    Draws one dot per seat of results onto fig. The parties are ordered like
+    party_colors and all dots are drawn as a single collection.
+    :param color_by: "party" or "canton"
+    """
+    if color_by not in ("party", "canton"):
+        _logger.error(f"Can not color hemicycle seats by {color_by}.")
+        raise ValueError
+    df = read_results(results).fillna(0)
+    parties = [party for party in party_colors if party in df.index]
+    parties += sorted(set(df.index) - set(parties))
+    df = df.loc[parties]
+    seats = df.to_numpy(dtype=int)
+    positions, diameter = hemicycle_layout(int(seats.sum()))
+
+    if color_by == "party":
+        labels = parties
+        label_colors = to_rgba_array(
+            [party_colors.get(party, DEFAULT_COLOR) for party in parties]
+        )
+        seat_labels = np.repeat(np.arange(len(parties)), seats.sum(axis=1))
+    else:
+        labels = list(df.columns)
+        label_colors = _canton_colors(len(labels))
+        # seats of a party are grouped by canton
+        seat_labels = np.repeat(
+            np.tile(np.arange(len(labels)), len(parties)), seats.ravel()
+        )
+
+    ax = fig.subplots()
+    ax.set_xlim(-1.05, 1.05)
+    ax.set_ylim(-0.05, 1.05)
+    ax.set_aspect("equal")
+    ax.axis("off")
+    points_per_unit = ax.get_position().width * fig.get_figwidth() * 72 / 2.1
+    ax.scatter(
+        positions[:, 0],
+        positions[:, 1],
+        s=(diameter * points_per_unit) ** 2,
+        c=label_colors[seat_labels],
+        linewidths=0,
+    )
+    ax.text(
+        0,
+        0.05,
+        str(len(positions)),
+        horizontalalignment="center",
+        fontsize="xx-large",
+        fontweight="bold",
+    )
+
+    shown = np.unique(seat_labels)
+    fig.legend(
+        [Patch(color=label_colors[i]) for i in shown],
+        [labels[i] for i in shown],
+        title="Parties" if color_by == "party" else "Cantons",
+        loc="lower center",
+        ncol=min(len(shown), 7),
+        fontsize="small",
+    )
+
+
+@profiling.profiled()
+def draw_chart(fig: Figure, results, chart="pie", color_by="party"):
+    """
+    :param chart: "pie", see draw_parliament, or "hemicycle", see
+    draw_hemicycle
+    """
+    if chart == "pie":
+        draw_parliament(fig, results)
+    elif chart == "hemicycle":
+        draw_hemicycle(fig, results, color_by)
+    else:
+        _logger.error(f"Unknown chart {chart}.")
+        raise ValueError
+
+
+def plot_parliament(
+    results,
+    title,
+    output_dir="visdata",
+    show=True,
+    chart="pie",
+    color_by="party",
+):
+    """
+    :param results: path to a results csv or a data frame with parties as
+    rows and cantons as columns
+    :param show: open the figure in a window after saving it, blocks in
+    headless runs. Otherwise, nothing is rendered if the file is up to date.
+    :param chart: see draw_chart
+    :param color_by: see draw_hemicycle
+    """
+    df = read_results(results)
+    file_path = os.path.join(output_dir, title)
+    cache = RenderCache.in_dir(output_dir)
+    key = _parliament_key(df, title, chart, color_by)
+    if not show and cache.is_fresh(file_path, key):
+        return
+
+    import matplotlib.pyplot as plt
+
+    fig = plt.figure()
+    draw_chart(fig, df, chart, color_by)
+    fig.savefig(file_path)
+    cache.update({file_path: key})
+    if show:
+        plt.show()
+    else:
+        plt.close(fig)
+
+
+# figure reused by all renderings of a worker process
+_worker_figure = None  # type: Optional[Figure]
+
+
+def _render_job(job: Tuple) -> str:
+    global _worker_figure
+    results, title, output_dir, chart, color_by = job
+    if _worker_figure is None:
+        _worker_figure = Figure()
+        FigureCanvasAgg(_worker_figure)
+    _worker_figure.clear()
+    _worker_figure.set_size_inches(rcParams["figure.figsize"])
+
+    file_path = os.path.join(output_dir, title)
+    draw_chart(_worker_figure, results, chart, color_by)
+    _worker_figure.savefig(file_path)
+    return file_path
+
+
+@profiling.profiled()
+def render_parliaments(
+    jobs: Iterable[Tuple],
+    output_dir="visdata",
+    max_workers=None,
+    chart="pie",
+    color_by="party",
+) -> List[str]:
+    """
+    Renders many parliament charts headless (Agg) in worker processes. Every
+    worker reuses a single figure and nothing is ever shown. Charts which are
+    up to date according to the render cache of output_dir are skipped.
+    :param jobs: pairs of results (csv path or seats data frame) and title
+    :param chart: see draw_chart
+    :param color_by: see draw_hemicycle
+    :return: paths of the charts in the order of jobs
+    """
+    cache = RenderCache.in_dir(output_dir)
+    file_paths = []
+    pending = {}  # type: Dict[str, str]
+    stale_jobs = []
+    for results, title in jobs:
+        df = read_results(results)
+        file_path = os.path.join(output_dir, title)
+        key = _parliament_key(df, title, chart, color_by)
+        file_paths.append(file_path)
+        if not cache.is_fresh(file_path, key) and file_path not in pending:
+            pending[file_path] = key
+            stale_jobs.append((df, title, output_dir, chart, color_by))
+    if not stale_jobs:
+        return file_paths
+
+    max_workers = min(max_workers or os.cpu_count() or 1, len(stale_jobs))
+    chunk_size = max(1, len(stale_jobs) // max_workers)
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        list(executor.map(_render_job, stale_jobs, chunksize=chunk_size))
+    cache.update(pending)
+    return file_paths
 
 
 def main():
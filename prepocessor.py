@@ -1,15 +1,29 @@
+import codecs
 import json
 import os
+import unicodedata
 from pathlib import Path
-from typing import List, Dict
+from typing import List, Dict, Iterable, Iterator, Optional, Set, Tuple
 
 import loguru
+import numpy as np
 import pandas as pd
-from tqdm import tqdm
 
+import profiling
 from allocator import Dhondt
-from datastructures import MetadataKeywords, Canton, Party, Languages, Municipal
-from plotter import party_pie_plot
+from datastructures import (
+    Candidate,
+    MetadataKeywords,
+    Canton,
+    Party,
+    Languages,
+    Municipal,
+    IndexTable,
+    ListConnections,
+    MultilingualText,
+    MunicipalTable,
+    MunicipalsById,
+)
 
 _logger = loguru.logger
 
@@ -21,22 +35,226 @@ class Config:
     METADATA = DATA_DIR / Path("NRW2019-metadaten.json")
     PARTIES_MUNICIPAL = DATA_DIR / Path("NRW2019-partei-gemeinden.json")
     PARTIES_NATIONAL = DATA_DIR / Path("NRW2019-partei-schweiz-kantone.json")
+    CANDIDATES = DATA_DIR / Path("NRW2019-kandidierende.json")
     # ELIGIBLE_VOTERS = DATA_DIR / Path("canton-citizens-2016.csv")
     CANTON_SEATS = DATA_DIR / Path("canton-seats-2019.csv")
+    CANTON_BOUNDARIES = DATA_DIR / Path("cantons.geojson")
+    CANTON_GEOMETRIES = DATA_DIR / Path("cantons-geometries.pickle")
+
+
+class JsonSectionReader:
+    """
+    Decodes the top level sections of a JSON object file on demand.
+
+    The file is read in chunks and decoding stops as soon as the requested
+    section has been found. Sections after it are neither read nor decoded
+    until they are requested as well. Decoded sections are cached.
+    """
+
+    CHUNK_SIZE = 1 << 16
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.sections = {}  # type: Dict[str, object]
+        self._decoder = json.JSONDecoder()
+        self._text_decoder = codecs.getincrementaldecoder("utf-8")()
+        self._buffer = ""
+        self._offset = 0
+        self._started = False
+        self._eof = False
+        self._exhausted = False
+
+    def get(self, key: str, default=None):
+        if key not in self.sections and not self._exhausted:
+            with open(self.file_path, "rb") as f:
+                f.seek(self._offset)
+                while key not in self.sections and not self._exhausted:
+                    self._decode_next_section(f)
+        return self.sections.get(key, default)
+
+    def read_all(self) -> Dict:
+        if not self._exhausted:
+            with open(self.file_path, "rb") as f:
+                f.seek(self._offset)
+                while not self._exhausted:
+                    self._decode_next_section(f)
+        return self.sections
+
+    def _fill(self, f, size: int) -> bool:
+        chunk = f.read(size)
+        self._offset += len(chunk)
+        self._eof = not chunk
+        self._buffer += self._text_decoder.decode(chunk, final=self._eof)
+        return not self._eof
+
+    def _skip(self, f, pos: int, characters: str) -> int:
+        while True:
+            while pos < len(self._buffer) and self._buffer[pos] in characters:
+                pos += 1
+            if pos < len(self._buffer) or not self._fill(f, self.CHUNK_SIZE):
+                return pos
+
+    def _decode(self, f, pos: int):
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buffer, pos)
+                # numbers might have been cut off at the end of the buffer
+                if end < len(self._buffer) or self._eof:
+                    return value, end
+            except json.JSONDecodeError:
+                if self._eof:
+                    raise
+            # read at least as much as is buffered to stay linear in the
+            # size of large sections
+            self._fill(f, max(self.CHUNK_SIZE, len(self._buffer) - pos))
+
+    def _next_key(self, f) -> Optional[Tuple[str, int]]:
+        """
+        :return: the key of the next section and the position of its value
+        in the buffer, None if there are no more sections
+        """
+        pos = self._skip(f, 0, " \t\r\n")
+        if not self._started:
+            if self._buffer[pos : pos + 1] != "{":
+                _logger.error(f"{self.file_path} is not a JSON object.")
+                raise ValueError
+            self._started = True
+            pos = self._skip(f, pos + 1, " \t\r\n")
+
+        pos = self._skip(f, pos, " \t\r\n,")
+        if pos >= len(self._buffer) or self._buffer[pos] == "}":
+            self._exhausted = True
+            self._buffer = ""
+            return None
+
+        key, pos = self._decode(f, pos)
+        return key, self._skip(f, pos, " \t\r\n:")
+
+    def _decode_next_section(self, f):
+        entry = self._next_key(f)
+        if entry is None:
+            return
+        key, pos = entry
+        value, pos = self._decode(f, pos)
+        self.sections[key] = value
+        self._buffer = self._buffer[pos:]
+
+    def iter_items(self, key: str) -> Iterator:
+        """
+        Streams the items of an array section one at a time, such that large
+        sections (e.g. thousands of candidates) are never decoded as a whole.
+        Streamed sections are not cached.
+        """
+        if key in self.sections:
+            yield from self.sections[key]
+            return
+
+        # a separate cursor keeps the state of this reader untouched
+        cursor = JsonSectionReader(self.file_path)
+        cursor.CHUNK_SIZE = self.CHUNK_SIZE
+        with open(self.file_path, "rb") as f:
+            while True:
+                entry = cursor._next_key(f)
+                if entry is None:
+                    return
+                section, pos = entry
+                if section == key:
+                    break
+                _value, pos = cursor._decode(f, pos)
+                cursor._buffer = cursor._buffer[pos:]
+
+            if cursor._buffer[pos : pos + 1] != "[":
+                _logger.error(f"Section {key} is not an array.")
+                raise ValueError
+            pos += 1
+            while True:
+                pos = cursor._skip(f, pos, " \t\r\n,")
+                if pos >= len(cursor._buffer):
+                    _logger.error(f"Section {key} is not terminated.")
+                    raise ValueError
+                if cursor._buffer[pos] == "]":
+                    return
+                item, pos = cursor._decode(f, pos)
+                cursor._buffer = cursor._buffer[pos:]
+                pos = 0
+                yield item
 
 
 class MetadataParser:
-    def __init__(self):
-        self.cantons = []  # type: List[Canton]
-        self.cantons_dict = {}  # type: Dict[int, Canton]
-        self.cantons_name_dict = {}  # type: Dict[str, Canton]
-        self.parties = []  # type: List[Party]
-        self.parties_dict = {}  # type: Dict[int, Party]
-        self.year = 0
-        self.__read_complete = False
-        with open(Config.METADATA, "r") as f:
-            self.metadata = json.load(f)
+    """
+    Every section of the metadata is parsed lazily the first time it is
+    accessed, e.g. asking for cantons_dict only decodes and parses the cantons
+    section. read() parses all sections at once.
+    """
 
+    def __init__(self, metadata_path=Config.METADATA):
+        self.reader = JsonSectionReader(metadata_path)
+        self._cantons = None  # type: Optional[List[Canton]]
+        self._cantons_dict = None  # type: Optional[Dict[int, Canton]]
+        self._cantons_name_dict = None  # type: Optional[Dict[str, Canton]]
+        self._canton_table = None  # type: Optional[IndexTable]
+        self._parties = None  # type: Optional[List[Party]]
+        self._parties_dict = None  # type: Optional[Dict[int, Party]]
+        self._party_table = None  # type: Optional[IndexTable]
+        self._year = None  # type: Optional[int]
+        self._list_connections = None  # type: Optional[ListConnections]
+        self._candidate_status = None  # type: Optional[Dict]
+
+    @property
+    def metadata(self) -> Dict:
+        return self.reader.read_all()
+
+    @property
+    def cantons(self) -> List[Canton]:
+        return self.parse_cantons()
+
+    @property
+    def cantons_dict(self) -> Dict[int, Canton]:
+        if self._cantons_dict is None:
+            self._create_canton_dicts()
+        return self._cantons_dict
+
+    @property
+    def cantons_name_dict(self) -> Dict[str, Canton]:
+        if self._cantons_name_dict is None:
+            self._create_canton_dicts()
+        return self._cantons_name_dict
+
+    @property
+    def canton_table(self) -> IndexTable:
+        if self._canton_table is None:
+            self._create_canton_dicts()
+        return self._canton_table
+
+    @property
+    def parties(self) -> List[Party]:
+        return self.parse_parties()
+
+    @property
+    def parties_dict(self) -> Dict[int, Party]:
+        if self._parties_dict is None:
+            self._create_party_dicts()
+        return self._parties_dict
+
+    @property
+    def party_table(self) -> IndexTable:
+        if self._party_table is None:
+            self._create_party_dicts()
+        return self._party_table
+
+    @property
+    def year(self) -> int:
+        return self.parse_election_year()
+
+    @property
+    def list_connections(self) -> ListConnections:
+        return self.parse_list_connections()
+
+    @property
+    def candidate_status(self) -> Dict[int, MultilingualText]:
+        return self.parse_candidate_status()
+
+    @profiling.profiled()
     def read(self):
         for key in MetadataKeywords:
             try:
@@ -44,87 +262,170 @@ class MetadataParser:
                 parser_method()
             except AttributeError:
                 _logger.debug(f"No parsing method found for {key.name}")
-        self.__read_complete = True
         self._create_dicts()
 
     def _create_dicts(self):
+        self._create_canton_dicts()
+        self._create_party_dicts()
+
+    def _create_canton_dicts(self):
+        self._cantons_dict = {}
+        self._cantons_name_dict = {}
         for canton in self.cantons:
-            if canton.id not in self.cantons_dict:
-                self.cantons_dict.update({canton.id: canton})
+            if canton.id not in self._cantons_dict:
+                self._cantons_dict.update({canton.id: canton})
             else:
                 _logger.error(
                     f"{canton.short_name} already in dict. Duplicate!"
                 )
 
-            if canton.name not in self.cantons_name_dict:
-                self.cantons_name_dict.update({canton.name: canton})
+            if canton.name not in self._cantons_name_dict:
+                self._cantons_name_dict.update({canton.name: canton})
             else:
                 _logger.error(f"{canton.name} already in dict. Duplicate!")
 
+        self._canton_table = IndexTable.from_cantons(
+            self._cantons_dict.values()
+        )
+
+    def _create_party_dicts(self):
+        self._parties_dict = {}
         for party in self.parties:
-            if party.id not in self.parties_dict:
-                self.parties_dict.update({party.id: party})
+            if party.id not in self._parties_dict:
+                self._parties_dict.update({party.id: party})
             else:
                 _logger.error(f"{party.name} already in dict. Duplicate!")
 
+        self._party_table = IndexTable.from_parties(self._parties_dict.values())
+
     def parse_cantons(self,) -> List[Canton]:
-        data_dict = self.metadata.get(MetadataKeywords.CANTONS.value)
+        if self._cantons is not None:
+            return self._cantons
+
+        self._cantons = []
+        data_dict = self.reader.get(MetadataKeywords.CANTONS.value)
         for canton in data_dict:
+            # copy, the cached section must stay untouched
+            canton = dict(canton)
             canton[Canton.Keywords.CANTON_DONE.value] = canton[
                 Canton.Keywords.CANTON_DONE.value
             ] in ("yes", "true", "t", "1",)
-            self.cantons.append(Canton(*canton.values()))
+            self._cantons.append(Canton(*canton.values()))
 
-        return self.cantons
+        return self._cantons
 
     def parse_parties(self) -> List[Party]:
-        data_dict = self.metadata.get(MetadataKeywords.PARTIES.value)
+        if self._parties is not None:
+            return self._parties
+
+        self._parties = []
+        data_dict = self.reader.get(MetadataKeywords.PARTIES.value)
         for party in data_dict:
+            party = dict(party)
             for key in Party.Keywords:
-                tmp_dict = {}
                 if key.value in party:
-                    for entry in party.get(key.value):
-                        tmp_dict.update(
-                            {
-                                Languages(entry.get(Party.LANGUAGE)): entry.get(
-                                    Party.TEXT
-                                )
-                            }
-                        )
-                    party[key.value] = tmp_dict
-            self.parties.append(Party(*party.values()))
+                    party[key.value] = MultilingualText.intern(
+                        {
+                            Languages(entry.get(Party.LANGUAGE)): entry.get(
+                                Party.TEXT
+                            )
+                            for entry in party.get(key.value)
+                        }
+                    )
+            self._parties.append(Party(*party.values()))
+
+        return self._parties
+
+    def parse_candidate_status(self) -> Dict[int, MultilingualText]:
+        """
+        :return: mapping between the status id of a candidate (e.g.
+        incumbent) and its description
+        """
+        if self._candidate_status is not None:
+            return self._candidate_status
+
+        self._candidate_status = {}
+        for status in self.reader.get(
+            MetadataKeywords.CANDIDATE_STATUS.value, []
+        ):
+            status_id = status.get(Candidate.Keywords.STATUS_ID.value)
+            self._candidate_status[status_id] = MultilingualText.intern(
+                {
+                    Languages(entry.get(Party.LANGUAGE)): entry.get(Party.TEXT)
+                    for entry in status.get(Candidate.Keywords.STATUS.value)
+                }
+            )
+        return self._candidate_status
+
+    def parse_election_year(self) -> int:
+        if self._year is None:
+            self._year = self.reader.get(MetadataKeywords.ELECTION_YEAR.value)
+        return self._year
 
-        return self.parties
+    def parse_list_connections(self) -> ListConnections:
+        if self._list_connections is not None:
+            return self._list_connections
 
-    def parse_election_year(self):
-        data_dict = self.metadata.get(MetadataKeywords.ELECTION_YEAR.value)
-        self.year = data_dict
+        self._list_connections = ListConnections()
+        keywords = ListConnections.Keywords
+        for entry in self.reader.get(
+            MetadataKeywords.LIST_CONNECTIONS.value, []
+        ):
+            for canton in entry.get(keywords.CANTONS.value, []):
+                canton_id = canton.get(keywords.CANTON_ID.value)
+                for connection in canton.get(keywords.CONNECTIONS.value, []):
+                    label = connection.get(keywords.CONNECTION.value)
+                    lists = [
+                        (lst, None)
+                        for lst in connection.get(keywords.LISTS.value, [])
+                    ]
+                    for sub_connection in connection.get(
+                        keywords.SUB_CONNECTIONS.value, []
+                    ):
+                        sub_label = sub_connection.get(
+                            keywords.SUB_CONNECTION.value
+                        )
+                        lists.extend(
+                            (lst, sub_label)
+                            for lst in sub_connection.get(
+                                keywords.LISTS.value, []
+                            )
+                        )
+                    for lst, sub_label in lists:
+                        list_number = lst.get(keywords.LIST_NUMBER.value)
+                        if not self._list_connections.add(
+                            canton_id,
+                            list_number,
+                            lst.get(keywords.PARTY_ID.value),
+                            label,
+                            sub_label,
+                        ):
+                            _logger.error(
+                                f"List {list_number} of canton {canton_id} "
+                                f"connected twice. Duplicate!"
+                            )
+
+        return self._list_connections
 
     def get_empty_canton_party_data_frame(self):
-        if not self.__read_complete:
-            self.read()
-        index = [c.short_name for c in self.cantons]
-        columns = [p.short_name.get(Languages.DEFAULT) for p in self.parties]
-        df = pd.DataFrame(index=index, columns=columns,)
+        df = pd.DataFrame(
+            index=self.canton_table.labels, columns=self.party_table.labels,
+        )
         df.fillna(0, inplace=True)
         return df
 
     def get_empty_total_party_data_frame(self):
-        if not self.__read_complete:
-            self.read()
-        index = ["total"]
-        columns = [p.short_name.get(Languages.DEFAULT) for p in self.parties]
-        df = pd.DataFrame(index=index, columns=columns,)
+        df = pd.DataFrame(index=["total"], columns=self.party_table.labels,)
         df.fillna(0, inplace=True)
         return df
 
 
 class MunicipalParser:
-    def __init__(self):
-        self.municipals = []  # type: List[Municipal]
-        self.municipals_dict = {}  # type: Dict[int, Municipal]
+    def __init__(self, municipal_path=Config.PARTIES_MUNICIPAL):
+        self.municipals = MunicipalTable()
+        self.municipals_dict = self.municipals.by_id()  # type: MunicipalsById
         self.__read_complete = False
-        with open(Config.PARTIES_MUNICIPAL, "r") as f:
+        with open(municipal_path, "r") as f:
             self.data = json.load(f)
 
     def read(self):
@@ -138,10 +439,10 @@ class MunicipalParser:
         municipal_id = json_data.get(Municipal.Keywords.ID.value)
         municipal_name = json_data.get(Municipal.Keywords.NAME.value)
         municipal_canton_id = json_data.get(Municipal.Keywords.CANTON_ID.value)
-        mun = Municipal(municipal_id, municipal_name, municipal_canton_id)
-        if municipal_id not in self.municipals_dict:
-            self.municipals.append(mun)
-            self.municipals_dict.update({municipal_id: mun})
+        if municipal_id not in self.municipals:
+            self.municipals.append(
+                municipal_id, municipal_name, municipal_canton_id
+            )
 
 
 class VotesParser:
@@ -150,61 +451,345 @@ class VotesParser:
     ):
         self.cantons_dict = cantons_dict
         self.parties_dict = parties_dict
+        self.canton_table = IndexTable.from_cantons(cantons_dict.values())
+        self.party_table = IndexTable.from_parties(parties_dict.values())
         self.data = None
 
-    def read_canton_level(self, data_frame: pd.DataFrame) -> pd.DataFrame:
-        with open(Config.PARTIES_MUNICIPAL, "r") as f:
+    @profiling.profiled()
+    def read_canton_level_array(
+        self,
+        file_path=Config.PARTIES_MUNICIPAL,
+        section=Municipal.Keywords.PARTIES_IN_MUNICIPALS.value,
+        value=Municipal.Keywords.VOTES.value,
+    ) -> np.ndarray:
+        """
+        Sums up the municipal votes of every party per canton.
+        :param section: records with canton, party and votes, either per
+        municipal or already per canton
+        :param value: key of the summed up value of the records
+        :return: matrix of shape (cantons, parties) ordered like the canton
+        and party index tables
+        """
+        with open(file_path, "r") as f:
             self.data = json.load(f)
 
-        for party_in_municipal in tqdm(
-            self.data.get(Municipal.Keywords.PARTIES_IN_MUNICIPALS.value)
-        ):
-            canton_id = party_in_municipal.get(
-                Municipal.Keywords.CANTON_ID.value
-            )
-            votes = party_in_municipal.get(Municipal.Keywords.VOTES.value)
-            party_id = party_in_municipal.get(Municipal.Keywords.PARTY_ID.value)
-            canton = self.cantons_dict.get(canton_id)
-            party = self.parties_dict.get(party_id)
+        from tqdm import tqdm
 
+        canton_positions = self.canton_table.positions
+        party_positions = self.party_table.positions
+        rows = []
+        columns = []
+        values = []
+        for party_in_municipal in tqdm(self.data.get(section)):
+            votes = party_in_municipal.get(value)
             if votes:
-                data_frame.loc[canton.short_name][
-                    party.short_name.get(Languages.DEFAULT)
-                ] += votes
+                rows.append(
+                    canton_positions[
+                        party_in_municipal.get(
+                            Municipal.Keywords.CANTON_ID.value
+                        )
+                    ]
+                )
+                columns.append(
+                    party_positions[
+                        party_in_municipal.get(
+                            Municipal.Keywords.PARTY_ID.value
+                        )
+                    ]
+                )
+                values.append(votes)
+
+        votes = np.zeros(
+            (len(self.canton_table), len(self.party_table)), dtype=np.int64
+        )
+        np.add.at(votes, (rows, columns), values)
+        return votes
+
+    def read_canton_level(
+        self, data_frame: pd.DataFrame, file_path=Config.PARTIES_MUNICIPAL
+    ) -> pd.DataFrame:
+        votes = self.read_canton_level_array(file_path)
+        data_frame.loc[
+            self.canton_table.labels, self.party_table.labels
+        ] += votes
+        return data_frame
+
+    def read_canton_totals(
+        self, data_frame: pd.DataFrame, file_path=Config.PARTIES_NATIONAL
+    ) -> pd.DataFrame:
+        """
+        Reads the votes per canton published alongside the national results,
+        which does not require the municipal file.
+        """
+        votes = self.read_canton_level_array(
+            file_path, Party.Keywords.PARTIES_ON_CANTONS.value
+        )
+        data_frame.loc[
+            self.canton_table.labels, self.party_table.labels
+        ] += votes
+        return data_frame
+
+    def read_canton_elected(
+        self, data_frame: pd.DataFrame, file_path=Config.PARTIES_NATIONAL
+    ) -> pd.DataFrame:
+        """
+        Reads the number of elected members of every party per canton.
+        """
+        elected = self.read_canton_level_array(
+            file_path,
+            Party.Keywords.PARTIES_ON_CANTONS.value,
+            Party.Keywords.ELECTED.value,
+        )
+        data_frame.loc[
+            self.canton_table.labels, self.party_table.labels
+        ] += elected
+        return data_frame
 
+    @profiling.profiled()
+    def read_national_level(
+        self, data_frame: pd.DataFrame, file_path=Config.PARTIES_NATIONAL
+    ) -> pd.DataFrame:
+        votes = self.read_national_level_array(file_path)
+        data_frame.loc["total", self.party_table.labels] = votes
         return data_frame
 
-    def read_national_level(self, data_frame: pd.DataFrame) -> pd.DataFrame:
-        with open(Config.PARTIES_NATIONAL, "r") as f:
+    def read_national_level_array(
+        self, file_path=Config.PARTIES_NATIONAL
+    ) -> np.ndarray:
+        """
+        :return: votes per party ordered like the party index table
+        """
+        with open(file_path, "r") as f:
             self.data = json.load(f)
 
+        from tqdm import tqdm
+
+        votes = np.zeros(len(self.party_table), dtype=np.int64)
+        party_positions = self.party_table.positions
         for party_national in tqdm(
             self.data.get(Party.Keywords.PARTIES_ON_NATIONAL.value)
         ):
-            votes = party_national.get(Party.Keywords.VOTES.value)
-            party_id = party_national.get(Municipal.Keywords.PARTY_ID.value)
-            party = self.parties_dict.get(party_id)
-
-            if votes:
-                data_frame.loc["total"][
-                    party.short_name.get(Languages.DEFAULT)
-                ] = votes
-
-        return data_frame
+            party_votes = party_national.get(Party.Keywords.VOTES.value)
+            if party_votes:
+                votes[
+                    party_positions[
+                        party_national.get(Municipal.Keywords.PARTY_ID.value)
+                    ]
+                ] = party_votes
+        return votes
 
     def get_total_votes_for_party(
         self, data_frame: pd.DataFrame, parties
     ) -> pd.DataFrame:
-        columns = [p.short_name.get(Languages.DEFAULT) for p in parties]
+        columns = IndexTable.from_parties(parties).labels
         df = pd.DataFrame(index=["total", "percentage"], columns=columns)
-        for party in parties:
-            name = party.short_name.get(Languages.DEFAULT)
-            votes = data_frame[name].sum()
-            df[name]["total"] = votes
-            df[name]["percentage"] = 0.00
+        df.loc["total"] = data_frame[columns].sum().to_numpy()
+        df.loc["percentage"] = 0.00
         return df
 
 
+class IncrementalVotesParser:
+    """
+    Ingests successive snapshots (or delta files) of municipal results as they
+    are published on election night.
+
+    The parser remembers the last known votes of every party in every
+    municipal. A new snapshot is compared against this state and only the
+    differences are added to the canton and national data frames. Records
+    missing from a snapshot are considered unchanged, therefore a delta file
+    containing only the updated municipals can be applied the same way as a
+    full snapshot.
+
+    Every update appends the short names of the affected cantons to the
+    change feed, such that downstream apportionment only has to recompute
+    what actually moved.
+    """
+
+    def __init__(
+        self,
+        cantons_dict: Dict[int, Canton],
+        parties_dict: Dict[int, Party],
+        canton_data_frame: pd.DataFrame,
+        total_data_frame: pd.DataFrame,
+    ):
+        """
+        :param canton_data_frame: empty canton/party data frame as returned by
+        MetadataParser.get_empty_canton_party_data_frame
+        :param total_data_frame: empty total/party data frame as returned by
+        MetadataParser.get_empty_total_party_data_frame. Holds the sum of the
+        party votes over all cantons.
+        """
+        self.cantons_dict = cantons_dict
+        self.parties_dict = parties_dict
+        self.canton_table = IndexTable.from_cantons(cantons_dict.values())
+        self.party_table = IndexTable.from_parties(parties_dict.values())
+        self.canton_votes = canton_data_frame
+        self.total_votes = total_data_frame
+        self.municipal_votes = {}  # type: Dict[Tuple[int, int], int]
+        self.change_feed = []  # type: List[Set[str]]
+
+    def read(self, file_path=Config.PARTIES_MUNICIPAL) -> Set[str]:
+        """
+        Reads a snapshot or delta file of municipal results and applies it.
+        :return: short names of the cantons whose votes changed
+        """
+        with open(file_path, "r") as f:
+            data = json.load(f)
+
+        return self.apply(
+            data.get(Municipal.Keywords.PARTIES_IN_MUNICIPALS.value)
+        )
+
+    def apply(self, parties_in_municipals: List[Dict]) -> Set[str]:
+        """
+        Applies the municipal records of a snapshot to the canton and national
+        aggregates.
+        :param parties_in_municipals: records in the format of the
+        "partei_auf_gemeindeebene" section
+        :return: short names of the cantons whose votes changed
+        """
+        canton_positions = self.canton_table.positions
+        party_positions = self.party_table.positions
+        deltas = {}  # type: Dict[Tuple[int, int], int]
+        for party_in_municipal in parties_in_municipals:
+            municipal_id = party_in_municipal.get(Municipal.Keywords.ID.value)
+            canton_id = party_in_municipal.get(
+                Municipal.Keywords.CANTON_ID.value
+            )
+            party_id = party_in_municipal.get(Municipal.Keywords.PARTY_ID.value)
+            votes = party_in_municipal.get(Municipal.Keywords.VOTES.value) or 0
+
+            key = (municipal_id, party_id)
+            delta = votes - self.municipal_votes.get(key, 0)
+            if not delta:
+                continue
+            self.municipal_votes[key] = votes
+
+            cell = (canton_positions[canton_id], party_positions[party_id])
+            deltas[cell] = deltas.get(cell, 0) + delta
+
+        changed_cantons = set()
+        for (row, column), delta in deltas.items():
+            if not delta:
+                # changes in several municipals cancelled each other out
+                continue
+            # labels are only resolved for cells which actually changed
+            canton_name = self.canton_table.labels[row]
+            party_name = self.party_table.labels[column]
+            self.canton_votes.at[canton_name, party_name] += delta
+            self.total_votes.at["total", party_name] += delta
+            changed_cantons.add(canton_name)
+
+        _logger.debug(f"Snapshot changed {len(changed_cantons)} cantons")
+        self.change_feed.append(changed_cantons)
+        return changed_cantons
+
+    def apply_canton_status(self, cantons: List[Dict]) -> Set[str]:
+        """
+        Updates the counting progress of the cantons based on the "kantone"
+        section of a metadata snapshot.
+        :return: short names of the cantons whose status changed
+        """
+        changed_cantons = set()
+        for canton_data in cantons:
+            canton = self.cantons_dict.get(
+                canton_data.get(Canton.Keywords.ID.value)
+            )
+            status = canton_data.get(Canton.Keywords.CANTON_DONE.value) in (
+                True,
+                "yes",
+                "true",
+                "t",
+                "1",
+            )
+            municipals_done = canton_data.get(
+                Canton.Keywords.MUNICIPALS_DONE.value
+            )
+            if (
+                canton.status != status
+                or canton.municipals_done != municipals_done
+            ):
+                canton.status = status
+                canton.municipals_done = municipals_done
+                canton.municipals_not_done = canton_data.get(
+                    Canton.Keywords.MUNICIPALS_NOT_DONE.value
+                )
+                changed_cantons.add(canton.short_name)
+
+        return changed_cantons
+
+
+class CantonNameResolver:
+    """
+    Resolves canton names to cantons in constant time. The index contains the
+    official names (and each of their language variants, e.g. "Bern / Berne"),
+    the short names and the ALIASES in other languages. Names are normalized
+    before the lookup, therefore case, accents, whitespace and punctuation do
+    not matter ("st. gallen", "Neuchatel", "BASEL STADT").
+    """
+
+    ALIASES = {
+        "AG": ("Argovie", "Argovia"),
+        "AI": ("Appenzell Rhodes-Intérieures", "Appenzello Interno"),
+        "AR": ("Appenzell Rhodes-Extérieures", "Appenzello Esterno"),
+        "BE": ("Berna",),
+        "BL": ("Bâle-Campagne", "Basilea Campagna", "Baselland"),
+        "BS": ("Bâle-Ville", "Basilea Città"),
+        "FR": ("Friburgo",),
+        "GE": ("Genf", "Geneva", "Ginevra"),
+        "GL": ("Glaris", "Glarona"),
+        "GR": ("Grisons",),
+        "JU": ("Giura",),
+        "LU": ("Lucerne", "Lucerna"),
+        "NE": ("Neuenburg",),
+        "NW": ("Nidwald", "Nidvaldo"),
+        "OW": ("Obwald", "Obvaldo"),
+        "SG": ("Saint-Gall", "San Gallo", "Sankt Gallen"),
+        "SH": ("Schaffhouse", "Sciaffusa"),
+        "SO": ("Soleure", "Soletta"),
+        "SZ": ("Schwytz", "Svitto"),
+        "TG": ("Thurgovie", "Turgovia"),
+        "TI": ("Tessin",),
+        "VD": ("Waadt",),
+        "VS": ("Vallese",),
+        "ZG": ("Zoug", "Zugo"),
+        "ZH": ("Zurich", "Zurigo"),
+    }
+
+    def __init__(self, cantons: Iterable[Canton]):
+        self.index = {}  # type: Dict[str, Canton]
+        for canton in cantons:
+            names = [canton.name, canton.short_name]
+            names.extend(canton.name.split("/"))
+            names.extend(self.ALIASES.get(canton.short_name, ()))
+            for name in names:
+                self.index.setdefault(self.normalize(name), canton)
+
+    @staticmethod
+    def normalize(name: str) -> str:
+        name = unicodedata.normalize("NFKD", name)
+        return "".join(
+            character
+            for character in name.casefold()
+            if character.isalnum() and not unicodedata.combining(character)
+        )
+
+    def resolve(self, name: str) -> Optional[Canton]:
+        return self.index.get(self.normalize(name))
+
+    def short_name(self, name: str) -> Optional[str]:
+        canton = self.resolve(name)
+        return canton.short_name if canton else None
+
+    def short_names(self, names: Iterable[str]) -> Dict[str, Optional[str]]:
+        """
+        Resolves every distinct name once, e.g. for the index of a large
+        external table.
+        :return: mapping between the given names and canton short names
+        """
+        return {name: self.short_name(name) for name in set(names)}
+
+
 class EligibleVotersParser:
     """
     Uncomment ELIGIBLE_VOTERS in config before using this class.
@@ -224,13 +809,11 @@ class EligibleVotersParser:
         self.df = pd.read_csv(Config.ELIGIBLE_VOTERS, header=0, index_col=0)
         self.cantons_name_dict = cantons_name_dict
         self.cantons = cantons
+        self.resolver = CantonNameResolver(cantons)
         self.total_citizens = 0
 
     def exhaustive_search(self, keyword: str):
-        for canton in self.cantons:
-            if keyword in canton.name:
-                return canton.short_name
-        return None
+        return self.resolver.short_name(keyword)
 
     def read(self) -> pd.DataFrame:
         """
@@ -243,17 +826,11 @@ class EligibleVotersParser:
             if "Total" in name:
                 self.total_citizens = self.df.loc[name, "Wohnbevoelkerung"]
                 continue
-            if name in self.cantons_name_dict:
-                update_index.update(
-                    {name: self.cantons_name_dict.get(name).short_name}
-                )
+            new_name = self.resolver.short_name(name)
+            if new_name:
+                update_index.update({name: new_name})
             else:
-                _logger.debug(f"Searching list for {name}...")
-                new_name = self.exhaustive_search(name)
-                if new_name:
-                    update_index.update({name: new_name})
-                else:
-                    _logger.error(f"No canton found for name: {name}.")
+                _logger.error(f"No canton found for name: {name}.")
 
         self.df.rename(index=update_index, inplace=True)
         return self.df
@@ -292,13 +869,11 @@ class CantonSeatsParser:
         self.df = pd.read_csv(Config.CANTON_SEATS, header=0, index_col=0)
         self.cantons_name_dict = cantons_name_dict
         self.cantons = cantons
+        self.resolver = CantonNameResolver(cantons)
         self.new_cantons_name_dict = {}
 
     def exhaustive_search(self, keyword: str):
-        for canton in self.cantons:
-            if keyword in canton.name:
-                return canton.short_name
-        return None
+        return self.resolver.short_name(keyword)
 
     def read(self) -> pd.DataFrame:
         """
@@ -310,26 +885,15 @@ class CantonSeatsParser:
         for name in self.df.index:
             if "Total" in name:
                 continue
-            if name in self.cantons_name_dict:
-                update_index.update(
-                    {name: self.cantons_name_dict.get(name).short_name}
-                )
-                self.new_cantons_name_dict.update(
-                    {name: self.cantons_name_dict.get(name).short_name}
-                )
+            new_name = self.resolver.short_name(name)
+            if new_name:
+                update_index.update({name: new_name})
+                self.new_cantons_name_dict.update({name: new_name})
             else:
-                _logger.debug(f"Searching list for {name}...")
-                new_name = self.exhaustive_search(name)
-                if new_name:
-                    update_index.update({name: new_name})
-                    self.new_cantons_name_dict.update({name: new_name})
-                else:
-                    _logger.error(f"No canton found for name: {name}.")
+                _logger.error(f"No canton found for name: {name}.")
 
         self.df.rename(index=update_index, inplace=True)
         self.df = self.df.transpose()
-        self.new_cantons_name_dict.update({"Valais": "VS"})
-        self.new_cantons_name_dict.update({"Fribourg": "FR"})
         return self.df
 
 
@@ -367,6 +931,8 @@ def main():
         percentages.append(percentage)
         total_votes_per_party[party]["percentage"] = percentage
 
+    from plotter import party_pie_plot
+
     party_pie_plot(percentages, labels, legend)
 
     dhondt = Dhondt()
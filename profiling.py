@@ -0,0 +1,215 @@
+"""
+Spans measuring where the wall time goes, e.g. in the parsers, the
+apportionment loops, BAZI and the plotter.
+
+Profiling is disabled unless the environment variable BIPROP_PROFILE is set
+or enable() is called, either way a summary is logged at exit. A disabled
+span or debug message costs a single attribute lookup, nothing is timed or
+formatted.
+
+    BIPROP_PROFILE=1 python pipeline.py            # logs a summary at exit
+    BIPROP_PROFILE=trace.json python pipeline.py   # plus a Chrome trace
+
+The Chrome trace can be opened with chrome://tracing or Perfetto.
+"""
+import atexit
+import functools
+import json
+import os
+import threading
+import time
+from typing import Callable, Dict, List
+
+import loguru
+
+_logger = loguru.logger
+
+ENVIRONMENT_VARIABLE = "BIPROP_PROFILE"
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ("profiler", "name", "args", "start")
+
+    def __init__(self, profiler: "Profiler", name: str, args: Dict):
+        self.profiler = profiler
+        self.name = name
+        self.args = args
+        self.start = 0
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profiler.record(
+            self.name, self.start, time.perf_counter_ns(), self.args
+        )
+        return False
+
+
+class Profiler:
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self.events = []  # type: List[Dict]
+        self._lock = threading.Lock()
+        self._origin = time.perf_counter_ns()
+
+    def span(self, name: str, **args):
+        """
+        Times the enclosed block:
+
+            with profiler.span("lower apportionment", parties=10):
+                ...
+        """
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, args)
+
+    def record(self, name: str, start: int, end: int, args: Dict = None):
+        """
+        :param start: perf_counter_ns at the start of the span
+        :param end: perf_counter_ns at the end of the span
+        """
+        event = {
+            "name": name,
+            "ph": "X",
+            "ts": (start - self._origin) / 1000,
+            "dur": (end - start) / 1000,
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+        }
+        if args:
+            event["args"] = {key: str(value) for key, value in args.items()}
+        with self._lock:
+            self.events.append(event)
+
+    def debug(self, message: str, *args) -> None:
+        """
+        Formats message with args and logs it only if profiling is enabled,
+        the message is recorded as instant event of the trace as well.
+        """
+        if not self.enabled:
+            return
+        message = message.format(*args)
+        _logger.debug(message)
+        event = {
+            "name": message,
+            "ph": "i",
+            "s": "t",
+            "ts": (time.perf_counter_ns() - self._origin) / 1000,
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+        }
+        with self._lock:
+            self.events.append(event)
+
+    def reset(self) -> None:
+        with self._lock:
+            self.events = []
+            self._origin = time.perf_counter_ns()
+
+    def summary(self) -> List[Dict]:
+        """
+        :return: count and durations in seconds per span name, sorted by the
+        total duration
+        """
+        spans = {}  # type: Dict[str, Dict]
+        with self._lock:
+            events = [event for event in self.events if event["ph"] == "X"]
+        for event in events:
+            seconds = event["dur"] / 1e6
+            span = spans.setdefault(
+                event["name"],
+                {"name": event["name"], "count": 0, "total": 0.0, "max": 0.0},
+            )
+            span["count"] += 1
+            span["total"] += seconds
+            span["max"] = max(span["max"], seconds)
+        for span in spans.values():
+            span["mean"] = span["total"] / span["count"]
+        return sorted(spans.values(), key=lambda s: s["total"], reverse=True)
+
+    def format_summary(self) -> str:
+        lines = [f"{'span':<40} {'count':>7} {'total s':>10} {'mean s':>10}"]
+        for span in self.summary():
+            lines.append(
+                f"{span['name'][:40]:<40} {span['count']:>7} "
+                f"{span['total']:>10.4f} {span['mean']:>10.6f}"
+            )
+        return "\n".join(lines)
+
+    def write_chrome_trace(self, file_path) -> None:
+        with self._lock:
+            events = list(self.events)
+        with open(file_path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+
+profiler = Profiler(bool(os.environ.get(ENVIRONMENT_VARIABLE)))
+
+span = profiler.span
+debug = profiler.debug
+
+
+def profiled(name: str = None) -> Callable:
+    """
+    Decorator timing every call of a function as span name, which defaults
+    to the qualified name of the function.
+    """
+
+    def decorator(function):
+        span_name = name or function.__qualname__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not profiler.enabled:
+                return function(*args, **kwargs)
+            with _Span(profiler, span_name, {}):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def enable() -> None:
+    """
+    Enables profiling, the summary is logged at exit as with BIPROP_PROFILE.
+    """
+    profiler.enabled = True
+    _register_report()
+
+
+def disable() -> None:
+    profiler.enabled = False
+
+
+def _report_at_exit() -> None:
+    if not profiler.events:
+        return
+    _logger.info(f"Profile summary\n{profiler.format_summary()}")
+    file_path = os.environ.get(ENVIRONMENT_VARIABLE, "")
+    if file_path.endswith(".json"):
+        profiler.write_chrome_trace(file_path)
+        _logger.info(f"Chrome trace written to {file_path}")
+
+
+def _register_report() -> None:
+    # unregistering first keeps a single report if enabled repeatedly
+    atexit.unregister(_report_at_exit)
+    atexit.register(_report_at_exit)
+
+
+if profiler.enabled:
+    _register_report()
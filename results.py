@@ -0,0 +1,323 @@
+"""
+Binary file of the seats and divisors of many scenarios.
+
+    python results.py pack results.seats data/*-results.csv
+    python results.py unpack results.seats <output directory>
+
+Layout, little endian:
+
+    magic "BPSEATS1", index offset (uint64), index length (uint64)
+    per scenario: seats (int16, parties x districts, row major), optionally
+    district and party divisors (float64), every block 8 byte aligned
+    index: json with the label tables and the offsets of every scenario
+
+The index names every label table (parties, districts) once, scenarios
+sharing labels refer to the same table. A reader maps the file into memory
+and only reads the index, the arrays of a scenario are views into the
+mapped file which are read on access.
+"""
+import argparse
+import json
+import os
+import struct
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import loguru
+import numpy as np
+import pandas as pd
+
+from biproportional import BaziResult
+
+_logger = loguru.logger
+
+MAGIC = b"BPSEATS1"
+PREAMBLE = struct.Struct("<8sQQ")
+SEATS_DTYPE = np.dtype("<i2")
+DIVISORS_DTYPE = np.dtype("<f8")
+ALIGNMENT = 8
+
+
+class ResultsWriter:
+    """
+    Appends scenarios to a results file, the index is written on close:
+
+        with ResultsWriter("results.seats") as writer:
+            writer.add("biprop", seats, district_divisors, party_divisors)
+    """
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.f = open(file_path, "wb")
+        self.f.write(PREAMBLE.pack(MAGIC, 0, 0))
+        self.label_tables = []  # type: List[List[str]]
+        self._label_positions = {}  # type: Dict[Tuple[str, ...], int]
+        self.scenarios = []  # type: List[Dict]
+
+    def __enter__(self) -> "ResultsWriter":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def _label_table(self, labels) -> int:
+        labels = tuple(str(label) for label in labels)
+        if labels not in self._label_positions:
+            self._label_positions[labels] = len(self.label_tables)
+            self.label_tables.append(list(labels))
+        return self._label_positions[labels]
+
+    def _write_array(self, array: np.ndarray) -> int:
+        """
+        :return: offset of array in the file
+        """
+        padding = -self.f.tell() % ALIGNMENT
+        self.f.write(b"\0" * padding)
+        offset = self.f.tell()
+        self.f.write(np.ascontiguousarray(array).tobytes())
+        return offset
+
+    def add(
+        self,
+        name: str,
+        seats: pd.DataFrame,
+        district_divisors: pd.Series = None,
+        party_divisors: pd.Series = None,
+    ) -> None:
+        """
+        :param seats: parties as rows and districts as columns, whole numbers
+        of seats without missing values
+        """
+        limits = np.iinfo(SEATS_DTYPE)
+        values = seats.to_numpy(dtype=np.float64)
+        if not np.isfinite(values).all():
+            _logger.error(f"Seats of {name} contain missing values.")
+            raise ValueError
+        if (values != np.round(values)).any():
+            _logger.error(f"Seats of {name} contain fractional values.")
+            raise ValueError
+        if values.size and (
+            values.min() < limits.min or values.max() > limits.max
+        ):
+            _logger.error(f"Seats of {name} exceed the range of int16.")
+            raise ValueError
+        if any(scenario["name"] == name for scenario in self.scenarios):
+            _logger.error(f"Scenario {name} already exists.")
+            raise ValueError
+
+        scenario = {
+            "name": name,
+            "parties": self._label_table(seats.index),
+            "districts": self._label_table(seats.columns),
+            "seats": self._write_array(values.astype(SEATS_DTYPE)),
+        }
+        if district_divisors is not None:
+            scenario["district_divisors"] = self._write_array(
+                district_divisors.reindex(seats.columns)
+                .to_numpy()
+                .astype(DIVISORS_DTYPE)
+            )
+        if party_divisors is not None:
+            scenario["party_divisors"] = self._write_array(
+                party_divisors.reindex(seats.index)
+                .to_numpy()
+                .astype(DIVISORS_DTYPE)
+            )
+        self.scenarios.append(scenario)
+
+    def add_result(self, name: str, result: BaziResult) -> None:
+        self.add(
+            name, result.seats, result.district_divisors, result.party_divisors
+        )
+
+    def close(self) -> None:
+        if self.f.closed:
+            return
+        index = json.dumps(
+            {"labels": self.label_tables, "scenarios": self.scenarios}
+        ).encode("utf-8")
+        index_offset = self.f.tell()
+        self.f.write(index)
+        self.f.seek(0)
+        self.f.write(PREAMBLE.pack(MAGIC, index_offset, len(index)))
+        self.f.close()
+
+
+class ResultsFile:
+    """
+    Reads single scenarios of a results file without loading the others:
+
+        with ResultsFile("results.seats") as results:
+            seats = results.seats("biprop")
+    """
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        with open(file_path, "rb") as f:
+            magic, index_offset, index_length = PREAMBLE.unpack(
+                f.read(PREAMBLE.size)
+            )
+            if magic != MAGIC or not index_offset:
+                _logger.error(f"{file_path} is not a complete results file.")
+                raise ValueError
+            f.seek(index_offset)
+            index = json.loads(f.read(index_length).decode("utf-8"))
+        self.labels = index["labels"]  # type: List[List[str]]
+        self.scenarios = {
+            scenario["name"]: scenario for scenario in index["scenarios"]
+        }  # type: Dict[str, Dict]
+        self._data = None  # type: Optional[np.memmap]
+        self.closed = False
+
+    def __enter__(self) -> "ResultsFile":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def close(self) -> None:
+        """
+        Releases the mapping of the file. Arrays returned by seats_array and
+        the divisors are views, which keep it mapped until they are dropped.
+        """
+        self._data = None
+        self.closed = True
+
+    @property
+    def data(self) -> np.memmap:
+        if self.closed:
+            _logger.error(f"{self.file_path} is closed.")
+            raise ValueError
+        if self._data is None:
+            self._data = np.memmap(self.file_path, dtype=np.uint8, mode="r")
+        return self._data
+
+    @property
+    def names(self) -> List[str]:
+        return list(self.scenarios)
+
+    def __len__(self) -> int:
+        return len(self.scenarios)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.scenarios
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.scenarios)
+
+    def _scenario(self, name: str) -> Dict:
+        if name not in self.scenarios:
+            _logger.error(f"Unknown scenario {name}.")
+            raise KeyError(name)
+        return self.scenarios[name]
+
+    def _array(self, offset: int, dtype: np.dtype, shape) -> np.ndarray:
+        count = int(np.prod(shape))
+        return np.frombuffer(
+            self.data, dtype=dtype, count=count, offset=offset
+        ).reshape(shape)
+
+    def seats_array(self, name: str) -> np.ndarray:
+        """
+        :return: read only view of the seats of shape (parties, districts)
+        """
+        scenario = self._scenario(name)
+        shape = (
+            len(self.labels[scenario["parties"]]),
+            len(self.labels[scenario["districts"]]),
+        )
+        return self._array(scenario["seats"], SEATS_DTYPE, shape)
+
+    def seats(self, name: str) -> pd.DataFrame:
+        """
+        :return: parties as rows and districts as columns, the layout of
+        data/biprop-results.csv
+        """
+        scenario = self._scenario(name)
+        return pd.DataFrame(
+            data=self.seats_array(name).astype(int),
+            index=self.labels[scenario["parties"]],
+            columns=self.labels[scenario["districts"]],
+        )
+
+    def _divisors(self, name: str, key: str, labels: str):
+        scenario = self._scenario(name)
+        if key not in scenario:
+            return None
+        index = self.labels[scenario[labels]]
+        return pd.Series(
+            data=self._array(scenario[key], DIVISORS_DTYPE, (len(index),)),
+            index=index,
+        )
+
+    def district_divisors(self, name: str) -> Optional[pd.Series]:
+        return self._divisors(name, "district_divisors", "districts")
+
+    def party_divisors(self, name: str) -> Optional[pd.Series]:
+        return self._divisors(name, "party_divisors", "parties")
+
+    def __getitem__(self, name: str) -> BaziResult:
+        return BaziResult(
+            self.seats(name),
+            self.district_divisors(name),
+            self.party_divisors(name),
+        )
+
+    def to_csv(self, name: str, file_path) -> None:
+        self.seats(name).to_csv(file_path)
+
+    def export_csv(self, output_dir) -> List[str]:
+        """
+        Writes the seats of every scenario to <name>-results.csv.
+        :return: paths of the written files
+        """
+        file_paths = []
+        for name in self.scenarios:
+            file_path = os.path.join(output_dir, f"{name}-results.csv")
+            self.to_csv(name, file_path)
+            file_paths.append(file_path)
+        return file_paths
+
+
+def scenario_name(csv_path) -> str:
+    """
+    :return: name of a results csv, e.g. biprop for data/biprop-results.csv
+    """
+    name = os.path.splitext(os.path.basename(csv_path))[0]
+    return name[: -len("-results")] if name.endswith("-results") else name
+
+
+def pack_csv(file_path, csv_paths: List[str]) -> None:
+    with ResultsWriter(file_path) as writer:
+        for csv_path in csv_paths:
+            writer.add(
+                scenario_name(csv_path), pd.read_csv(csv_path, index_col=0)
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__.strip(),
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    commands = parser.add_subparsers(dest="command")
+    pack = commands.add_parser("pack", help="csv files to a results file")
+    pack.add_argument("file")
+    pack.add_argument("csv", nargs="+")
+    unpack = commands.add_parser("unpack", help="results file to csv files")
+    unpack.add_argument("file")
+    unpack.add_argument("output_dir")
+    args = parser.parse_args()
+
+    if args.command == "pack":
+        pack_csv(args.file, args.csv)
+    elif args.command == "unpack":
+        with ResultsFile(args.file) as results:
+            results.export_csv(args.output_dir)
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
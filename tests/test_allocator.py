@@ -1,7 +1,21 @@
 from unittest import TestCase
 
-from allocator import PukelsheimLowerApportionment, PukelsheimUpperApportionment
+import numpy as np
+import pandas as pd
+
+from allocator import (
+    BiproportionalApportionment,
+    DivisorMethod,
+    HagenbachBischoffApportionment,
+    ListConnectionApportionment,
+    NewZurichApportionment,
+    PukelsheimLowerApportionment,
+    PukelsheimUpperApportionment,
+    SeparateApportionment,
+)
+from datastructures import IndexTable, ListConnections
 from prepocessor import (
+    Config,
     MetadataParser,
     VotesParser,
     CantonSeatsParser,
@@ -99,3 +113,191 @@ class TestPukelsheimUpperApportionment(TestCase):
         pku = PukelsheimUpperApportionment(votes_cantonal, canton_seats_df)
         upper_apportionment = pku.run()
         self.assertEqual(200, upper_apportionment.loc["seats"].sum())
+
+
+class TestDivisorMethod(TestCase):
+    def test_apportion(self):
+        votes = np.array([[14400, 12000, 4500], [10100, 10000, 9900]])
+        seats, divisors = DivisorMethod().apportion(votes, [6, 5])
+        self.assertEqual([[3, 2, 1], [2, 2, 1]], seats.tolist())
+        for row, divisor, expected in zip(votes, divisors, seats):
+            self.assertEqual(
+                expected.tolist(),
+                DivisorMethod().round(row / divisor).tolist(),
+            )
+
+        seats, _divisors = DivisorMethod(DivisorMethod.DOWNWARD).apportion(
+            votes, [6, 5]
+        )
+        self.assertEqual([[3, 2, 1], [2, 2, 1]], seats.tolist())
+
+
+class TestNewZurichApportionment(TestCase):
+    @staticmethod
+    def _get_real_data():
+        meta = MetadataParser()
+        meta.read()
+        canton_seats = CantonSeatsParser(
+            meta.cantons_name_dict, meta.cantons
+        ).read()
+        canton_seats.drop("Total", axis=1, inplace=True)
+
+        vote = VotesParser(meta.cantons_dict, meta.parties_dict)
+        votes = vote.read_canton_totals(
+            meta.get_empty_canton_party_data_frame()
+        )
+        votes.drop("2nd round", axis=1, inplace=True)
+        return votes, canton_seats.loc["seats"].to_dict()
+
+    def test_test_data(self):
+        votes = pd.DataFrame(
+            TestPukelsheimLowerApportionment._get_test_data()[2]
+        )
+        districts = {"WK1": 6, "WK2": 5, "WK3": 4}
+        for engine in (BiproportionalApportionment, NewZurichApportionment):
+            seats = engine(votes, districts).run()
+            self.assertEqual([6, 5, 4], seats.sum(axis=1).to_list())
+            self.assertEqual([6, 5, 4], seats.sum().to_list())
+
+        seats = SeparateApportionment(votes, districts).run()
+        self.assertEqual([3, 2, 1], seats["WK1"].to_list())
+
+    def test_real_data(self):
+        votes, canton_seats = self._get_real_data()
+        for engine, file_name, drop in [
+            (NewZurichApportionment, "nzz-results.csv", ["Others"]),
+            (NewZurichApportionment, "others-results.csv", []),
+            (BiproportionalApportionment, "biprop-results.csv", ["Others"]),
+        ]:
+            expected = pd.read_csv(Config.DATA_DIR / file_name, index_col=0)
+            seats = engine(votes.drop(drop, axis=1), canton_seats).run()
+            self.assertEqual(200, seats.to_numpy().sum())
+            pd.testing.assert_frame_equal(
+                expected,
+                seats.loc[expected.index, expected.columns],
+                check_names=False,
+            )
+
+
+class TestHagenbachBischoffApportionment(TestCase):
+    def test_real_data(self):
+        votes, canton_seats = TestNewZurichApportionment._get_real_data()
+        seats = HagenbachBischoffApportionment(votes, canton_seats).run()
+        self.assertEqual(canton_seats, seats.sum().to_dict())
+        self.assertEqual(1, seats.loc[votes.loc["UR"].idxmax(), "UR"])
+
+        # without the list connections the largest party profits, with them
+        # the published result follows
+        original = TestListConnectionApportionment.original_totals()
+        totals = TestListConnectionApportionment.party_totals(seats)
+        self.assertGreater(totals["SVP"], original["SVP"])
+        meta = MetadataParser()
+        status_quo = ListConnectionApportionment(
+            votes,
+            canton_seats,
+            meta.list_connections,
+            meta.canton_table,
+            meta.party_table,
+        ).run()
+        pd.testing.assert_series_equal(
+            original,
+            TestListConnectionApportionment.party_totals(status_quo).loc[
+                original.index
+            ],
+        )
+
+    def test_batch(self):
+        votes, canton_seats = TestNewZurichApportionment._get_real_data()
+        scenarios = np.stack([votes.to_numpy(), votes.to_numpy()[::-1]])
+        seats = np.array([canton_seats[canton] for canton in votes.index])
+        batch = HagenbachBischoffApportionment.apportion_batch(
+            scenarios, seats
+        )
+
+        self.assertEqual((2, 26, 19), batch.shape)
+        single = HagenbachBischoffApportionment(votes, canton_seats).run()
+        np.testing.assert_array_equal(single.to_numpy().T, batch[0])
+        np.testing.assert_array_equal(seats, batch[0].sum(axis=1))
+        np.testing.assert_array_equal(seats, batch[1].sum(axis=1))
+
+
+class TestListConnectionApportionment(TestCase):
+    @staticmethod
+    def original_totals() -> pd.Series:
+        original = pd.read_csv(
+            Config.DATA_DIR / "original-results.csv", index_col=0
+        )
+        return original["Total"]
+
+    @staticmethod
+    def party_totals(seats: pd.DataFrame) -> pd.Series:
+        """
+        Sums the seats like original-results.csv, which counts the LPS to the
+        FDP.
+        """
+        totals = seats.sum(axis=1).rename({"LPS": "FDP", "Lega": "LEGA"})
+        return totals.groupby(level=0).sum().rename("Total")
+
+    def test_connection(self):
+        votes = pd.DataFrame(
+            {"A": [6000], "B": [1900], "C": [1800]}, index=["ZH"]
+        )
+        canton_table = IndexTable([1], ["ZH"])
+        party_table = IndexTable([1, 2, 3], ["A", "B", "C"])
+        connections = ListConnections()
+
+        engine = ListConnectionApportionment(
+            votes, {"ZH": 3}, connections, canton_table, party_table
+        )
+        self.assertEqual([3, 0, 0], engine.run()["ZH"].to_list())
+
+        # B and C together outweigh the third seat of A
+        connections.add(1, "2", 2, "A")
+        connections.add(1, "3", 3, "A", "A1")
+        engine = ListConnectionApportionment(
+            votes, {"ZH": 3}, connections, canton_table, party_table
+        )
+        self.assertEqual([2, 1, 0], engine.run()["ZH"].to_list())
+
+        # the votes of C are split among its lists in both connections
+        connections.add(1, "1", 1, "B")
+        connections.add(1, "4", 3, "B")
+        engine = ListConnectionApportionment(
+            votes, {"ZH": 3}, connections, canton_table, party_table
+        )
+        self.assertEqual([2, 1, 0], engine.run()["ZH"].to_list())
+        self.assertEqual([0, 1, 2, 2], engine.list_parties.tolist())
+        self.assertEqual([0.5, 0.5], engine.list_shares[0, 2:].tolist())
+
+    def test_real_data(self):
+        votes, canton_seats = TestNewZurichApportionment._get_real_data()
+        meta = MetadataParser()
+        engine = ListConnectionApportionment(
+            votes,
+            canton_seats,
+            meta.list_connections,
+            meta.canton_table,
+            meta.party_table,
+        )
+        seats = engine.run()
+        self.assertEqual(canton_seats, seats.sum().to_dict())
+
+        # the alliances reproduce the published result of every canton
+        vote = VotesParser(meta.cantons_dict, meta.parties_dict)
+        elected = vote.read_canton_elected(
+            meta.get_empty_canton_party_data_frame()
+        )
+        pd.testing.assert_frame_equal(
+            elected.drop("2nd round", axis=1).transpose().astype(int),
+            seats.astype(int),
+        )
+        original = self.original_totals()
+        pd.testing.assert_series_equal(
+            original, self.party_totals(seats).loc[original.index]
+        )
+
+        batch = engine.apportion_batch(
+            np.stack([votes.to_numpy(), votes.to_numpy() * 2])
+        )
+        np.testing.assert_array_equal(seats.to_numpy().T, batch[0])
+        np.testing.assert_array_equal(batch[0], batch[1])
@@ -0,0 +1,118 @@
+import json
+import os
+import tempfile
+from unittest import TestCase
+
+import pandas as pd
+
+from allocator import BiproportionalApportionment
+from benchmark import (
+    BenchmarkHarness,
+    Engine,
+    Problem,
+    bazi_engines,
+    generated_problem,
+    native_engines,
+    run_native,
+    stand_in_engines,
+    write_report,
+)
+
+
+def _get_test_problem():
+    votes = pd.DataFrame(
+        {
+            "A": {"WK1": 14400, "WK2": 10100, "WK3": 6400},
+            "B": {"WK1": 12000, "WK2": 10000, "WK3": 6000},
+            "C": {"WK1": 4500, "WK2": 9900, "WK3": 5000},
+        }
+    )
+    return Problem("test", votes, {"WK1": 6, "WK2": 5, "WK3": 4})
+
+
+def _run_wrong(problem: Problem) -> pd.DataFrame:
+    seats = run_native(problem, BiproportionalApportionment)
+    seats.iloc[0, 0] += 1
+    return seats
+
+
+class TestBenchmarkHarness(TestCase):
+    def test_engines_agree(self):
+        engines = native_engines()
+        report = BenchmarkHarness(engines, repeats=2, timeout=60).run(
+            [_get_test_problem()]
+        )
+        self.assertEqual([], report["mismatches"])
+        self.assertEqual(len(engines), len(report["results"]))
+        for result in report["results"]:
+            self.assertEqual("ok", result["status"], result)
+            self.assertTrue(result["agrees"])
+            self.assertEqual(2, len(result["latency"]["samples"]))
+
+        # the Pukelsheim engine is not run on generated problems
+        report = BenchmarkHarness(engines, repeats=1, timeout=60).run(
+            [generated_problem(5, 4, seed=1)]
+        )
+        self.assertEqual([], report["mismatches"])
+        statuses = {r["engine"]: r["status"] for r in report["results"]}
+        self.assertEqual("skipped", statuses.pop("pukelsheim"))
+        self.assertEqual({"ok"}, set(statuses.values()))
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file_path = os.path.join(tmp_dir, "report.json")
+            write_report(report, file_path)
+            with open(file_path, "r") as f:
+                self.assertEqual(report["problems"], json.load(f)["problems"])
+
+    def test_bazi_agrees(self):
+        bazi_jar = os.environ.get("BAZI_JAR")
+        if not bazi_jar:
+            self.skipTest("BAZI_JAR does not point to a bazi.jar")
+        engines = native_engines() + bazi_engines(bazi_binary_path=bazi_jar)
+        report = BenchmarkHarness(engines, repeats=1).run(
+            [_get_test_problem(), generated_problem(5, 4, seed=1)]
+        )
+        self.assertEqual([], report["mismatches"])
+
+    def test_stand_in_self_check(self):
+        # the native stand-in wraps the native engines, agreeing only
+        # checks the BAZI input and output handling
+        engines = native_engines() + stand_in_engines()
+        report = BenchmarkHarness(engines, repeats=1, timeout=60).run(
+            [_get_test_problem()]
+        )
+        self.assertEqual([], report["mismatches"])
+        for result in report["results"]:
+            self.assertEqual("ok", result["status"], result)
+        self.assertEqual(
+            3,
+            sum(
+                r["engine"].startswith("stand-in-self-check-")
+                for r in report["results"]
+            ),
+        )
+
+    def test_mismatch(self):
+        engines = [
+            Engine(
+                "native-biprop",
+                "biprop",
+                run_native,
+                engine_class=BiproportionalApportionment,
+            ),
+            Engine("wrong", "biprop", _run_wrong),
+        ]
+        report = BenchmarkHarness(engines, repeats=1).run(
+            [_get_test_problem()]
+        )
+        self.assertEqual(
+            [
+                {
+                    "problem": "test",
+                    "mode": "biprop",
+                    "engines": ["native-biprop", "wrong"],
+                    "cells": 1,
+                }
+            ],
+            report["mismatches"],
+        )
@@ -1,10 +1,30 @@
-import re
+import asyncio
+import gzip
+import io
+import os
+import subprocess
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict
 from unittest import TestCase
 
 import pandas as pd
 
-from biproportional import District, BiProportional
+from biproportional import (
+    AsyncBaziRunner,
+    District,
+    BiProportional,
+    BaziBatch,
+    BaziCache,
+    BaziCacheEntry,
+    BaziOutputParser,
+    BaziScenario,
+    BaziWorker,
+    BaziWorkerPool,
+    BaziWriter,
+    bazi_command,
+)
 from prepocessor import MetadataParser, CantonSeatsParser, VotesParser
 
 
@@ -47,47 +67,455 @@ class TestBiProportional(TestCase):
         bip.bazi_str_to_file(output_str)
         res = bip.run_bazi()
 
-        lines = res.split("\n")
-        cleaned_result = lines[29:47]
-
-        for i, line in enumerate(cleaned_result):
-            s = line.replace('"', "")
-            cleaned_result[i] = re.sub(r"[\s]+", " ", s)
-
-        del cleaned_result[1]  # remove seats per district
-        del cleaned_result[len(cleaned_result) - 1]  # remove district divisors
-
-        columns = []
-        data = {}
-        for i, line in enumerate(cleaned_result):
-            if i == 0:
-                line = line.replace("DivStd", "")
-                line = line.replace("Divisor", "")
-                tmp_columns = line.split(" ")
-                for tmp_column in tmp_columns:
-                    if tmp_column != " " and tmp_column != "":
-                        columns.append(tmp_column)
-            else:
-                # process data for parties
-                tmp_data = line.split(" ")
-                party_shortname = tmp_data[0]
-                del tmp_data[0]  # delete party name
-                del tmp_data[0]  # delete toatl seats for party
-                if not tmp_data[len(tmp_data) - 1]:
-                    # empty string at end
-                    del tmp_data[len(tmp_data) - 1]
-                del tmp_data[len(tmp_data) - 1]  # delete party divisor
-
-                party_seats = []
-                for i, data_value in enumerate(tmp_data):
-                    # now remove every odd entry -> unneeded data
-                    if i % 2 == 1 and data_value != " ":
-                        try:
-                            party_seats.append(int(data_value))
-                        except ValueError as e:
-                            print(str(e))
-
-                data.update({party_shortname: party_seats})
-
-        df = pd.DataFrame.from_dict(data=data, orient="index", columns=columns)
-        df.to_csv("others-results.csv")
+        # the NZZ output contains the biproportional seats per canton
+        result = bip.parse_output(res)[-1]
+        self.assertEqual(200, result.seats.values.sum())
+        result.seats.to_csv("others-results.csv")
+
+
+def _get_test_districts():
+    return [
+        District("WK1", 6, {"A": 14400, "B": 12000, "C": 4500}),
+        District("WK2", 5, {"A": 10100, "B": 10000, "C": 9900}),
+        District("WK3", 4, {"A": 6400, "B": 6000, "C": 5000}),
+    ]
+
+
+class TestBaziWorker(TestCase):
+    def setUp(self):
+        fd, self.input_file_path = tempfile.mkstemp(suffix=".bazi")
+        os.close(fd)
+        self.bip = BiProportional(
+            _get_test_districts(), self.input_file_path, "bazi.jar"
+        )
+
+    def tearDown(self):
+        os.remove(self.input_file_path)
+
+    def test_successive_inputs(self):
+        with BaziWorker.stand_in() as worker:
+            pid = worker.process.pid
+            for method in BiProportional.Methods:
+                self.bip.bazi_str_to_file(
+                    self.bip.to_bazi_format(
+                        f"Test {method}",
+                        method,
+                        district_option=BiProportional.DistrictOptions.SEPERATE,
+                    )
+                )
+                res = self.bip.run_bazi(write_to_file=False, worker=worker)
+                self.assertIn(f"Test {method}", res)
+                self.assertIn('"WK1"', res)
+            # all calculations were served by the same process
+            self.assertEqual(pid, worker.process.pid)
+
+    def test_failed_calculation(self):
+        with BaziWorker.stand_in() as worker:
+            with self.assertRaises(ValueError):
+                worker.calculate(self.bip.to_bazi_format())
+            # the worker survives failed calculations
+            res = worker.calculate(
+                self.bip.to_bazi_format(
+                    district_option=BiProportional.DistrictOptions.SEPERATE
+                )
+            )
+            self.assertIn('"A" "7"', res)
+
+    def test_pool(self):
+        input_string = self.bip.to_bazi_format(
+            district_option=BiProportional.DistrictOptions.SEPERATE
+        )
+        with BaziWorkerPool.stand_in(2) as pool:
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                results = list(
+                    executor.map(pool.calculate, [input_string] * 8)
+                )
+        self.assertEqual(1, len(set(results)))
+
+
+class TestBaziBatch(TestCase):
+    def test_run_batch(self):
+        districts = _get_test_districts()
+        variant = _get_test_districts()
+        variant[0].party_votes["C"] = 40000
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            batch = BaziBatch(os.path.join(tmp_dir, "batch.bazi"), "bazi.jar")
+            for method in BiProportional.Methods:
+                batch.add(
+                    BaziScenario(
+                        f"Scenario {method}",
+                        districts,
+                        method,
+                        BiProportional.DistrictOptions.SEPERATE,
+                    )
+                )
+            batch.add(
+                BaziScenario(
+                    "Variant",
+                    variant,
+                    district_option=BiProportional.DistrictOptions.SEPERATE,
+                )
+            )
+            with self.assertRaises(ValueError):
+                batch.add(BaziScenario("Variant", variant))
+
+            input_string = batch.to_bazi_format()
+            self.assertEqual(3, input_string.count("=TITEL="))
+            self.assertEqual(1, input_string.count("=END="))
+
+            with BaziWorker.stand_in() as worker:
+                results = batch.run(worker)
+
+        self.assertEqual(
+            ["Scenario DivStd", "Scenario DivAbr", "Variant"], list(results)
+        )
+        for titel, output in results.items():
+            self.assertIn(titel, output.splitlines()[0])
+            self.assertEqual(1, output.count('"Divisor" ""'))
+        self.assertIn('"C" "6"', results["Variant"])
+
+    def test_split_output_nested_titles(self):
+        districts = _get_test_districts()
+        variant = _get_test_districts()
+        variant[0].party_votes["C"] = 40000
+
+        seperate = BiProportional.DistrictOptions.SEPERATE
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            batch = BaziBatch(os.path.join(tmp_dir, "batch.bazi"), "bazi.jar")
+            for titel, scenario_districts in (
+                ("biprop-2", variant),
+                ("biprop", districts),
+            ):
+                batch.add(
+                    BaziScenario(
+                        titel,
+                        scenario_districts,
+                        district_option=seperate,
+                    )
+                )
+            with BaziWorker.stand_in() as worker:
+                results = batch.run(worker)
+
+        self.assertEqual(["biprop-2", "biprop"], list(results))
+        self.assertEqual("biprop-2", results["biprop-2"].splitlines()[0])
+        self.assertEqual("biprop", results["biprop"].splitlines()[0])
+        self.assertIn('"C" "6"', results["biprop-2"])
+        self.assertNotIn('"C" "6"', results["biprop"])
+
+
+class TestBaziCache(TestCase):
+    def test_run_cached(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cache = BaziCache(os.path.join(tmp_dir, "cache"))
+            bip = BiProportional(
+                _get_test_districts(),
+                os.path.join(tmp_dir, "input.bazi"),
+                "bazi.jar",
+                cache,
+            )
+            bip.write_bazi_file(
+                district_option=BiProportional.DistrictOptions.SEPERATE
+            )
+            with BaziWorker.stand_in() as worker:
+                results = bip.calculate(worker)
+
+            # the same backend is never started for the same input
+            worker = BaziWorker.stand_in()
+            cached = bip.calculate(worker)
+            self.assertEqual(
+                results[0].seats.to_dict(), cached[0].seats.to_dict()
+            )
+            self.assertIn(
+                '"A" "7"', bip.run_bazi(write_to_file=False, worker=worker)
+            )
+            self.assertIsNone(worker.process)
+            self.assertEqual(
+                {"hits": 2, "misses": 1, "evictions": 0}, cache.stats()
+            )
+
+    def test_key(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cache = BaziCache(os.path.join(tmp_dir, "cache"))
+            jar = os.path.join(tmp_dir, "bazi.jar")
+            with open(jar, "wb") as f:
+                f.write(b"version 1")
+            key = cache.key(b"input", bazi_command(jar))
+
+            # other backends must not share the entries of the jar
+            self.assertNotEqual(
+                key, cache.key(b"input", BaziWorker.stand_in().command)
+            )
+            self.assertNotEqual(
+                key, cache.key(b"input", BaziWorker(jar).command)
+            )
+            self.assertNotEqual(
+                key, cache.key(b"input", bazi_command("other.jar"))
+            )
+            self.assertEqual(
+                BaziWorker.stand_in().command,
+                BaziWorkerPool.stand_in(2).command,
+            )
+
+            # a new jar at the same path neither
+            with open(jar, "wb") as f:
+                f.write(b"version 2")
+            other = BaziCache(os.path.join(tmp_dir, "cache"))
+            self.assertNotEqual(key, other.key(b"input", bazi_command(jar)))
+
+    def test_run_bazi_without_parsing(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cache = BaziCache(os.path.join(tmp_dir, "cache"))
+            bip = BiProportional(
+                _get_test_districts(),
+                os.path.join(tmp_dir, "input.bazi"),
+                "bazi.jar",
+                cache,
+            )
+            bip.write_bazi_file(
+                district_option=BiProportional.DistrictOptions.SEPERATE
+            )
+            worker = BaziWorker.stand_in()
+            key = cache.key(bip.output_file_path.read_bytes(), worker.command)
+            with worker:
+                output = bip.run_bazi(write_to_file=False, worker=worker)
+            self.assertIsNone(cache.get(key).results)
+
+            # the cached output is parsed on the first calculate
+            results = bip.calculate(worker)
+            self.assertEqual(
+                bip.parse_output(output)[0].seats.to_dict(),
+                results[0].seats.to_dict(),
+            )
+            self.assertEqual(1, len(cache.get(key).results))
+
+    def test_eviction(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cache = BaziCache(tmp_dir, max_size=0)
+            cache.put("a", BaziCacheEntry("output a", []))
+            cache.put("b", BaziCacheEntry("output b", []))
+            self.assertIsNone(cache.get("a"))
+            self.assertEqual("output b", cache.get("b").output)
+            self.assertEqual(1, cache.evictions)
+
+
+class TestAsyncBaziRunner(TestCase):
+    def test_as_completed(self):
+        scenarios = []
+        for i in range(12):
+            districts = _get_test_districts()
+            districts[0].party_votes["C"] = 4500 + i * 3000
+            scenarios.append(
+                BaziScenario(
+                    f"Scenario {i}",
+                    districts,
+                    district_option=BiProportional.DistrictOptions.SEPERATE,
+                )
+            )
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            runner = AsyncBaziRunner.stand_in(
+                max_concurrency=4, tmp_dir=tmp_dir
+            )
+            results = asyncio.run(runner.run_all(scenarios))
+            # every input file is removed again
+            self.assertEqual([], os.listdir(tmp_dir))
+
+        self.assertEqual({s.titel for s in scenarios}, set(results))
+        self.assertIn('"C" "3" "4500" "1"', results["Scenario 0"])
+        self.assertIn('"C" "6" "37500" "4"', results["Scenario 11"])
+
+    def test_several_loops(self):
+        scenarios = [
+            BaziScenario(
+                f"Scenario {i}",
+                _get_test_districts(),
+                district_option=BiProportional.DistrictOptions.SEPERATE,
+            )
+            for i in range(3)
+        ]
+        # every run contends for the single slot in a new event loop
+        runner = AsyncBaziRunner.stand_in(max_concurrency=1)
+        for _ in range(2):
+            results = asyncio.run(runner.run_all(scenarios))
+            self.assertEqual({s.titel for s in scenarios}, set(results))
+
+    def test_run_bazi_async(self):
+        bip = BiProportional(_get_test_districts(), "unused.bazi", "bazi.jar")
+        runner = AsyncBaziRunner.stand_in()
+        output = asyncio.run(
+            bip.run_bazi_async(
+                runner, district_option=BiProportional.DistrictOptions.SEPERATE
+            )
+        )
+        self.assertIn('"A" "7"', output)
+        self.assertFalse(os.path.exists("unused.bazi"))
+
+        with self.assertRaises(subprocess.CalledProcessError):
+            asyncio.run(bip.run_bazi_async(runner))
+
+    def test_run_bazi_async_cached(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cache = BaziCache(os.path.join(tmp_dir, "cache"))
+            bip = BiProportional(
+                _get_test_districts(),
+                os.path.join(tmp_dir, "input.bazi"),
+                "bazi.jar",
+                cache,
+            )
+            runner = AsyncBaziRunner.stand_in()
+            option = BiProportional.DistrictOptions.SEPERATE
+            output = asyncio.run(
+                bip.run_bazi_async(runner, district_option=option)
+            )
+            self.assertEqual(
+                output,
+                asyncio.run(
+                    bip.run_bazi_async(runner, district_option=option)
+                ),
+            )
+            self.assertEqual(
+                {"hits": 1, "misses": 1, "evictions": 0}, cache.stats()
+            )
+
+            # a worker is another backend
+            with BaziWorker.stand_in() as worker:
+                bip.bazi_str_to_file(
+                    bip.to_bazi_format(district_option=option)
+                )
+                self.assertEqual(
+                    bip.parse_output(output)[0].seats.to_dict(),
+                    bip.calculate(worker)[0].seats.to_dict(),
+                )
+            self.assertEqual(2, cache.misses)
+
+    def test_timeout(self):
+        bip = BiProportional(_get_test_districts(), "", "bazi.jar")
+        runner = AsyncBaziRunner(
+            command=[sys.executable, "-c", "import time; time.sleep(10)"],
+            timeout=0.5,
+        )
+        with self.assertRaises(asyncio.TimeoutError):
+            asyncio.run(bip.run_bazi_async(runner))
+
+
+class TestBaziWriter(TestCase):
+    def test_vote_matrix(self):
+        districts = _get_test_districts()
+        votes = pd.DataFrame(
+            [d.party_votes for d in districts],
+            index=[d.short_name for d in districts],
+        )
+        seats = {d.short_name: d.seats for d in districts}
+
+        buffer = io.StringIO()
+        writer = BaziWriter(buffer)
+        writer.write_vote_matrix(votes, seats)
+        self.assertEqual(
+            "".join(str(d) for d in districts), buffer.getvalue()
+        )
+
+    def test_compressed_file(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file_path = os.path.join(tmp_dir, "input.bazi.gz")
+            bip = BiProportional(_get_test_districts(), file_path, "bazi.jar")
+            bip.write_bazi_file(
+                method=BiProportional.Methods.DIV_ABR,
+                district_option=BiProportional.DistrictOptions.SEPERATE,
+            )
+            with gzip.open(file_path, "rt") as f:
+                self.assertEqual(
+                    bip.to_bazi_format(
+                        method=BiProportional.Methods.DIV_ABR,
+                        district_option=BiProportional.DistrictOptions.SEPERATE,
+                    ),
+                    f.read(),
+                )
+
+
+class TestBaziOutputParser(TestCase):
+    def test_parse_vertical(self):
+        districts = _get_test_districts()
+        bip = BiProportional(districts, "", "bazi.jar")
+        with BaziWorker.stand_in() as worker:
+            output = worker.calculate(
+                bip.to_bazi_format(
+                    district_option=BiProportional.DistrictOptions.SEPERATE
+                )
+            )
+
+        results = bip.parse_output(output)
+        self.assertEqual(1, len(results))
+        seats = results[0].seats
+        self.assertEqual(["A", "B", "C"], seats.index.to_list())
+        self.assertEqual(["WK1", "WK2", "WK3"], seats.columns.to_list())
+        self.assertEqual([3, 2, 1], seats["WK1"].to_list())
+        self.assertEqual([6, 5, 4], seats.sum().to_list())
+        self.assertEqual(5760, results[0].district_divisors["WK1"])
+
+    def test_native(self):
+        bip = BiProportional(_get_test_districts(), "", "bazi.jar")
+        with BaziWorker.stand_in(native=True) as worker:
+            for option in BiProportional.DistrictOptions:
+                output = worker.calculate(
+                    bip.to_bazi_format(district_option=option)
+                )
+                expected = bip.parse_output(output)[0]
+                result = bip.run_native(district_option=option)
+                pd.testing.assert_frame_equal(expected.seats, result.seats)
+                pd.testing.assert_series_equal(
+                    expected.district_divisors,
+                    result.district_divisors,
+                    check_names=False,
+                )
+
+            # the divisors of the native engines lie between the signposts
+            output = worker.calculate(
+                bip.to_bazi_format(
+                    district_option=BiProportional.DistrictOptions.SEPERATE
+                )
+            )
+            divisors = bip.parse_output(output)[0].district_divisors
+            self.assertEqual(5280, divisors["WK1"])
+
+            # methods the engines do not know still fail
+            with self.assertRaises(ValueError):
+                worker.calculate(bip.to_bazi_format(method="DivGeo"))
+
+    def test_parse_horizontal(self):
+        output = "\n".join(
+            [
+                "Biproportional Allocation",
+                "",
+                '"WK" "DivStd" "A" "" "B" "" "C" "" "Divisor"',
+                '"" "15" "6" "" "5" "" "4" "" ""',
+                '"WK1" "6" "14400" "3" "12000" "2" "4500" "1" "5150"',
+                '"WK2" "5" "10100" "1" "10000" "2" "9900" "2+" "6655"',
+                '"WK3" "4" "6400" "2" "6000" "1" "5000" "1-" "4078"',
+                '"Divisor" "" "1.012" "" "1" "" "0.8175" ""',
+                "",
+            ]
+        )
+        results = BaziOutputParser(_get_test_districts()).parse(output)
+        self.assertEqual(1, len(results))
+        self.assertEqual(
+            [[3, 1, 2], [2, 2, 1], [1, 2, 1]], results[0].seats.values.tolist()
+        )
+        self.assertEqual(6655, results[0].district_divisors["WK2"])
+        self.assertEqual(0.8175, results[0].party_divisors["C"])
+
+    def test_parse_short_row(self):
+        output = "\n".join(
+            [
+                "Biproportional Allocation",
+                "",
+                '"WK" "DivStd" "A" "" "B" "" "C" "" "Divisor"',
+                '"" "15" "6" "" "5" "" "4" "" ""',
+                '"WK1" "6" "14400" "3" "12000" "2" "4500" "1" "5150"',
+                '"WK2" "5" "10100" "1" "10000"',
+                "",
+            ]
+        )
+        with self.assertRaises(ValueError):
+            BaziOutputParser(_get_test_districts()).parse(output)
@@ -0,0 +1,86 @@
+import json
+import tempfile
+from pathlib import Path
+from unittest import TestCase
+
+import pandas as pd
+
+from candidates import CandidateParser
+from prepocessor import JsonSectionReader, MetadataParser
+
+
+def _candidate(candidate_id, canton_id, party_id, votes, status_id=None):
+    return {
+        "kandidat_nummer": candidate_id,
+        "kanton_nummer": canton_id,
+        "liste_nummer_kanton": str(party_id),
+        "partei_id": party_id,
+        "vorname": "Vorname",
+        "name": f"Name {candidate_id}",
+        "stimmen_kandidat": votes,
+        "kandidat_status_id": status_id,
+    }
+
+
+class TestCandidateTable(TestCase):
+    def setUp(self):
+        self.meta = MetadataParser()
+        self.candidates = [
+            # ZH FDP
+            _candidate(101, 1, 1, 500),
+            _candidate(102, 1, 1, 900, 2),
+            _candidate(103, 1, 1, 700),
+            # ZH SP
+            _candidate(104, 1, 3, 300),
+            # BE FDP
+            _candidate(201, 2, 1, 400),
+            _candidate(202, 2, 1, 400),
+            # unknown canton
+            _candidate(999, 99, 1, 10),
+        ]
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.file_path = Path(self.tmp_dir.name) / Path("candidates.json")
+        with open(self.file_path, "w") as f:
+            json.dump(
+                {"timestamp": "now", "kandidierende": self.candidates}, f
+            )
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_iter_items(self):
+        reader = JsonSectionReader(self.file_path)
+        reader.CHUNK_SIZE = 5
+        self.assertEqual(
+            self.candidates, list(reader.iter_items("kandidierende"))
+        )
+        self.assertEqual([], list(reader.iter_items("unknown")))
+        self.assertEqual("now", reader.get("timestamp"))
+
+    def test_assign(self):
+        table = CandidateParser(
+            self.meta.canton_table, self.meta.party_table
+        ).read(self.file_path)
+        self.assertEqual(6, len(table))
+        self.assertEqual(1, table.skipped)
+
+        # cantons as columns, like BAZI and the native engines
+        seats = pd.DataFrame(
+            {"ZH": [2, 1], "BE": [1, 0]}, index=["FDP", "SP"]
+        )
+        elected = table.assign(seats, self.meta.candidate_status)
+        self.assertEqual([102, 103, 104, 201], elected["id"].to_list())
+        self.assertEqual([1, 2, 1, 1], elected["rank"].to_list())
+        self.assertEqual("incumbent", elected["status"][0])
+        self.assertEqual("Vorname Name 102", elected["name"][0])
+
+        # cantons as rows, like PukelsheimLowerApportionment
+        elected = table.assign(seats.transpose())
+        self.assertEqual([102, 103, 104, 201], elected["id"].to_list())
+
+    def test_shortage(self):
+        table = CandidateParser(
+            self.meta.canton_table, self.meta.party_table
+        ).read(self.file_path)
+        elected = table.assign(pd.DataFrame({"SP": [3]}, index=["ZH"]))
+        self.assertEqual([104], elected["id"].to_list())
@@ -0,0 +1,56 @@
+import pickle
+from unittest import TestCase
+
+from datastructures import (
+    Languages,
+    MultilingualText,
+    MunicipalTable,
+    Party,
+)
+
+
+class TestMultilingualText(TestCase):
+    def test_mapping_access(self):
+        text = MultilingualText({Languages.DE: "SP", Languages.FR: "PS"})
+        self.assertEqual("SP", text.get(Languages.DE))
+        self.assertEqual("PS", text[Languages.FR])
+        self.assertIsNone(text.get(Languages.EN))
+        self.assertEqual({Languages.DE: "SP", Languages.FR: "PS"}, text)
+        self.assertEqual(2, len(text))
+
+    def test_intern_and_pickle(self):
+        texts = {Languages.DE: "Übrige", Languages.EN: "Others"}
+        text = MultilingualText.intern(texts)
+        self.assertIs(text, MultilingualText.intern(dict(texts)))
+        self.assertIs(text, pickle.loads(pickle.dumps(text)))
+
+    def test_slotted_party(self):
+        text = MultilingualText.intern({Languages.EN: "GLP"})
+        party = Party(31, text, text, 1, text, text, 2, text, text)
+        self.assertEqual("GLP", str(party))
+        with self.assertRaises(AttributeError):
+            party.unknown_attribute = 1
+
+
+class TestMunicipalTable(TestCase):
+    def test_append_and_lookup(self):
+        table = MunicipalTable()
+        table.append(1, "Aeugst am Albis", 1)
+        table.append(351, "Bern", 2)
+        self.assertEqual(2, len(table))
+        self.assertIn(351, table)
+        self.assertNotIn(2, table)
+        self.assertEqual("Bern", table.get(351).name)
+        self.assertEqual(2, table.get(351).canton_id)
+        self.assertIsNone(table.get(2))
+        self.assertEqual([1, 351], [m.id for m in table])
+
+        by_id = table.by_id()
+        self.assertEqual("Bern", by_id[351].name)
+        self.assertIn(351, by_id)
+        self.assertNotIn(2, by_id)
+        self.assertRaises(KeyError, by_id.__getitem__, 2)
+        self.assertEqual([1, 351], list(by_id))
+        self.assertEqual(
+            ["Aeugst am Albis", "Bern"], [m.name for m in by_id.values()]
+        )
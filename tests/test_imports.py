@@ -0,0 +1,68 @@
+import re
+import subprocess
+import sys
+from pathlib import Path
+from unittest import TestCase
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# modules which are only loaded once they are used
+LAZY_MODULES = ("matplotlib", "tqdm", "plotter")
+# share of the import time of numpy and pandas which prepocessor may take on
+# top of them, an eager pyplot alone exceeds it
+IMPORT_BUDGET = 0.5
+
+
+def _import(statement: str):
+    """
+    Imports in a fresh interpreter.
+    :return: modules loaded by statement and the cumulative import times in
+    microseconds of the loaded modules
+    """
+    process = subprocess.run(
+        [
+            sys.executable,
+            "-X",
+            "importtime",
+            "-c",
+            f"import sys\n{statement}\nprint(' '.join(sys.modules))",
+        ],
+        cwd=str(ROOT),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        check=True,
+        universal_newlines=True,
+    )
+    times = {}
+    for line in process.stderr.splitlines():
+        match = re.match(r"import time:\s+\d+ \|\s+(\d+) \|\s+(\S+)$", line)
+        if match:
+            times[match.group(2)] = int(match.group(1))
+    return set(process.stdout.split()), times
+
+
+class TestImports(TestCase):
+    def test_lazy_imports(self):
+        modules, times = _import(
+            "import allocator, biproportional, candidates, prepocessor"
+        )
+        for module in ("allocator", "biproportional", "prepocessor"):
+            self.assertIn(module, times)
+        # neither loaded nor imported and dropped again while importing
+        for module in LAZY_MODULES:
+            self.assertNotIn(module, modules)
+            self.assertNotIn(module, times)
+            self.assertFalse(
+                any(name.startswith(module + ".") for name in times)
+            )
+
+        # plotting loads pyplot only when a figure is shown
+        modules, times = _import("import plotter")
+        self.assertIn("plotter", times)
+        self.assertNotIn("matplotlib.pyplot", modules)
+        self.assertNotIn("matplotlib.pyplot", times)
+
+    def test_import_time(self):
+        _modules, times = _import("import numpy, pandas\nimport prepocessor")
+        budget = IMPORT_BUDGET * (times["numpy"] + times["pandas"])
+        self.assertLess(times["prepocessor"], budget)
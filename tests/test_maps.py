@@ -0,0 +1,110 @@
+import importlib.util
+import json
+import os
+import tempfile
+from unittest import TestCase, mock, skipIf
+
+import pandas as pd
+
+from maps import (
+    CantonGeometries,
+    original_seats,
+    render_seat_change_maps,
+    seat_changes,
+)
+from prepocessor import MetadataParser
+
+HAS_GEOPANDAS = importlib.util.find_spec("geopandas") is not None
+
+
+def _square(lon, lat, size=0.1):
+    return [
+        [
+            [lon, lat],
+            [lon + size, lat],
+            [lon + size, lat + size],
+            [lon, lat + size],
+            [lon, lat],
+        ]
+    ]
+
+
+class TestSeatChanges(TestCase):
+    def test_seat_changes(self):
+        original = pd.DataFrame(
+            {"ZH": [10, 5], "BE": [8, 2]}, index=["SP", "SVP"]
+        )
+        scenario = pd.DataFrame(
+            {"ZH": [9, 5, 1], "BE": [8, 2, 0]}, index=["SP", "SVP", "EVP"]
+        )
+        self.assertEqual(
+            {"BE": 0, "ZH": 1},
+            seat_changes(original, scenario).to_dict(),
+        )
+        self.assertEqual(
+            {"BE": 0, "ZH": -1},
+            seat_changes(original, scenario, "SP").to_dict(),
+        )
+        self.assertRaises(ValueError, seat_changes, original, scenario, "X")
+
+    def test_real_data(self):
+        meta = MetadataParser()
+        meta.read()
+        original = original_seats(meta)
+        self.assertEqual(200, original.to_numpy().sum())
+        changes = seat_changes(original, "data/biprop-results.csv")
+        self.assertEqual(26, len(changes))
+        self.assertGreater(changes.sum(), 0)
+
+
+@skipIf(not HAS_GEOPANDAS, "geopandas is not installed")
+class TestCantonGeometries(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.file_path = os.path.join(self.tmp_dir.name, "cantons.geojson")
+        features = [
+            {
+                "type": "Feature",
+                "properties": {"KANTONSNUM": canton_id},
+                "geometry": {"type": "Polygon", "coordinates": square},
+            }
+            for canton_id, square in [
+                (1, _square(8.5, 47.3)),
+                (2, _square(7.4, 46.9)),
+                (2, _square(7.6, 46.9)),
+            ]
+        ]
+        with open(self.file_path, "w") as f:
+            json.dump({"type": "FeatureCollection", "features": features}, f)
+        self.canton_table = MetadataParser().canton_table
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def _geometries(self):
+        return CantonGeometries(
+            self.canton_table,
+            self.file_path,
+            os.path.join(self.tmp_dir.name, "cantons.pickle"),
+        )
+
+    def test_cache(self):
+        frame = self._geometries().frame
+        self.assertEqual(["ZH", "BE"], list(frame.index))
+
+        with mock.patch.object(CantonGeometries, "build") as build:
+            cached = self._geometries().frame
+            build.assert_not_called()
+        self.assertTrue(frame.geometry.equals(cached.geometry))
+
+    def test_render(self):
+        original = pd.DataFrame({"ZH": [10], "BE": [8]}, index=["SP"])
+        file_paths = render_seat_change_maps(
+            original,
+            {"a": original, "b": original + 1},
+            self._geometries(),
+            self.tmp_dir.name,
+            party="SP",
+        )
+        for file_path in file_paths:
+            self.assertTrue(os.path.exists(file_path))
@@ -0,0 +1,176 @@
+import os
+import sys
+import tempfile
+import threading
+from unittest import TestCase, mock
+
+import pandas as pd
+
+from pipeline import Pipeline, Stage, build_stages, main
+
+
+class TestPipeline(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.state_dir = os.path.join(self.tmp_dir.name, "state")
+        self.file_path = os.path.join(self.tmp_dir.name, "input.txt")
+        self._write("1 2 3")
+        self.calls = []
+        # both branches only pass the barrier if they run concurrently
+        self.barrier = threading.Barrier(2, timeout=10)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def _write(self, text):
+        with open(self.file_path, "w") as f:
+            f.write(text)
+
+    def _stages(self):
+        def read(file_path):
+            self.calls.append("read")
+            with open(file_path, "r") as f:
+                return [int(value) for value in f.read().split()]
+
+        def total(numbers):
+            self.calls.append("total")
+            self.barrier.wait()
+            return sum(numbers)
+
+        def count(numbers):
+            self.calls.append("count")
+            self.barrier.wait()
+            return len(numbers)
+
+        def mean(total, n):
+            self.calls.append("mean")
+            return total / n
+
+        return [
+            Stage(
+                "read",
+                read,
+                files=[self.file_path],
+                params={"file_path": self.file_path},
+            ),
+            Stage("total", total, requires={"read": "numbers"}),
+            Stage("count", count, requires={"read": "numbers"}),
+            Stage("mean", mean, requires={"total": "total", "count": "n"}),
+        ]
+
+    def _run(self, targets=None):
+        self.calls = []
+        pipeline = Pipeline(self._stages(), self.state_dir, max_workers=2)
+        return pipeline, pipeline.run(targets)
+
+    def test_run(self):
+        pipeline, statuses = self._run()
+        self.assertEqual({"ran"}, set(statuses.values()))
+        self.assertEqual(2, pipeline.output("mean"))
+
+        # nothing changed
+        pipeline, statuses = self._run()
+        self.assertEqual({"cached"}, set(statuses.values()))
+        self.assertEqual([], self.calls)
+        self.assertEqual(2, pipeline.output("mean"))
+
+        # the count does not change, but the total does
+        self._write("2 3 4")
+        self.barrier = threading.Barrier(1)
+        pipeline, statuses = self._run(["total"])
+        self.assertEqual(["read", "total"], self.calls)
+        self.assertEqual({"read", "total"}, set(statuses))
+        pipeline, statuses = self._run()
+        self.assertEqual(["count", "mean"], sorted(self.calls))
+        self.assertEqual("cached", statuses["total"])
+        self.assertEqual(3, pipeline.output("mean"))
+
+        # a new line only changes the file, not the numbers read
+        self._write("2 3 4\n")
+        pipeline, statuses = self._run()
+        self.assertEqual(["read"], self.calls)
+
+        self.assertRaises(ValueError, self._run, ["unknown"])
+
+    def test_failure(self):
+        def fail():
+            raise RuntimeError("failed")
+
+        stages = self._stages()[:1] + [
+            Stage("fail", fail),
+            Stage("after", lambda fail: fail, requires=["fail"]),
+        ]
+        pipeline = Pipeline(stages, self.state_dir)
+        self.assertRaises(RuntimeError, pipeline.run)
+        # successful stages are kept
+        self.assertEqual(
+            "cached", Pipeline(stages, self.state_dir).run(["read"])["read"]
+        )
+
+    def test_source_key(self):
+        module_path = os.path.join(self.tmp_dir.name, "stage_module.py")
+        with open(module_path, "w") as f:
+            f.write("FACTOR = 1\n")
+        stage = Stage("read", len, modules=["stage_module"])
+        pipeline = Pipeline([stage], self.state_dir)
+
+        with mock.patch.object(sys, "path", [self.tmp_dir.name] + sys.path):
+            self.assertIn(module_path, pipeline.source_files(stage))
+            key = pipeline.stage_key(stage)
+            with open(module_path, "w") as f:
+                f.write("FACTOR = 10\n")
+            self.assertNotEqual(key, pipeline.stage_key(stage))
+
+        # the source of the stage functions is part of their key
+        self.assertIn(
+            os.path.abspath(__file__),
+            map(os.path.abspath, pipeline.source_files(self._stages()[0])),
+        )
+        self.assertRaises(
+            ValueError, pipeline.source_files, Stage("x", len, modules=["?"])
+        )
+
+    def test_main_without_bazi(self):
+        output_dir = os.path.join(self.tmp_dir.name, "output")
+        os.makedirs(output_dir)
+        argv = [
+            "pipeline.py",
+            "biprop",
+            "--bazi-stand-in",
+            "--state-dir",
+            self.state_dir,
+            "--output-dir",
+            output_dir,
+        ]
+        # the cross-check is not required by biprop, thus never read
+        with mock.patch.object(sys, "argv", argv):
+            main()
+        self.assertFalse(
+            os.path.exists(os.path.join(self.state_dir, "bazi.pickle"))
+        )
+
+    def test_report(self):
+        output_dir = os.path.join(self.tmp_dir.name, "output")
+        os.makedirs(output_dir)
+        pipeline = Pipeline(build_stages(output_dir), self.state_dir)
+        pipeline.run(["biprop", "nzz", "hagenbach_bischoff"])
+        for name in ("biprop", "nzz"):
+            expected = pd.read_csv(f"data/{name}-results.csv", index_col=0)
+            result = pipeline.output(name)
+            self.assertEqual(
+                expected.to_dict(),
+                result.loc[expected.index, expected.columns].to_dict(),
+            )
+
+        # the status quo is the published result, where the LPS counts to
+        # the FDP
+        original = pd.read_csv("data/original-results.csv", index_col=0)
+        totals = (
+            pipeline.output("hagenbach_bischoff")
+            .sum(axis=1)
+            .rename({"LPS": "FDP", "Lega": "LEGA"})
+        )
+        self.assertEqual(
+            original["Total"].to_dict(),
+            totals.groupby(level=0).sum()[original.index].to_dict(),
+        )
@@ -0,0 +1,98 @@
+import os
+import tempfile
+from unittest import TestCase
+
+import numpy as np
+import pandas as pd
+
+from plotter import hemicycle_layout, party_pie_plot, render_parliaments
+
+
+class TestRenderParliaments(TestCase):
+    def test_render_parliaments(self):
+        seats = pd.DataFrame(
+            {"ZH": [10, 5, 20], "BE": [8, 2, 14]}, index=["SP", "EVP", "SVP"]
+        )
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file_paths = render_parliaments(
+                [
+                    ("data/biprop-results.csv", "biprop.png"),
+                    (seats, "seats.png"),
+                ],
+                output_dir=tmp_dir,
+                max_workers=2,
+            )
+            self.assertEqual(
+                [
+                    os.path.join(tmp_dir, "biprop.png"),
+                    os.path.join(tmp_dir, "seats.png"),
+                ],
+                file_paths,
+            )
+            for file_path in file_paths:
+                self.assertGreater(os.path.getsize(file_path), 0)
+        self.assertEqual([], render_parliaments([]))
+
+    def test_render_cache(self):
+        seats = pd.DataFrame(
+            {"ZH": [10, 20], "BE": [8, 14]}, index=["SP", "SVP"]
+        )
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            jobs = [(seats, "a.png"), (seats * 2, "b.png")]
+            file_paths = render_parliaments(jobs, tmp_dir, max_workers=1)
+            mtimes = [os.stat(f).st_mtime_ns for f in file_paths]
+
+            # unchanged seats are not rendered again
+            render_parliaments(jobs, tmp_dir, max_workers=1)
+            self.assertEqual(
+                mtimes, [os.stat(f).st_mtime_ns for f in file_paths]
+            )
+
+            # only the changed scenario is rendered again
+            jobs[1] = (seats * 3, "b.png")
+            render_parliaments(jobs, tmp_dir, max_workers=1)
+            self.assertEqual(mtimes[0], os.stat(file_paths[0]).st_mtime_ns)
+            self.assertNotEqual(mtimes[1], os.stat(file_paths[1]).st_mtime_ns)
+
+            # removed outputs are rendered again
+            os.remove(file_paths[0])
+            render_parliaments(jobs, tmp_dir, max_workers=1)
+            self.assertTrue(os.path.exists(file_paths[0]))
+
+            pie_file = os.path.join(tmp_dir, "pie.png")
+            party_pie_plot([60, 40], ["SP", "SVP"], ["SP", "SVP"], pie_file)
+            mtime = os.stat(pie_file).st_mtime_ns
+            party_pie_plot([60, 40], ["SP", "SVP"], ["SP", "SVP"], pie_file)
+            self.assertEqual(mtime, os.stat(pie_file).st_mtime_ns)
+
+    def test_hemicycle(self):
+        positions, diameter = hemicycle_layout(200)
+        self.assertEqual((200, 2), positions.shape)
+        self.assertFalse(positions.flags.writeable)
+        self.assertIs(positions, hemicycle_layout(200)[0])
+        radii = np.hypot(positions[:, 0], positions[:, 1])
+        self.assertTrue(np.all((radii > 0.39) & (radii < 1.01)))
+        self.assertTrue(np.all(positions[:, 1] >= -1e-9))
+        # no overlapping seats
+        distances = np.hypot(
+            *(positions[:, np.newaxis] - positions[np.newaxis]).T
+        )
+        np.fill_diagonal(distances, np.inf)
+        self.assertGreaterEqual(distances.min(), diameter)
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file_paths = render_parliaments(
+                [("data/biprop-results.csv", "party.png")],
+                tmp_dir,
+                max_workers=1,
+                chart="hemicycle",
+            )
+            file_paths += render_parliaments(
+                [("data/biprop-results.csv", "canton.png")],
+                tmp_dir,
+                max_workers=1,
+                chart="hemicycle",
+                color_by="canton",
+            )
+            for file_path in file_paths:
+                self.assertGreater(os.path.getsize(file_path), 0)
@@ -0,0 +1,257 @@
+import json
+import tempfile
+from pathlib import Path
+from unittest import TestCase
+
+import pandas as pd
+
+from loader import MultiElectionData, MultiElectionLoader
+from prepocessor import (
+    CantonNameResolver,
+    CantonSeatsParser,
+    Config,
+    JsonSectionReader,
+    MetadataParser,
+    MunicipalParser,
+    IncrementalVotesParser,
+    VotesParser,
+)
+
+
+class TestJsonSectionReader(TestCase):
+    def test_sections_on_demand(self):
+        with open(Config.METADATA, "r") as f:
+            metadata = json.load(f)
+
+        reader = JsonSectionReader(Config.METADATA)
+        reader.CHUNK_SIZE = 7
+        self.assertEqual(metadata["kantone"], reader.get("kantone"))
+        self.assertNotIn("listenverbindungen", reader.sections)
+        self.assertIsNone(reader.get("unknown"))
+        self.assertEqual(metadata, reader.read_all())
+
+
+class TestMetadataParser(TestCase):
+    def test_lazy_sections(self):
+        meta = MetadataParser()
+        self.assertEqual("ZH", meta.cantons_dict.get(1).short_name)
+        self.assertNotIn("parteien", meta.reader.sections)
+        self.assertEqual("FDP", meta.party_table.labels[0])
+        self.assertNotIn("listenverbindungen", meta.reader.sections)
+
+        # parsing everything afterwards must not duplicate any records
+        meta.read()
+        self.assertEqual(26, len(meta.cantons))
+        self.assertEqual(2019, meta.year)
+
+    def test_list_connections(self):
+        meta = MetadataParser()
+        self.assertNotIn("listenverbindungen", meta.reader.sections)
+        connections = meta.list_connections
+        # ZH: EDU is connected directly, the SVP lists in sub-connection A1
+        self.assertEqual((16, "A", None), connections.get(1, "31"))
+        self.assertEqual((4, "A", "A1"), connections.get(1, "1"))
+        self.assertEqual(3, len(connections.party_connections(1, 4)))
+        self.assertIsNone(connections.get(1, "9999"))
+        self.assertIn((1, "28"), connections)
+
+        # BE: the lists of the other parties are spread over four connections
+        self.assertEqual(
+            {"B", "C", "D", "E"},
+            {c for c, _s in connections.party_connections(2, 35)},
+        )
+        self.assertIs(connections, meta.parse_list_connections())
+
+
+class TestCantonNameResolver(TestCase):
+    def test_resolve(self):
+        resolver = CantonNameResolver(MetadataParser().cantons)
+        self.assertEqual("FR", resolver.short_name("Freiburg"))
+        self.assertEqual("VS", resolver.short_name("Valais"))
+        self.assertEqual("VS", resolver.short_name("Wallis"))
+        self.assertEqual("SG", resolver.short_name("st. gallen"))
+        self.assertEqual("NE", resolver.short_name("Neuchatel"))
+        self.assertEqual("GR", resolver.short_name("Grisons"))
+        self.assertEqual("ZH", resolver.short_name("zh"))
+        self.assertIsNone(resolver.short_name("Liechtenstein"))
+
+    def test_canton_seats_parser(self):
+        meta = MetadataParser()
+        canton_seats = CantonSeatsParser(
+            meta.cantons_name_dict, meta.cantons
+        ).read()
+        self.assertEqual(
+            sorted(["Total"] + meta.canton_table.labels),
+            sorted(canton_seats.columns),
+        )
+        self.assertEqual(
+            200, canton_seats.drop("Total", axis=1).loc["seats"].sum()
+        )
+
+
+class TestVotesParser(TestCase):
+    def test_read_canton_level(self):
+        meta = MetadataParser()
+        meta.read()
+        records = [
+            {"kanton_nummer": 1, "partei_id": 1, "stimmen_partei": 100},
+            {"kanton_nummer": 1, "partei_id": 1, "stimmen_partei": 20},
+            {"kanton_nummer": 26, "partei_id": 4, "stimmen_partei": 7},
+            {"kanton_nummer": 26, "partei_id": 3, "stimmen_partei": None},
+        ]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file_path = Path(tmp_dir) / Path("municipals.json")
+            with open(file_path, "w") as f:
+                json.dump({"partei_auf_gemeindeebene": records}, f)
+
+            vote = VotesParser(meta.cantons_dict, meta.parties_dict)
+            votes = vote.read_canton_level(
+                meta.get_empty_canton_party_data_frame(), file_path
+            )
+
+        self.assertEqual(120, votes.loc["ZH", "FDP"])
+        self.assertEqual(7, votes.loc["JU", "SVP"])
+        self.assertEqual(127, votes.to_numpy().sum())
+
+
+class TestMunicipalParser(TestCase):
+    def test_municipals_dict(self):
+        records = [
+            {
+                "gemeinde_nummer": municipal_id,
+                "gemeinde_bezeichnung": name,
+                "kanton_nummer": canton_id,
+            }
+            for municipal_id, name, canton_id in (
+                (1, "Aeugst am Albis", 1),
+                (351, "Bern", 2),
+                (1, "Aeugst am Albis", 1),
+            )
+        ]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file_path = Path(tmp_dir) / Path("municipals.json")
+            with open(file_path, "w") as f:
+                json.dump({"partei_auf_gemeindeebene": records}, f)
+            parser = MunicipalParser(file_path)
+        parser.read()
+
+        # lookups are by municipal id, not by position
+        self.assertEqual("Bern", parser.municipals_dict[351].name)
+        self.assertEqual(2, parser.municipals_dict[351].canton_id)
+        self.assertIn(351, parser.municipals_dict)
+        self.assertNotIn(0, parser.municipals_dict)
+        self.assertEqual({1, 351}, set(parser.municipals_dict))
+        self.assertEqual(2, len(parser.municipals_dict))
+
+
+class TestIncrementalVotesParser(TestCase):
+    @staticmethod
+    def _record(municipal_id, canton_id, party_id, votes):
+        return {
+            "gemeinde_nummer": municipal_id,
+            "kanton_nummer": canton_id,
+            "partei_id": party_id,
+            "stimmen_partei": votes,
+        }
+
+    def _get_parser(self):
+        meta = MetadataParser()
+        meta.read()
+        return IncrementalVotesParser(
+            meta.cantons_dict,
+            meta.parties_dict,
+            meta.get_empty_canton_party_data_frame(),
+            meta.get_empty_total_party_data_frame(),
+        )
+
+    def test_apply_snapshots(self):
+        parser = self._get_parser()
+        changed = parser.apply(
+            [
+                self._record(1, 1, 1, 100),
+                self._record(2, 1, 1, 50),
+                self._record(351, 2, 3, 70),
+            ]
+        )
+        self.assertEqual({"ZH", "BE"}, changed)
+        self.assertEqual(150, parser.canton_votes.at["ZH", "FDP"])
+        self.assertEqual(70, parser.total_votes.at["total", "SP"])
+
+        # second snapshot only changes a single municipal in Bern
+        changed = parser.apply(
+            [
+                self._record(1, 1, 1, 100),
+                self._record(2, 1, 1, 50),
+                self._record(351, 2, 3, 90),
+            ]
+        )
+        self.assertEqual({"BE"}, changed)
+        self.assertEqual(90, parser.canton_votes.at["BE", "SP"])
+        self.assertEqual(150, parser.total_votes.at["total", "FDP"])
+
+        # delta file with a correction that cancels out within the canton
+        changed = parser.apply(
+            [self._record(1, 1, 1, 90), self._record(2, 1, 1, 60)]
+        )
+        self.assertEqual(set(), changed)
+        self.assertEqual(3, len(parser.change_feed))
+
+    def test_apply_canton_status(self):
+        parser = self._get_parser()
+        changed = parser.apply_canton_status(
+            [
+                {
+                    "kanton_nummer": 1,
+                    "kanton_abgeschlossen": "false",
+                    "gemeinden_abgeschlossen": 100,
+                    "gemeinden_nicht_abgeschlossen": 63,
+                }
+            ]
+        )
+        self.assertEqual({"ZH"}, changed)
+        self.assertFalse(parser.cantons_dict.get(1).status)
+        self.assertEqual(63, parser.cantons_dict.get(1).municipals_not_done)
+
+
+class TestMultiElectionLoader(TestCase):
+    def test_load(self):
+        data = MultiElectionLoader([Config.DATA_DIR], max_workers=2).load()
+        self.assertEqual([2019], data.years)
+        self.assertEqual(26, len(data.canton_labels))
+        self.assertEqual("ZH", data.canton_labels[0])
+        self.assertEqual(
+            data.party_labels, data.national_votes.columns.to_list()
+        )
+        self.assertEqual(366313, data.national_votes.loc[2019, "FDP"])
+
+    def test_duplicate_years(self):
+        loader = MultiElectionLoader([Config.DATA_DIR, Config.DATA_DIR])
+        with self.assertRaises(ValueError):
+            loader.load()
+
+    def test_align_on_ids(self):
+        meta = MetadataParser()
+        meta.read()
+        canton_id, party_id = meta.cantons[0].id, meta.parties[0].id
+        # ids ordered differently than the metadata, older year without
+        # national votes
+        older = pd.DataFrame({party_id: [10, 0]}, index=[-1, canton_id])
+        newer = pd.DataFrame({party_id: [20]}, index=[canton_id])
+        data = MultiElectionData(
+            [2015, 2019],
+            meta.cantons,
+            meta.parties,
+            {2015: older, 2019: newer},
+            {2019: pd.Series({party_id: 30})},
+        )
+        votes = data.votes_array()
+        self.assertEqual((2, 26, len(meta.parties)), votes.shape)
+        self.assertEqual([0, 20], votes[:, 0, 0].tolist())
+        self.assertEqual(20, votes.sum())
+        label = data.party_labels[0]
+        self.assertEqual(30, data.national_votes.loc[2019, label])
+        self.assertEqual([2019], data.national_votes.index.to_list())
+
+        data = MultiElectionData([2019], meta.cantons, meta.parties, {}, {})
+        self.assertIsNone(data.canton_votes)
+        self.assertRaises(ValueError, data.votes_array)
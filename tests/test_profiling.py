@@ -0,0 +1,97 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+from unittest import TestCase
+
+import profiling
+from profiling import Profiler, profiled
+
+
+class _Unformattable:
+    def __format__(self, format_spec):
+        raise AssertionError("formatted while profiling is disabled")
+
+
+@profiled("double")
+def _double(value):
+    return 2 * value
+
+
+class TestProfiler(TestCase):
+    def test_disabled(self):
+        profiler = Profiler()
+        with profiler.span("disabled"):
+            pass
+        profiler.debug("{}", _Unformattable())
+        self.assertEqual([], profiler.events)
+        self.assertEqual([], profiler.summary())
+
+    def test_enabled(self):
+        profiler = Profiler(enabled=True)
+        for _ in range(3):
+            with profiler.span("outer", size=2):
+                with profiler.span("inner"):
+                    pass
+        profiler.debug("Iteration {}", 1)
+
+        summary = {span["name"]: span for span in profiler.summary()}
+        self.assertEqual({"outer", "inner"}, set(summary))
+        self.assertEqual(3, summary["outer"]["count"])
+        self.assertGreaterEqual(
+            summary["outer"]["total"], summary["inner"]["total"]
+        )
+        self.assertIn("outer", profiler.format_summary())
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file_path = os.path.join(tmp_dir, "trace.json")
+            profiler.write_chrome_trace(file_path)
+            with open(file_path, "r") as f:
+                events = json.load(f)["traceEvents"]
+        self.assertEqual(7, len(events))
+        self.assertEqual({"size": "2"}, events[1]["args"])
+        self.assertEqual("Iteration 1", events[-1]["name"])
+
+        profiler.reset()
+        self.assertEqual([], profiler.events)
+
+    def test_profiled(self):
+        enabled = profiling.profiler.enabled
+        profiling.profiler.reset()
+        try:
+            profiling.disable()
+            self.assertEqual(4, _double(2))
+            self.assertEqual([], profiling.profiler.events)
+            profiling.enable()
+            self.assertEqual(6, _double(3))
+            self.assertEqual(
+                ["double"], [e["name"] for e in profiling.profiler.events]
+            )
+        finally:
+            profiling.profiler.enabled = enabled
+            profiling.profiler.reset()
+
+    def test_enable_reports_at_exit(self):
+        environment = dict(os.environ)
+        environment.pop(profiling.ENVIRONMENT_VARIABLE, None)
+        process = subprocess.run(
+            [
+                sys.executable,
+                "-c",
+                "import profiling\n"
+                "profiling.enable()\n"
+                "profiling.enable()\n"
+                "with profiling.span('enabled span'):\n"
+                "    pass\n",
+            ],
+            cwd=str(Path(__file__).resolve().parent.parent),
+            env=environment,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            check=True,
+            universal_newlines=True,
+        )
+        self.assertEqual(1, process.stderr.count("Profile summary"))
+        self.assertIn("enabled span", process.stderr)
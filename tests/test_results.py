@@ -0,0 +1,117 @@
+import filecmp
+import os
+import tempfile
+from unittest import TestCase
+
+import pandas as pd
+
+from allocator import BiproportionalApportionment
+from biproportional import BaziResult
+from plotter import read_results
+from results import ResultsFile, ResultsWriter, pack_csv
+
+CSV_FILES = [
+    "data/biprop-results.csv",
+    "data/nzz-results.csv",
+    "data/others-results.csv",
+    "data/original-results.csv",
+]
+
+
+class TestResults(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.file_path = os.path.join(self.tmp_dir.name, "results.seats")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_csv(self):
+        pack_csv(self.file_path, CSV_FILES)
+        results = ResultsFile(self.file_path)
+        self.assertEqual(
+            ["biprop", "nzz", "others", "original"], results.names
+        )
+        # the cantons are stored once
+        districts = {
+            results.scenarios[name]["districts"]
+            for name in ("biprop", "nzz", "others")
+        }
+        self.assertEqual(1, len(districts))
+
+        output_dir = os.path.join(self.tmp_dir.name, "csv")
+        os.makedirs(output_dir)
+        for csv_path, file_path in zip(
+            CSV_FILES, results.export_csv(output_dir)
+        ):
+            pd.testing.assert_frame_equal(
+                pd.read_csv(csv_path, index_col=0),
+                pd.read_csv(file_path, index_col=0),
+            )
+            # original-results.csv ends with blank lines
+            if "original" not in csv_path:
+                self.assertTrue(
+                    filecmp.cmp(csv_path, file_path, shallow=False)
+                )
+
+        seats = results.seats_array("biprop")
+        self.assertFalse(seats.flags.writeable)
+        self.assertEqual(200, seats.sum())
+        self.assertIsNone(results["biprop"].district_divisors)
+        self.assertRaises(KeyError, results.seats, "unknown")
+
+    def test_divisors(self):
+        votes = pd.DataFrame(
+            {
+                "A": {"WK1": 14400, "WK2": 10100, "WK3": 6400},
+                "B": {"WK1": 12000, "WK2": 10000, "WK3": 6000},
+                "C": {"WK1": 4500, "WK2": 9900, "WK3": 5000},
+            }
+        )
+        engine = BiproportionalApportionment(
+            votes, {"WK1": 6, "WK2": 5, "WK3": 4}
+        )
+        result = BaziResult(
+            engine.run(), engine.district_divisors, engine.party_divisors
+        )
+        with ResultsWriter(self.file_path) as writer:
+            writer.add_result("biprop", result)
+            self.assertRaises(ValueError, writer.add, "biprop", result.seats)
+            self.assertRaises(
+                ValueError, writer.add, "overflow", result.seats * 100000
+            )
+            self.assertRaises(
+                ValueError, writer.add, "fraction", result.seats / 2
+            )
+            missing = result.seats.astype(float)
+            missing.iloc[0, 0] = float("nan")
+            self.assertRaises(ValueError, writer.add, "missing", missing)
+
+        loaded = ResultsFile(self.file_path)["biprop"]
+        pd.testing.assert_frame_equal(result.seats, loaded.seats)
+        pd.testing.assert_series_equal(
+            result.district_divisors, loaded.district_divisors
+        )
+        pd.testing.assert_series_equal(
+            result.party_divisors, loaded.party_divisors
+        )
+        pd.testing.assert_frame_equal(result.seats, read_results(loaded))
+
+    def test_incomplete(self):
+        writer = ResultsWriter(self.file_path)
+        writer.add("a", pd.DataFrame({"ZH": [1]}, index=["SP"]))
+        writer.f.flush()
+        self.assertRaises(ValueError, ResultsFile, self.file_path)
+        writer.close()
+        self.assertEqual(["a"], ResultsFile(self.file_path).names)
+
+    def test_close(self):
+        pack_csv(self.file_path, CSV_FILES[:1])
+        with ResultsFile(self.file_path) as results:
+            seats = results.seats("biprop")
+            self.assertIsNotNone(results._data)
+        self.assertTrue(results.closed)
+        self.assertIsNone(results._data)
+        self.assertRaises(ValueError, results.seats, "biprop")
+        # frames read before stay valid
+        self.assertEqual(200, seats.values.sum())